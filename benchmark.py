@@ -0,0 +1,415 @@
+"""
+        Benchmarks do simulador solar CVER.
+
+        Os benchmarks usam fixtures sintéticas geradas pela própria rotina (data base file, TMY de 8760
+        horas, série de vários anos, exportação horária do PVsyst e arquivos .PAN/.OND), de modo que os
+        resultados são reproduzíveis em qualquer máquina. Cada benchmark registra o menor tempo entre as
+        repetições e o pico de memória alocada (tracemalloc), gravados em JSON. Com um arquivo de
+        referência (--baseline), a rotina termina com erro caso algum benchmark piore além do limite
+        (--threshold). O arquivo de referência deve ser diferente do arquivo de saída.
+
+            python -m benchmark --output baseline.json
+            python -m benchmark --output current.json --baseline baseline.json --threshold 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+warnings.filterwarnings("ignore")
+
+# Os benchmarks medem o simulador a frio, sem os caches gravados em disco por outras execuções
+os.environ.pop('CVER_CACHE_DIR', None)
+
+import numpy as np
+import pandas as pd
+import tools
+
+
+# Colunas da exportação horária do PVsyst usadas na validação (ver MetricsComplete)
+PVSYST_COLUMNS = ['GlobHor', 'DiffHor', 'BeamHor', 'T_Amb', 'WindVel', 'HSol', 'AzSol', 'AngInc', 'PhiAng', 'BeamInc',
+                  'DifSInc', 'CircTrp', 'Alb_Inc', 'GlobInc', 'ShdLoss', 'GlobShd', 'GlobIAM', 'SlgLoss', 'GlobEff',
+                  'EArrNom', 'TArray', 'OhmLoss', 'MisLoss', 'EArrMPP', 'EOutInv', 'EArray', 'UArray', 'IArray',
+                  'EACOhmL', 'EMVTrfL', 'EMVOhmL', 'E_Grid']
+
+SITE = dict(site_name='SITE_A', pvsyst_file='SITE_A.CSV', solar_series_file='TMY.csv', pan_file='GEN-400M.PAN',
+            ond_file='GEN-2500.OND', LAT=-5.5, LON=-36.5, ALTITUDE=120, ALBEDO=0.2, MAX_ANGLE=55, D=5.5, L=2.0,
+            INVERTERS=2, MODULES_IN_SERIES=28, MODULES_IN_PARALLEL=620, PNOM_RATIO=1.39, U_c=29, U_v=0,
+            STC_OHM_LOSS=0.015, STC_OHM_LOSS_AC=0.01, MV_IRON_LOSS=0.001, MV_COPPER_LOSS=0.01, MV_LOSS_STC=0.005,
+            QUALITY_LOSS=-0.004, LID_LOSS=0.015, MISMATCH_LOSS=0.01, SOILING_LOSS=0.02, GHI_MIN_THRESHOLD=20,
+            FUSO=3, PMAX_OUT=0)
+
+
+def pan_file() -> str:
+
+    """
+            Conteúdo de um arquivo .PAN sintético (módulo monocristalino de 400 W, 72 células).
+    """
+
+    iam = [(0, 1), (30, 1), (50, 0.995), (60, 0.98), (70, 0.94), (75, 0.9), (80, 0.8), (85, 0.6), (90, 0)]
+
+    lines = ['PVObject_=pvModule', '  Version=7.2', '  Flags=$00900243', '',
+             '  PVObject_Commercial=pvCommercial', '    Comment=Synthetic module', '    Flags=$0041',
+             '    Manufacturer=Generic', '    Model=GEN-400M', '    DataSource=Synthetic', '    YearBeg=2020',
+             '    Width=1.038', '    Height=1.996', '    Depth=0.035', '    Weight=22.5', '    NPieces=100',
+             '  End of PVObject pvCommercial', '',
+             '  Technol=mtSiMono', '  NCelS=72', '  NCelP=1', '  NDiode=3', '  GRef=1000', '  TRef=25.0',
+             '  PNom=400.0', '  PNomTolUp=3.0', '  Isc=10.470', '  Voc=49.30', '  Imp=9.960', '  Vmp=40.20',
+             '  muISC=5.24', '  muVocSpec=-136.0', '  muPmpReq=-0.350', '  RShunt=600', '  Rp_0=2500',
+             '  Rp_Exp=5.50', '  RSerie=0.290', '  Gamma=0.970', '  muGamma=-0.0004', '  VMaxIEC=1500',
+             '  VMaxUL=1500', '  Absorb=0.90', '  RDiode=0.010', '  VRevDiode=-0.70', '  IMaxDiode=30.0',
+             '  AirMassRef=1.500', '  CellArea=243.4', '',
+             '  PVObject_IAM=pvIAM', '    Flags=$00', '    IAMMode=UserProfile', '    IAMProfile=TCubicProfile',
+             '      NPtsMax=9', '      NPtsEff=9', '      Mode=3']
+    lines += ['      Point_%d=%.1f,%.5f' % (point + 1, angle, factor) for point, (angle, factor) in enumerate(iam)]
+    lines += ['    End of TCubicProfile', '  End of PVObject pvIAM', 'End of PVObject pvModule', '']
+
+    return '\n'.join(lines)
+
+
+def ond_file() -> str:
+
+    """
+            Conteúdo de um arquivo .OND sintético (inversor central de 2500 kW, com as curvas de
+            eficiência nas tensões mínima, nominal e máxima).
+    """
+
+    def profile(name: str, loss: float) -> list:
+
+        power_fraction = [0.0, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.1]
+        efficiency = [0, 0.92, 0.96, 0.975, 0.983, 0.985, 0.987, 0.986, 0.984, 0.982]
+
+        lines = ['    %s=TCubicProfile' % name, '      NPtsMax=11', '      NPtsEff=10', '      Mode=1']
+        for point, (fraction, value) in enumerate(zip(power_fraction, efficiency)):
+            p_dc = fraction*2500*1000/0.985
+            lines.append('      Point_%d=%.1f,%.1f' % (point + 1, p_dc, p_dc*max(value - loss, 0)))
+        lines += ['      Point_11=0.0,0.0', '    End of TCubicProfile']
+
+        return lines
+
+    lines = ['PVObject_=pvGInverter', '  Comment=Synthetic central inverter', '  Version=7.2', '  Flags=$00381562', '',
+             '  PVObject_Commercial=pvCommercial', '    Comment=GEN 2500', '    Flags=$0041',
+             '    Manufacturer=Generic', '    Model=GEN-2500', '    DataSource=Synthetic',
+             '  End of PVObject pvCommercial', '', '  Transfo=Without', '',
+             '  Converter=TConverter', '    PNomConv=2500.000', '    PMaxOUT=2750.000', '    VOutConv=630.0',
+             '    VMppMin=915', '    VMPPMax=1300', '    VAbsMax=1500', '    PSeuil=12.50', '    EfficMax=98.70',
+             '    EfficEuro=98.50', '    ModeOper=MPPT', '    CompPMax=Lim', '    CompVMax=Lim', '    MonoTri=Tri',
+             '    PNomDC=2550.000', '    PMaxDC=2850.000', '    IMaxDC=3000.0', '    INomAC=2291.0',
+             '    IMaxAC=2520.0', '    TPNom=50.0', '    TPMax=25.0', '    TPLim1=55.0', '    TPLimAbs=60.0',
+             '    PLim1=2250.000', '    PLimAbs=0.000',
+             '    VNomEff=950.0,1100.0,1300.0,', '    EfficMaxV=98.60,98.70,98.40,',
+             '    EfficEuroV=98.40,98.50,98.20,']
+    lines += profile('ProfilPIO', 0.0)
+    lines += profile('ProfilPIOV1', 0.002)
+    lines += profile('ProfilPIOV2', 0.0)
+    lines += profile('ProfilPIOV3', 0.004)
+    lines += ['  End of TConverter', '  NbInputs=1', '  NbMPPT=1', 'End of PVObject pvGInverter', '']
+
+    return '\n'.join(lines)
+
+
+def synthetic_series(start: str, end: str, latitude: float, longitude: float, fuso: int,
+                     rng: object) -> object:
+
+    """
+            Com esta função é possível gerar uma série solar horária sintética (formato do hybridsim), com
+            irradiação de céu claro modulada por uma nebulosidade diária e horária.
+
+            -------------------
+            start, end : str - Recebem o início (inclusivo) e o fim (exclusivo) da série, no horário local.
+            latitude, longitude : float - Recebem as coordenadas do site.
+            fuso : int - Recebe o fuso horário do site.
+            rng : object - Recebe o gerador de números aleatórios (np.random.Generator).
+    """
+
+    import pvlib
+
+    times = pd.date_range(start, end, freq='H', inclusive='left')
+
+    # Posição do sol no centro de cada intervalo horário
+    center = (times + pd.Timedelta(hours=int(fuso), minutes=30)).tz_localize('UTC')
+    elevation = pvlib.solarposition.get_solarposition(center, latitude, longitude)['apparent_elevation'].values
+    clear_sky = np.clip(np.sin(np.radians(elevation)), 0, None)
+
+    days = (times.normalize() - times[0].normalize()).days.values
+    cloud = np.clip(rng.normal(0.8, 0.15, days[-1] + 1)[days] + rng.normal(0, 0.1, len(times)), 0.15, 1.05)
+
+    ghi = np.round(1050*clear_sky**1.15*cloud, 1)
+    dif = np.round(ghi*np.clip(1.1 - cloud, 0.1, 0.9), 1)
+    temp = np.round(26 + 5*np.sin((times.hour.values - 9)/24*2*np.pi) + rng.normal(0, 1, len(times)), 2)
+    ws = np.round(np.abs(rng.normal(4, 1.5, len(times))), 2)
+
+    return pd.DataFrame({'time': times.strftime('%d/%m/%Y %H:%M'), 'GHI': ghi, 'DIF': dif, 'TEMP': temp, 'WS': ws})
+
+
+def pvsyst_export(output: object, file: str, rng: object) -> None:
+
+    """
+            Com esta função é possível gravar uma exportação horária do PVsyst sintética a partir da saída
+            do simulador, com ruído de 1% e as convenções do PVsyst (azimute, sinal do PhiAng e parcela
+            circunsolar separada da difusa).
+    """
+
+    data = {}
+    for column in PVSYST_COLUMNS:
+        if column == 'CircTrp':
+            data[column] = 0.1*output['DifSInc'].values
+        elif column == 'DifSInc':
+            data[column] = 0.9*output['DifSInc'].values
+        elif column == 'AzSol':
+            data[column] = np.where(output['AzSol'] > 180, 360 - output['AzSol'], -output['AzSol'])
+        elif column == 'PhiAng':
+            data[column] = -output['PhiAng'].values
+        else:
+            data[column] = output[column].values*(1 + rng.normal(0, 0.01, len(output)))
+
+    data = pd.DataFrame(data)
+    data.insert(0, 'date', output['date'].dt.strftime('%d/%m/%y %H:%M').values)
+
+    header = ['PVSYST V7.2.16', '', 'Simulation variant : synthetic', '', 'File created 01/01/22', '',
+              'Hourly values', '', '', '', 'date;' + ';'.join(PVSYST_COLUMNS), ';' + ';'.join(['W/m²']*len(PVSYST_COLUMNS))]
+
+    with open(file, mode='w', encoding='ISO-8859-1') as handle:
+        handle.write('\n'.join(header) + '\n')
+    data.to_csv(file, sep=';', index=False, header=False, mode='a', float_format='%.3f', encoding='ISO-8859-1')
+
+
+def generate_fixtures(path: str, years: int = 10, seed: int = 0) -> None:
+
+    """
+            Com esta função é possível gerar as fixtures dos benchmarks na estrutura de pastas do projeto:
+            cver/DataBase.xlsx com os sites SITE_A (TMY e exportação do PVsyst), SITE_B (TMY, outro pitch)
+            e SITE_LONG (série de vários anos), os arquivos .PAN/.OND, ts/TMY.csv e ts/MULTI_YEAR.csv.
+
+            -------------------
+            path : str - Recebe o endereço da pasta raíz das fixtures (terminado em '/').
+            years : int - Recebe o número de anos da série longa.
+            seed : int - Recebe a semente do gerador de números aleatórios.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    for folder in ['cver/module', 'cver/inverter', 'cver/simulation_CVER', 'cver/simulation_PVSyst', 'ts']:
+        os.makedirs(path + folder, exist_ok=True)
+
+    with open(path + 'cver/module/' + SITE['pan_file'], mode='w', encoding='utf-8-sig') as handle:
+        handle.write(pan_file())
+    with open(path + 'cver/inverter/' + SITE['ond_file'], mode='w', encoding='utf-8-sig') as handle:
+        handle.write(ond_file())
+
+    synthetic_series('2019-01-01', '2020-01-01', SITE['LAT'], SITE['LON'], SITE['FUSO'],
+                     rng).to_csv(path + 'ts/TMY.csv', index=False)
+    synthetic_series('2001-01-01', '%d-01-01' % (2001 + years), SITE['LAT'], SITE['LON'], SITE['FUSO'],
+                     rng).to_csv(path + 'ts/MULTI_YEAR.csv', index=False)
+
+    sites = [SITE,
+             dict(SITE, site_name='SITE_B', pvsyst_file=np.nan, D=6.0, MODULES_IN_PARALLEL=520, PNOM_RATIO=1.16),
+             dict(SITE, site_name='SITE_LONG', pvsyst_file=np.nan, solar_series_file='MULTI_YEAR.csv')]
+    pd.DataFrame(sites).to_excel(path + 'cver/DataBase.xlsx', index=False)
+
+    with open(path + 'cver/simulation_metrics.csv', mode='w') as handle:
+        handle.write('Site\n')
+
+    # A exportação do PVsyst é derivada da simulação do próprio site
+    location = tools.DataLocations(path=path, site_name='SITE_A')
+    output = tools.Simulation(location, tools.PVModulo(location.PAN_FILE),
+                              tools.Inverter(location.OND_FILE)).simulation_output
+    pvsyst_export(output, location.PVSYST_FILE, rng)
+    clear_caches()
+
+
+def clear_caches() -> None:
+
+    """
+            Esvazia os caches do simulador, de modo que cada repetição é executada a frio.
+    """
+
+    for cache in [tools.PARSE_CACHE, tools.GEOMETRY_CACHE, tools.SERIES_CACHE, tools.PVSYST_HOURLY_CACHE,
+                  tools.STAGE_CACHE]:
+        cache.clear()
+
+
+def measure(function: object, setup: object = clear_caches, repeat: int = 3) -> dict:
+
+    """
+            Com esta função é possível medir o menor tempo [s] de function entre as repetições e o pico
+            de memória alocada [bytes], medido numa execução separada com o tracemalloc.
+    """
+
+    times = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    setup()
+    tracemalloc.start()
+    function()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'time': min(times), 'peak_memory': peak_memory}
+
+
+def stage_benchmarks(location: object, modulo: object, inversor: object, repeat: int = 3) -> dict:
+
+    """
+            Com esta função é possível medir cada etapa da simulação (ver SIMULATION_STAGES), executando
+            todas as etapas a frio e registrando o tempo e o pico de memória de cada uma.
+    """
+
+    times = {stage.name: [] for stage in tools.SIMULATION_STAGES}
+    peak_memory = {}
+
+    def timed(stage: object) -> object:
+
+        def compute(*arguments):
+
+            tracing = tracemalloc.is_tracing()
+            if tracing:
+                tracemalloc.reset_peak()
+                current = tracemalloc.get_traced_memory()[0]
+
+            start = time.perf_counter()
+            result = stage.compute(*arguments)
+            elapsed = time.perf_counter() - start
+
+            if tracing:
+                peak_memory[stage.name] = tracemalloc.get_traced_memory()[1] - current
+            else:
+                times[stage.name].append(elapsed)
+
+            return result
+
+        return tools.Stage(stage.name, compute, stage.inputs, stage.parameters, stage.files, stage.modulo,
+                           stage.inversor, stage.options)
+
+    stages = [timed(stage) for stage in tools.SIMULATION_STAGES]
+    run = lambda: tools.run_stages(location, modulo, inversor, stages=stages, cache=tools.ArrayCache())
+    measure(run, repeat=repeat)
+
+    return {'stage.' + name: {'time': min(times[name]), 'peak_memory': peak_memory[name]} for name in times}
+
+
+def run_benchmarks(path: str, repeat: int = 3) -> dict:
+
+    """
+            Com esta função é possível executar todos os benchmarks sobre as fixtures de path (ver
+            generate_fixtures).
+
+            Retorna o dicionário benchmark -> {'time': [s], 'peak_memory': [bytes]}.
+    """
+
+    locations = tools.Locations(path=path)
+    location = locations.get_location('SITE_A')
+    long_location = locations.get_location('SITE_LONG')
+    modulo = tools.PVModulo(location.PAN_FILE)
+    inversor = tools.Inverter(location.OND_FILE)
+    output = tools.Simulation(location, modulo, inversor).simulation_output
+
+    results = stage_benchmarks(location, modulo, inversor, repeat)
+    results['Simulation'] = measure(lambda: tools.Simulation(location, modulo, inversor), repeat=repeat)
+    results['Simulation.warm'] = measure(lambda: tools.Simulation(location, modulo, inversor),
+                                         setup=lambda: tools.Simulation(location, modulo, inversor), repeat=repeat)
+    results['Simulation.multi_year'] = measure(lambda: tools.Simulation(long_location, modulo, inversor),
+                                               repeat=repeat)
+    results['MetricsComplete'] = measure(lambda: tools.MetricsComplete(location, output), repeat=repeat)
+    # create_csv altera o dataframe recebido, de modo que cada repetição recebe uma cópia
+    copies = []
+    results['create_csv'] = measure(lambda: tools.create_csv(location, copies.pop(), path),
+                                    setup=lambda: copies.append(output.copy()), repeat=repeat)
+    results['simulation'] = measure(lambda: tools.simulation(path, 'SITE_A', pvsyst_validation=True),
+                                    repeat=repeat)
+
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_time: float = 0.005) -> list:
+
+    """
+            Com esta função é possível comparar os resultados com os de referência.
+
+            -------------------
+            results, baseline : dict - Recebem os resultados atuais e os de referência (ver run_benchmarks).
+            threshold : float - Recebe o aumento relativo máximo do tempo e do pico de memória.
+            min_time : float - Recebe o aumento absoluto mínimo do tempo [s] considerado, de modo que
+            as flutuações dos benchmarks muito rápidos não sejam consideradas regressões.
+
+            Retorna a lista das regressões encontradas.
+    """
+
+    regressions = []
+
+    for name, reference in baseline.items():
+        if name not in results:
+            continue
+        current = results[name]
+        if current['time'] > reference['time']*(1 + threshold) and current['time'] - reference['time'] > min_time:
+            regressions.append('%s: tempo %.4f s (referência %.4f s)' % (name, current['time'], reference['time']))
+        if current['peak_memory'] > reference['peak_memory']*(1 + threshold):
+            regressions.append('%s: pico de memória %.1f MB (referência %.1f MB)' %
+                               (name, current['peak_memory']/2**20, reference['peak_memory']/2**20))
+
+    return regressions
+
+
+def environment() -> dict:
+
+    import pvlib
+
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'pvlib': pvlib.__version__, 'version': tools.version}
+
+
+def main(arguments: list = None) -> int:
+
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description='Benchmarks do simulador solar CVER.')
+    parser.add_argument('--output', default='benchmark.json', help='arquivo JSON dos resultados')
+    parser.add_argument('--baseline', default=None, help='arquivo JSON de referência (resultados anteriores)')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='aumento relativo máximo do tempo e da memória (padrão: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='número de repetições (padrão: %(default)s)')
+    parser.add_argument('--years', type=int, default=10, help='anos da série longa (padrão: %(default)s)')
+    parser.add_argument('--fixtures', default=None,
+                        help='pasta das fixtures (por padrão, uma pasta temporária gerada a cada execução)')
+    options = parser.parse_args(arguments)
+
+    # A referência é lida antes da execução, para que nunca seja comparada com os próprios resultados
+    baseline = None
+    if options.baseline is not None:
+        if os.path.abspath(options.baseline) == os.path.abspath(options.output):
+            parser.error('--baseline e --output devem ser arquivos diferentes')
+        with open(options.baseline) as handle:
+            baseline = json.load(handle)['benchmarks']
+
+    with tempfile.TemporaryDirectory() as temporary:
+        path = (temporary if options.fixtures is None else options.fixtures).rstrip('/\\') + '/'
+        if not os.path.exists(path + 'cver/DataBase.xlsx'):
+            generate_fixtures(path, years=options.years)
+        results = run_benchmarks(path, repeat=options.repeat)
+
+    with open(options.output, mode='w') as handle:
+        json.dump({'environment': environment(), 'benchmarks': results}, handle, indent=2)
+
+    for name, result in results.items():
+        print('%-28s %9.4f s %9.1f MB' % (name, result['time'], result['peak_memory']/2**20))
+
+    if baseline is not None:
+        regressions = compare(results, baseline, options.threshold)
+        for regression in regressions:
+            print('Regressão:', regression, file=sys.stderr)
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
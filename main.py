@@ -1,15 +1,116 @@
-from tools import simulation, Locations
+import argparse
+import logging
+import sys
+import time
 import warnings
 warnings.filterwarnings("ignore")
 
+# A configuração do logging fica no ponto de entrada (e não nas classes do tools), de modo que os
+# processos do lote, que importam este módulo, também a recebem
+logging.basicConfig(level=logging.INFO)
 
-path = './Rio do Vento/SRA/!Energia/20220713 Safira/2. SRDV/solar/'
+start = time.perf_counter()
 
-locations = Locations(path = path)
+# Tempo máximo [s] de inicialização (importação do tools e leitura do data base file)
+STARTUP_BUDGET = 1.0
 
 
-for location in locations.SITE_NAME: 
-      
-      simulation(path = path, site_name = location, pvsyst_validation = True)
+def parse_arguments(arguments: list = None) -> object:
 
-      
\ No newline at end of file
+    """
+            Com esta função é possível interpretar os argumentos da linha de comando. Os módulos
+            pesados (pandas, pvlib, scipy) não são importados aqui, de modo que o --help é imediato.
+    """
+
+    parser = argparse.ArgumentParser(prog='python -m main',
+                                     description='Simulador solar CVER: simula os sites do data base file.')
+    parser.add_argument('path', help='pasta raíz onde estão armazenados os arquivos do solar do projeto')
+    parser.add_argument('--sites', nargs='+', default=None,
+                        help='site_names a serem simulados (por padrão, todos os sites do data base file)')
+    parser.add_argument('--database-file', default=None,
+                        help='data base file (.xlsx, .csv ou .parquet), por padrão cver/DataBase.xlsx')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='número de processos do pool (por padrão, todas as CPUs da máquina)')
+    parser.add_argument('--no-validation', action='store_true',
+                        help='não calcula as métricas de comparação com o PVsyst')
+    parser.add_argument('--single-diode-method', default='lambertw', choices=['lambertw', 'newton', 'analytic'],
+                        help='método de solução do modelo de um diodo')
+    parser.add_argument('--inverter-efficiency', default='vnom', choices=['vnom', 'voltage'],
+                        help='modelo de eficiência do inversor: curva na tensão nominal ou tabela potência x tensão '
+                             'das curvas Vmin/Vnom/Vmax do .OND')
+    parser.add_argument('--output-format', default='csv', choices=['csv', 'hdf5'], help='formato da saída')
+    parser.add_argument('--float32', action='store_true',
+                        help='armazena a saída de cada site em float32 (e grava o arquivo .h5 em float32)')
+    parser.add_argument('--output-profile', default='full', choices=['minimal', 'loss-chain', 'full'],
+                        help='colunas da saída de cada site (ver OUTPUT_PROFILES)')
+    parser.add_argument('--instrument', action='store_true',
+                        help='registra o tempo e a memória de cada etapa de cada site em '
+                             'cver/simulation_CVER/instrumentation.json')
+    parser.add_argument('--profile-section', default=None,
+                        help='etapa executada sob o cProfile (ex.: array), gravado em '
+                             'cver/simulation_CVER/<site>_<etapa>.prof (requer --instrument)')
+    parser.add_argument('--serve', action='store_true',
+                        help='mantém os sites em memória e atende consultas JSON pela entrada padrão '
+                             '(ou por HTTP local com --port), ver SimulationServer')
+    parser.add_argument('--port', type=int, default=None, help='porta HTTP local do servidor (127.0.0.1)')
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET,
+                        help='tempo máximo de inicialização [s] (padrão: %(default)s)')
+
+    return parser.parse_args(arguments)
+
+
+def main(arguments: list = None) -> object:
+
+    """
+            Com esta função é possível simular os sites indicados na linha de comando (ver
+            simulation_batch). O tempo de inicialização (importação do tools e leitura do data base
+            file) é informado e comparado ao orçamento --startup-budget.
+    """
+
+    options = parse_arguments(arguments)
+
+    import_start = time.perf_counter()
+    from tools import simulation_batch, Locations, SimulationServer, serve_stdin, serve_http
+    import_time = time.perf_counter() - import_start
+
+    if options.serve:
+        server = SimulationServer(path = options.path, database_file = options.database_file,
+                                  single_diode_method = options.single_diode_method)
+        locations = server.locations
+    else:
+        locations = Locations(path = options.path, database_file = options.database_file)
+    startup_time = time.perf_counter() - start
+
+    print('Inicialização: %.2f s (importação %.2f s, orçamento %.2f s)' % (startup_time, import_time,
+                                                                          options.startup_budget), file=sys.stderr)
+    if startup_time > options.startup_budget:
+        print('Aviso: inicialização acima do orçamento de %.2f s' % options.startup_budget, file=sys.stderr)
+
+    if options.serve:
+        # Os sites informados são simulados uma vez, deixando as etapas em memória para as consultas
+        for site_name in options.sites or []:
+            server.query({'site': site_name})
+        print('Servidor pronto', file=sys.stderr)
+
+        if options.port is None:
+            serve_stdin(server)
+        else:
+            serve_http(server, port = options.port)
+        return None
+
+    status = simulation_batch(path = options.path, site_names = options.sites,
+                              pvsyst_validation = not options.no_validation, processes = options.processes,
+                              locations = locations, single_diode_method = options.single_diode_method,
+                              output_format = options.output_format, float32 = options.float32,
+                              output_profile = options.output_profile,
+                              inverter_efficiency_model = options.inverter_efficiency,
+                              instrument = options.instrument, profile_section = options.profile_section)
+
+    print(status)
+
+    return status
+
+
+if __name__ == '__main__':
+
+      main()
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+import tools
+
+
+@pytest.fixture(scope='session')
+def fixtures(tmp_path_factory) -> str:
+
+    """
+            Pasta com as fixtures sintéticas dos benchmarks (ver benchmark.generate_fixtures): sites
+            SITE_A, SITE_B e SITE_LONG, arquivos .PAN/.OND, TMY e série de dois anos.
+    """
+
+    path = str(tmp_path_factory.mktemp('solar')) + '/'
+    benchmark.generate_fixtures(path, years=2)
+
+    return path
+
+
+@pytest.fixture
+def site(fixtures) -> tuple:
+
+    """
+            Parâmetros, módulo e inversor do SITE_A, com os caches do simulador vazios.
+    """
+
+    benchmark.clear_caches()
+    location = tools.DataLocations(path=fixtures, site_name='SITE_A')
+
+    return location, tools.PVModulo(path=location.PAN_FILE), tools.Inverter(path=location.OND_FILE)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+import tools
+
+
+def test_inverter_efficiency_non_finite(site):
+
+    _, _, inversor = site
+    grid = inversor.efficiency_grid()
+
+    power = np.array([np.nan, 1e5, np.inf, 2e5])
+    voltage = np.array([900, np.nan, 900, 1000])
+    efficiency = tools.inverter_efficiency(grid, power, voltage)
+
+    assert np.isnan(efficiency[:3]).all()
+    assert efficiency[3] == tools.inverter_efficiency(grid, power[3:], voltage[3:])[0]
+
+
+def test_inverter_curves_not_shared_with_cache(site):
+
+    location, _, inversor = site
+    curves = {input_voltage: curve.copy() for input_voltage, curve in inversor.curves.items()}
+
+    # A primeira instância do arquivo (cache vazio) é alterada, sem efeito sobre as seguintes
+    for curve in inversor.curves.values():
+        curve[:, 2] *= 0.5
+    again = tools.Inverter(path=location.OND_FILE)
+
+    for input_voltage, curve in curves.items():
+        np.testing.assert_array_equal(again.curves[input_voltage], curve)
+
+    grid = again.efficiency_grid()
+    with pytest.raises(ValueError):
+        grid['eff'][0, 0] = 0
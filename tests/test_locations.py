@@ -0,0 +1,14 @@
+import pytest
+
+import tools
+
+
+def test_unknown_site_name(fixtures):
+
+    locations = tools.Locations(path=fixtures)
+
+    assert locations.get_location('SITE_B').SITE_NAME == 'SITE_B'
+    with pytest.raises(KeyError, match='SITE_X'):
+        locations.get_location('SITE_X')
+    with pytest.raises(KeyError, match='SITE_X'):
+        locations.get_blocks('SITE_X')
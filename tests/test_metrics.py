@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import tools
+
+
+linear_model = pytest.importorskip('sklearn.linear_model')
+metrics = pytest.importorskip('sklearn.metrics')
+
+GHI_MIN_THRESHOLD = 10
+
+
+def r2_calculation(simulated, reference, ghi):
+
+    # Versão anterior, com a regressão do scikit-learn
+    data = pd.DataFrame({'pvlib': simulated, 'pvsyst': reference, 'ghi': ghi})
+    data = data[data['ghi'] > GHI_MIN_THRESHOLD].dropna()
+
+    model = linear_model.LinearRegression().fit(data[['pvlib']], data['pvsyst'])
+
+    return model.score(data[['pvlib']], data['pvsyst'])
+
+
+def rsme_calculation(simulated, reference, ghi):
+
+    data = pd.DataFrame({'pvlib': simulated, 'pvsyst': reference, 'ghi': ghi})
+    data = data[data['ghi'] > GHI_MIN_THRESHOLD].dropna()
+
+    return np.sqrt(metrics.mean_squared_error(data['pvlib'], data['pvsyst']))/data['pvlib'].mean()*100
+
+
+def diff_ratio(simulated, reference, ghi):
+
+    data = pd.DataFrame({'pvlib': simulated, 'pvsyst': reference, 'ghi': ghi})
+    data = data[data['ghi'] > GHI_MIN_THRESHOLD].dropna()
+
+    return (data['pvlib'].sum() - data['pvsyst'].sum())/data['pvsyst'].sum()*100
+
+
+def random_series(hours: int = 2000, parameters: int = 4, seed: int = 0) -> tuple:
+
+    rng = np.random.default_rng(seed)
+
+    ghi = np.where(rng.random(hours) < 0.4, 0, rng.uniform(0, 1000, hours))
+    ghi[rng.random(hours) < 0.02] = np.nan
+
+    simulated = rng.uniform(0, 1000, (hours, parameters))*(1 + np.arange(parameters))
+    reference = 0.9*simulated + rng.normal(0, 50, (hours, parameters))
+    simulated[rng.random((hours, parameters)) < 0.05] = np.nan
+    reference[rng.random((hours, parameters)) < 0.05] = np.nan
+
+    return simulated, reference, ghi
+
+
+def assert_baseline(result: dict, simulated, reference, ghi, group: int = 0):
+
+    for parameter in range(simulated.shape[1]):
+        x, y = simulated[:, parameter], reference[:, parameter]
+        np.testing.assert_allclose(result['r2'][group, parameter], r2_calculation(x, y, ghi), rtol=1e-9)
+        np.testing.assert_allclose(result['RMSE'][group, parameter], rsme_calculation(x, y, ghi), rtol=1e-9)
+        np.testing.assert_allclose(result['diff_per_cent_signal'][group, parameter], diff_ratio(x, y, ghi),
+                                   rtol=1e-9)
+
+
+def test_validation_metrics_equal_baseline():
+
+    simulated, reference, ghi = random_series()
+    valid = ghi > GHI_MIN_THRESHOLD
+
+    assert_baseline(tools.validation_metrics(simulated, reference, valid), simulated, reference, ghi)
+
+
+def test_validation_metrics_groups_equal_baseline():
+
+    simulated, reference, ghi = random_series(seed=1)
+    valid = ghi > GHI_MIN_THRESHOLD
+    groups = np.arange(len(ghi)) % 3
+
+    result = tools.validation_metrics(simulated, reference, valid, groups=groups, n_groups=3)
+
+    for group in range(3):
+        hours = groups == group
+        assert_baseline(result, simulated[hours], reference[hours], ghi[hours], group=group)
+
+
+def test_validation_metrics_zero_variance():
+
+    simulated, reference, ghi = random_series(parameters=2, seed=2)
+    valid = ghi > GHI_MIN_THRESHOLD
+
+    # PVsyst constante: a regressão é exata. Simulador constante: a regressão não explica nada
+    reference[:, 0] = 500
+    simulated[:, 1] = 500
+
+    result = tools.validation_metrics(simulated, reference, valid)
+
+    assert result['r2'][0, 0] == r2_calculation(simulated[:, 0], reference[:, 0], ghi) == 1
+    assert result['r2'][0, 1] == r2_calculation(simulated[:, 1], reference[:, 1], ghi) == 0
+    assert_baseline(result, simulated, reference, ghi)
+
+
+def test_validation_metrics_empty_group():
+
+    simulated, reference, ghi = random_series(parameters=1, seed=3)
+
+    result = tools.validation_metrics(simulated, reference, np.zeros(len(ghi), dtype=bool))
+
+    assert np.isnan(result['r2']).all() and np.isnan(result['RMSE']).all()
+    assert np.isnan(result['diff_per_cent_signal']).all()
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+from scipy import interpolate
+
+import tools
+
+
+@pytest.fixture
+def full_series(site) -> dict:
+
+    """
+            Etapas da simulação calculadas em todas as horas da série, sem a seleção das horas com
+            irradiação (etapa 'daylight').
+    """
+
+    location, modulo, inversor = site
+    stages, _ = tools.run_stages(location, modulo, inversor, stages=tools.SIMULATION_STAGES[:6],
+                                 cache=tools.transient_stage_cache())
+
+    with np.errstate(all='ignore'):
+        stages['transposition'] = tools.transposition_stage(stages['meteo'], stages['sun'], stages['atmosphere'],
+                                                            stages['tracker'], location)
+        stages['incidence'] = tools.incidence_stage(stages['meteo'], stages['sun'], stages['tracker'],
+                                                    stages['transposition'], modulo, location)
+        stages['module'] = tools.module_stage(stages['meteo'], stages['incidence'], modulo, location)
+        stages['array'] = tools.array_stage(stages['meteo'], stages['incidence'], modulo, location,
+                                            module=stages['module'])
+        stages['inverter'] = tools.inverter_stage(stages['meteo'], stages['incidence'], stages['array'],
+                                                  inversor, location)
+        stages['ac_losses'] = tools.ac_losses_stage(stages['inverter'], modulo, inversor, location)
+
+    return stages
+
+
+def test_daylight_subset_equals_full_series(site, full_series):
+
+    location, modulo, inversor = site
+    output = tools.Simulation(location, modulo, inversor).simulation_output
+
+    results = {}
+    for name in ['sun', 'tracker', 'meteo', 'transposition', 'incidence', 'array', 'inverter', 'ac_losses']:
+        results.update(full_series[name])
+
+    night = np.ones(len(output), dtype=bool)
+    night[full_series['daylight']['index']] = False
+    assert night.any() and not night.all()
+
+    for column in tools.OUTPUT_COLUMNS:
+        np.testing.assert_array_equal(output[column].values, results[column], err_msg=column)
+
+    # Sem irradiação, as etapas calculadas apenas nas horas com irradiação são nulas, exceto TArray = T_Amb
+    for name in ['transposition', 'incidence', 'inverter']:
+        for column, value in full_series[name].items():
+            if column in output:
+                assert (output[column].values[night] == 0).all(), column
+    np.testing.assert_array_equal(output['TArray'].values[night], output['T_Amb'].values[night])
+
+
+def test_masked_operations_equal_row_loops(site, full_series):
+
+    location, modulo, inversor = site
+    meteo, incidence, module = full_series['meteo'], full_series['incidence'], full_series['module']
+    array, inverter = full_series['array'], full_series['inverter']
+
+    # Laços por linha da versão anterior da simulação
+    rows = range(len(meteo['T_Amb']))
+    GlobEff, T_Amb = incidence['GlobEff'], meteo['T_Amb']
+
+    i_mp = module['i_mp']*location.MODULES_IN_PARALLEL
+    p_mp = module['p_mp']*location.MODULES_IN_SERIES*location.MODULES_IN_PARALLEL
+    R_equiv_dc = float(array['R_equiv_dc'])
+
+    # Como na versão anterior, cada grandeza é calculada em todas as horas e então corrigida linha a linha
+    OhmLoss = R_equiv_dc*(i_mp**2)
+    OhmLoss = np.array([0 if GlobEff[i] == 0 else OhmLoss[i] for i in rows], dtype=float)
+    MisLoss = p_mp*location.MISMATCH_LOSS
+    MisLoss = np.array([0 if GlobEff[i] == 0 else MisLoss[i] for i in rows], dtype=float)
+    EArrMPP = p_mp - OhmLoss - MisLoss
+    EArrMPP = np.array([0 if GlobEff[i] == 0 else EArrMPP[i] for i in rows], dtype=float)
+
+    np.testing.assert_array_equal(array['OhmLoss'], OhmLoss)
+    np.testing.assert_array_equal(array['MisLoss'], MisLoss)
+    np.testing.assert_array_equal(array['EArrMPP'], EArrMPP)
+
+    curve = inversor.curves['Vnom']
+    eff = interpolate.interp1d(curve[:, 0], curve[:, 2], fill_value='extrapolate')
+    eff_inverter = np.array([max(0, x) for x in eff(EArrMPP/location.INVERTERS)], dtype=float)
+
+    PMaxOUT = (inversor.parameters['PMaxOUT'] if location.PMAX_OUT == 0 else location.PMAX_OUT)*1000*location.INVERTERS
+    a = (inversor.parameters['PMaxOUT'] - inversor.parameters['PNomConv'])/\
+        (inversor.parameters['TPMax'] - inversor.parameters['TPNom'])
+    b = (inversor.parameters['PMaxOUT'] - inversor.parameters['TPMax']*a)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        PMaxIN = PMaxOUT/eff_inverter
+        PMaxIN = np.array([PMaxIN[i]
+                           if (T_Amb[i] <= inversor.parameters['TPMax']) | (GlobEff[i] < location.GHI_MIN_THRESHOLD)
+                           else ((((a*T_Amb[i]) + b)/eff_inverter[i])*1000*location.INVERTERS)
+                           for i in rows], dtype=float)
+    EArray = np.array([EArrMPP[i] if PMaxIN[i] > EArrMPP[i] else PMaxIN[i] for i in rows], dtype=float)
+
+    derated = (T_Amb > inversor.parameters['TPMax']) & (GlobEff >= location.GHI_MIN_THRESHOLD)
+    assert derated.any() and not derated[GlobEff > 0].all()
+    assert (EArrMPP > PMaxIN).any()
+
+    np.testing.assert_array_equal(inverter['eff_inverter'], eff_inverter)
+    np.testing.assert_array_equal(inverter['PMaxIN'], PMaxIN)
+    np.testing.assert_array_equal(inverter['EArray'], EArray)
+
+    # Tensão de operação fora do clipping
+    with np.errstate(divide='ignore', invalid='ignore'):
+        FOhmLoss = OhmLoss/p_mp
+    v_mp = module['v_mp']*location.MODULES_IN_SERIES
+    UArray = np.array([0 if GlobEff[i] == 0 else v_mp[i]*(1 - location.MISMATCH_LOSS - FOhmLoss[i]) for i in rows],
+                      dtype=float)
+
+    unclipped = ~(EArrMPP > PMaxIN)
+    np.testing.assert_array_equal(inverter['UArray'][unclipped], UArray[unclipped])
+
+
+def test_elevation_correction_equals_row_function():
+
+    def correction(apparent_elevation_pvlib):
+        if apparent_elevation_pvlib >= 7:
+            return apparent_elevation_pvlib
+        elif -7 < apparent_elevation_pvlib and apparent_elevation_pvlib < 7:
+            return 0.5*apparent_elevation_pvlib + 3.5
+        else:
+            return 0
+
+    elevation = np.concatenate([np.linspace(-90, 90, 3601), [-7, 7, np.nextafter(7, 0), np.nan]])
+
+    np.testing.assert_array_equal(tools.pvlib_elevation_correction(elevation),
+                                  np.array([correction(x) for x in elevation], dtype=float))
@@ -0,0 +1,79 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import tools
+
+
+def read_stream(file: str) -> object:
+
+    return pd.read_csv(file, sep=';', float_precision='round_trip')
+
+
+def numeric_columns(output: object) -> list:
+
+    return [column for column in tools.OUTPUT_COLUMNS if column in output.columns]
+
+
+@pytest.mark.parametrize('method', ['newton', 'analytic'])
+def test_stream_equals_simulation(site, tmp_path, method):
+
+    location, modulo, inversor = site
+    output_file = str(tmp_path / 'stream.csv')
+
+    summary = tools.simulation_stream(location, modulo, inversor, output_file, chunk_size=1000,
+                                      single_diode_method=method)
+    stream = read_stream(output_file)
+    simulation = tools.Simulation(location, modulo, inversor, single_diode_method=method).simulation_output
+
+    assert summary['chunks'] == 9
+    assert summary['rows'] == len(simulation) == len(stream)
+    for column in numeric_columns(stream):
+        np.testing.assert_array_equal(stream[column].values, simulation[column].values, err_msg=column)
+    np.testing.assert_allclose(summary['sums']['E_Grid'], simulation['E_Grid'].sum(), rtol=1e-12)
+
+
+def test_stream_default_method_matches_simulation(site, tmp_path):
+
+    location, modulo, inversor = site
+    output_file = str(tmp_path / 'stream.csv')
+
+    tools.simulation_stream(location, modulo, inversor, output_file, chunk_size=1000)
+    stream = read_stream(output_file)
+    simulation = tools.Simulation(location, modulo, inversor).simulation_output
+
+    for column in numeric_columns(stream):
+        np.testing.assert_allclose(stream[column].values, simulation[column].values, rtol=1e-9, atol=1e-6,
+                                   err_msg=column)
+
+
+def test_stream_sub_hourly(site, tmp_path):
+
+    location, modulo, inversor = site
+
+    # Série de 15 minutos: cada registro horário repetido nos quatro quartos de hora
+    hourly = pd.read_csv(location.SOLAR_SERIES_FILE).iloc[:24*30]
+    times = pd.to_datetime(hourly['time'], format='%d/%m/%Y %H:%M')
+    quarter = hourly.loc[hourly.index.repeat(4)].reset_index(drop=True)
+    quarter['time'] = (times.loc[times.index.repeat(4)].reset_index(drop=True) +
+                       pd.to_timedelta(np.tile([0, 15, 30, 45], len(hourly)), unit='min')).dt.strftime('%d/%m/%Y %H:%M')
+    series_file = str(tmp_path / 'quarter.csv')
+    quarter.to_csv(series_file, index=False)
+
+    location = copy.copy(location)
+    location.SOLAR_SERIES_FILE = series_file
+
+    prepared = tools.read_solar_series(location)
+    assert ((prepared.index - pd.DatetimeIndex(prepared['date'])) == pd.Timedelta(minutes=7.5)).all()
+
+    output_file = str(tmp_path / 'stream.csv')
+    summary = tools.simulation_stream(location, modulo, inversor, output_file, chunk_size=1001,
+                                      single_diode_method='newton')
+    simulation = tools.Simulation(location, modulo, inversor, single_diode_method='newton').simulation_output
+    stream = read_stream(output_file)
+
+    for column in numeric_columns(stream):
+        np.testing.assert_array_equal(stream[column].values, simulation[column].values, err_msg=column)
+    np.testing.assert_allclose(summary['sums']['E_Grid'], simulation['E_Grid'].sum()*0.25, rtol=1e-12)
@@ -1,36 +1,136 @@
-import re
 import pandas as pd
 import datetime
-import pvlib
-from pvlib.tools import cosd, sind
 import numpy as np
 import math
 import logging
+import os
+import hashlib
+import pickle
+import time
+import contextlib
+from collections import OrderedDict
 
 version = 'CVER 1.0.0'
 
+def read_database(database_file: str) -> object:
+
+    """
+            Com esta função é possível realizar a leitura do arquivo que contém os parâmetros
+            de base da simulação. São aceitos o arquivo .xlsx original ou uma exportação da mesma
+            planilha nos formatos .csv ou .parquet, cuja leitura é bem mais rápida.
+
+            -------------------
+            database_file : str - Recebe o endereço do data base file.
+    """
+
+    extension = database_file.rsplit('.', 1)[-1].lower()
+
+    if extension == 'parquet':
+        return pd.read_parquet(database_file)
+
+    elif extension == 'csv':
+        with open(database_file, mode='r', encoding='utf-8-sig') as file:
+            sep = ';' if ';' in file.readline() else ','
+        return pd.read_csv(database_file, sep=sep, encoding='utf-8-sig')
+
+    else:
+        return pd.read_excel(database_file)
+
+
 class Locations:
     
-    def __init__(self, path: str) -> list:
+    def __init__(self, path: str, database_file: str = None) -> list:
         
         """
                 Com esta função é possível realizar a leitura dos site_names disponíveis no arquivo 
                 que contém os parâmetros de base da simulação. 
-                O arquivo de base deve ser do formato .xlsx e possuir a coluna: 'site_name'  
+                O arquivo de base deve ser do formato .xlsx (ou .csv/.parquet) e possuir a coluna: 'site_name'  
                 
-                A função possui somente um argumento.
+                O arquivo é lido uma única vez e o objeto funciona como um registro dos sites, 
+                permitindo obter os parâmetros de cada site sem uma nova leitura do arquivo.
+                
+                A função possui dois argumentos.
                 
                 -------------------
-                path : str - Recebe o endereço do data base file.
+                path : str - Recebe o endereço da pasta raíz onde está armazenado os arquivos do solar do projeto.
+                database_file : str - Recebe o endereço do data base file. Caso não seja informado, 
+                é utilizado o arquivo path + 'cver/DataBase.xlsx'.
          """
+        
+        if database_file is None:
+            database_file = path + 'cver/DataBase.xlsx'
            
-        locations = pd.read_excel(path + 'cver/DataBase.xlsx')
-        self.SITE_NAME = locations.site_name
+        self.path = path
+        self.database = read_database(database_file)
+        self.SITE_NAME = self.database.site_name
+        
+        # Índice para a busca em O(1) pelo nome do site
+        self._positions = {name: position for position, name in enumerate(self.SITE_NAME)}
+        self._locations = {}
+        self._blocks = {}
+
+    def _position(self, site_name: str or int) -> int:
+        
+        # Nomes inexistentes resultariam num erro pouco claro do pandas em iloc
+        if isinstance(site_name, str) and site_name not in self._positions:
+            raise KeyError("site_name '%s' não encontrado" % site_name)
+        
+        return self._positions.get(site_name, site_name)
+
+    def get_location(self, site_name: str or int) -> object:
+        
+        """
+                Com esta função é possível obter o objeto DataLocations de um site, sem que o 
+                data base file seja lido novamente.
+                
+                -------------------
+                site_name : int or srt - Recebe um valor numérico, correspondente a linha do arquivo. 
+                Ou o nome do site_name.  
+        """
+        
+        position = self._position(site_name)
+        
+        if position not in self._locations:
+            self._locations[position] = DataLocations(path=self.path, site_name=site_name,
+                                                      location=self.database.iloc[position])
+        
+        return self._locations[position]
+    
+    def get_blocks(self, site_name: str or int, blocks_file: str = None) -> list:
+        
+        """
+                Com esta função é possível obter os blocos (sub-arranjos) de um site, um objeto 
+                DataLocations por bloco (ver BlockSimulation). 
+                
+                O arquivo de blocos possui as colunas 'site_name' e 'block_name' e, para cada bloco, 
+                as colunas do data base file que diferem do site (ex.: 'ond_file', 'MODULES_IN_SERIES', 
+                'INVERTERS', 'D'). As células vazias recebem o valor do site no data base file.
+                
+                -------------------
+                site_name : int or srt - Recebe um valor numérico, correspondente a linha do data base 
+                file. Ou o nome do site_name.
+                blocks_file : str - Recebe o endereço do arquivo de blocos (.xlsx, .csv ou .parquet). 
+                Caso não seja informado, é utilizado o arquivo path + 'cver/Blocks.xlsx'.
+        """
+        
+        position = self._position(site_name)
+        
+        if blocks_file is None:
+            blocks_file = self.path + 'cver/Blocks.xlsx'
+        
+        if blocks_file not in self._blocks:
+            self._blocks[blocks_file] = read_database(blocks_file)
+        
+        site = self.database.iloc[position]
+        blocks = self._blocks[blocks_file]
+        
+        return [DataLocations(path=self.path, site_name=site_name, location=block.combine_first(site))
+                for _, block in blocks[blocks.site_name == site['site_name']].iterrows()]
               
 
 class DataLocations:
 
-    def __init__(self, path: str, site_name: str or int) -> None:
+    def __init__(self, path: str, site_name: str or int, location: object = None) -> None:
      
         """
                 Com esta função é possível realizar a leitura do arquivo que contém os parâmetros 
@@ -43,20 +143,23 @@ class DataLocations:
                    'STC_OHM_LOSS', 'SOILING_LOSS', 'MISMATCH_LOSS', 'ALBEDO',
                    'GHI_MIN_THRESHOLD', 'MAX_ANGLE']   
                 
-                A função possui somente dois argumentos.
+                A função possui três argumentos.
                 
                 -------------------
                 path : str - Recebe o endereço da pasta raíz onde está armazenado os arquivos do solar do projeto.
                 site_name : int or srt - Recebe um valor numérico, correspondente a linha do arquivo. 
                 Ou o nome do site_name.  
+                location : pd.Series - Recebe a linha do data base file já lida (ver Locations.get_location).
+                Caso não seja informada, o arquivo é lido.
          """
-           
-        locations = pd.read_excel(path + 'cver/DataBase.xlsx')
-        locations.index = locations.site_name
-        try:
-            location = locations.loc[site_name]
-        except:
-            location = locations.iloc[site_name]
+        
+        if location is None:
+            locations = read_database(path + 'cver/DataBase.xlsx')
+            locations.index = locations.site_name
+            try:
+                location = locations.loc[site_name]
+            except:
+                location = locations.iloc[site_name]
         
         self.SITE_NAME = location['site_name']
         self.SOLAR_SERIES_FILE = path + 'ts/' + location['solar_series_file']
@@ -92,933 +195,3164 @@ class DataLocations:
             self.PVSYST_FILE = path + 'cver/simulation_PVSyst/' + location['pvsyst_file']
         except:
             self.PVSYST_FILE = None
-     
 
-class PVModulo:
+        # Nome do bloco (sub-arranjo) do site, ver Locations.get_blocks
+        try:
+            self.BLOCK_NAME = location['block_name']
+        except:
+            self.BLOCK_NAME = None
 
-     def __init__(self, path: str) -> None: 
-         
-         """
-                A função realiza a leitura dos dados do arquivo .PAN. 
-               
-                
-                A função possui somente um argumento.
-                
-                -------------------
-                path : str - Recebe o endereço do aquivo .pan.
-        """
-         
-        
-         def _parse_tree(lines) -> None:
-            
-            """
-            Parse an indented outline into (level, name, parent) tuples.  Each level
-            of indentation is 2 spaces.
-            """
-            
-            regex = re.compile(r'^(?P<indent>(?: {2})*)(?P<name>\S.*)')
-            stack = []
-            
-            for line in lines:
-                match = regex.match(line)
-                level=0
-                if not match:
-                    continue #skip last line or empty lines
-                stack[level:] = [match.group('name')]
-                yield level, match.group('name'), (stack[level - 1] if level else None)
-                
-         def e_gap(pan_data: object, technol: str) -> float:
-               """
-               Com esta função é obter o valor de energia do gap do semicondutor
-           
-               -------------------
-               technol - recebe a tecnologia do módulo extraída do arquivo .PAN. 
-           
-               """  
-               technol_module = pan_data.loc[technol, 'value']
-               e_gap = {'mtSiPoly':1.12,
-                     'mtCdTe': 1.5,
-                     'mtSiMono':1.12}
-            
-               return e_gap[technol_module]
-           
-         def value(pan_data: object, parameter: str) -> float:
-                
-            return float(pan_data.loc[parameter, 'value'])
-             
+     
+
+def file_hash(path: str) -> str:
 
+    """
+            Com esta função é possível obter o hash do conteúdo de um arquivo, utilizado como chave 
+            dos caches. Qualquer alteração no arquivo gera uma nova chave, invalidando o cache.
             
-         logging.addLevelName(5,"VERBOSE")
-         logging.basicConfig(level=logging.INFO)
-    
-         with open(path, mode='r', encoding='utf-8-sig') as file:
-                    raw = file.read()
-                    if raw[:3] == "ï»¿": # this is utf-8-BOM
-                        raw = raw[3:] #remove BOM
-             
-         lines = (raw.split('\n'))
+            -------------------
+            path : str - Recebe o endereço do arquivo.
+    """
     
-         pan_data_tuple=[]
+    digest = hashlib.blake2b(digest_size=16)
     
-         for index, name, parent in _parse_tree(lines):
-            try:
-                if len(tuple(re.split('=',name))) == 3:
-                    pan_data_tuple.append(tuple(re.split('=',name))[0]+' '+
-                                          tuple(re.split('=',name))[1], tuple(re.split('=',name))[2])
-                else:
-                    pan_data_tuple.append(tuple(re.split('=',name)))
-            except:
-                continue
+    with open(path, mode='rb') as file:
+        for block in iter(lambda: file.read(2**20), b''):
+            digest.update(block)
     
-         pan_data = pd.DataFrame(pan_data_tuple, columns=['key','value'])
-         pan_data.index = pan_data.key
-         pan_data.index = pan_data['key']
-         pan_data = pan_data[['value']]
-        
-         
-         self.parameters = {'alpha_sc': value(pan_data,'muISC') / 1000, #muISC - Coeficiente de temperatura da corrente de curto circuito
-                            'gamma_ref': value(pan_data,'Gamma'), #Gamma - Fator de idealidade do Diodo
-                            'mu_gamma': value(pan_data,'muGamma'), #muGamma - Coeficiente de temperatura para o fator de idealidade do diodo
-                            'R_sh_ref': value(pan_data,'RShunt'), #RShunt - Resistência shunt em condições de referência
-                            'R_sh_0': value(pan_data,'Rp_0'), #Rp_0 - Resistência shunt em condições de irradiância zero
-                            'R_s': value(pan_data,'RSerie'), #RSerie - Resistência em série nas condições de referência
-                            'cells_in_series': value(pan_data,'NCelS'), #NCelS - Número de células em série
-                            'cells_in_parallel': value(pan_data,'NCelP'), #NCelP - Número de células em paralelo
-                            'R_sh_exp':value(pan_data,'Rp_Exp'), #Rp_Exp - Expoente da equação para resistência de derivação (Padrão 5.5)
-                            'EgRef': e_gap(pan_data,'Technol'), #Bandgap de energia na temperatura de referência
-                            'irrad_ref': value(pan_data,'GRef'), #GRef - Irradiância de referência
-                            'temp_ref': value(pan_data,'TRef') + 273.15 , #TRef - Temperatura de referência [K]
-                            'cell_area': value(pan_data,'CellArea') / 10000,# CellArea
-                            'nominal_power': value(pan_data,'Imp') * value(pan_data,'Vmp'), #PNom = Imp * Vmp
-                            'Imp': value(pan_data,'Imp'),
-                            'Vmp': value(pan_data,'Vmp'),
-                            'Isc_ref': value(pan_data,'Isc'), #Isc
-                            'Voc_ref': value(pan_data,'Voc'), #Voc
-                            'Width': value(pan_data,'Width'),
-                            'Height':  value(pan_data,'Height'),
-                            'surface': value(pan_data,'Width')*value(pan_data,'Height')} 
-
-        
-         curva = ['Point_1', 'Point_2', 'Point_3', 'Point_4', 'Point_5', 'Point_6', 
-                  'Point_7', 'Point_8', 'Point_9']
-         self.iam_curve = pan_data[pan_data.index.isin(curva)].reset_index(drop=True)[:9]
-         self.iam_curve['Angle'] = [float(re.split(',',poits)[0] )for poits in self.iam_curve['value']]
-         self.iam_curve['FIAM'] = [float(re.split(',',poits)[1]) for poits in self.iam_curve['value']]
-         self.iam_curve.drop(columns='value', inplace=True)
-         
+    return digest.hexdigest()
 
-class Inverter:
-    
+
+class ResultCache:
     
-    def __init__(self, path: str) -> None:
+    def __init__(self, max_entries: int = 64, directory: str = None, max_disk_bytes: int = 256*2**20,
+                 max_memory_bytes: int = None) -> None:
         
         """
-                A função realiza a leitura dos dados do arquivo .OND. 
-               
+                Cache de resultados com política LRU, mantido em memória e, opcionalmente, persistido 
+                em disco para ser reaproveitado entre execuções e entre os processos de um lote.
                 
-                A função possui somente um argumento.
+                Os valores são gravados em disco com pickle, um arquivo por chave. Ao exceder 
+                max_disk_bytes, os arquivos usados há mais tempo são removidos.
+                
+                A função possui quatro argumentos.
                 
                 -------------------
-                path : str - Recebe o endereço do aquivo .ond.
+                max_entries : int - Recebe o número máximo de resultados mantidos em memória.
+                directory : str - Recebe a pasta do cache em disco. Caso não seja informada, o cache 
+                é mantido apenas em memória.
+                max_disk_bytes : int - Recebe o tamanho máximo do cache em disco [bytes].
+                max_memory_bytes : int - Recebe o tamanho máximo dos resultados mantidos em memória [bytes]. 
+                Só é considerado para resultados cujo tamanho é conhecido (arrays).
         """
         
-        def value(ond_data: object, parameter:str) -> float:
-            
-            if parameter == 'MonoTri':
-                if ond_data.loc[parameter, 'value'] == 'Tri':
-                    return 3
-                elif ond_data.loc[parameter, 'value'] == 'Mono':
-                    return 1
-            else:   
-                return float(ond_data.loc[parameter, 'value'])
-           
-            #Read Ond File
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.suffix = '.pkl'
+        self._memory = OrderedDict()
         
-        def _parse_tree(lines: list) -> None:
-            """
-            Parse an indented outline into (level, name, parent) tuples.  Each level
-            of indentation is 2 spaces.
-            """
-            regex = re.compile(r'^(?P<indent>(?: {2})*)(?P<name>\S.*)')
-            stack = []
-            for line in lines:
-                match = regex.match(line)
-                level=0
-                if not match:
-                    continue #skip last line or empty lines
-                stack[level:] = [match.group('name')]
-                yield level, match.group('name'), (stack[level - 1] if level else None)
-                
-        """
-        Com esta função é possível extrair um dataframe contendo as curvas P_dc/P_ac 
-        extraídas do arquivo .OND 
-    
-        -------------------
-        path - recebe o diretório onde se encontra o arquivo .ond.
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
     
-        """    
-        logging.addLevelName(5,"VERBOSE")
-        logging.basicConfig(level=logging.INFO)
+    def _file(self, key: str) -> str:
+        
+        return os.path.join(self.directory, key + self.suffix)
     
-        try:
-            with open(path, mode='r', encoding='utf-8-sig') as file:
-                    raw = file.read()
-                    if raw[:3] == "ï»¿": # this is utf-8-BOM
-                        raw = raw[3:] #remove BOM
-        except:   
-            
-            try: 
-                with open(path, mode='r') as file:
-                        raw = file.read()
-                        if raw[:3] == "ï»¿": # this is utf-8-BOM
-                            raw = raw[3:] #remove BOM
-            except:
-                return 'Erro - O arquivo está cofidicado de forma inadequada'
+    def _dump(self, value: object, file: str) -> None:
+        
+        with open(file, mode='wb') as handle:
+            pickle.dump(value, handle, protocol=pickle.HIGHEST_PROTOCOL)
     
-        lines = (raw.split('\n'))
+    def _load(self, file: str) -> object:
+        
+        with open(file, mode='rb') as handle:
+            return pickle.load(handle)
     
-        ond_data_tuple=[]
+    def _size(self, value: object) -> int:
+        
+        return 0
     
-        for index, name, parent in _parse_tree(lines):
-            try:
-                if len(tuple(re.split('=',name))) == 3:
-                    ond_data_tuple.append(tuple(re.split('=',name))[0]+' '+
-                                          tuple(re.split('=',name))[1], tuple(re.split('=',name))[2])
-                else:
-                    ond_data_tuple.append(tuple(re.split('=',name)))
-            except:
-                continue
+    def _shared(self, value: object) -> object:
+        
+        return value
     
-        ond_data = pd.DataFrame(ond_data_tuple, columns=['key','value'])
-        ond_data.index = ond_data.key
+    def _remember(self, key: str, value: object) -> None:
         
-        def ond_read_curves(ond_data: object) -> object:
-            """
-            Com esta função é possível extrair um dataframe contendo as curvas P_dc/P_ac 
-            extraídas do dataframe com os dados do .OND. 
+        if self.max_entries <= 0:
+            return None
         
-            -------------------
-            ond_data - recebe um dataframe contendo os dados do arquivo .ond.
+        self._memory[key] = value
+        self._memory.move_to_end(key)
         
-            """
-            curva = ['Point_1', 'Point_2', 'Point_3', 'Point_4', 'Point_5', 'Point_6', 
-                     'Point_7', 'Point_8', 'Point_9', 'Point_10', 'Point_11']
-            ond_data['key'] = ond_data.index
-            ond_curves = ond_data[ond_data['key'].isin(curva)].reset_index(drop=True)
-            ond_curves['P_dc'] = [float(re.split(',',poits)[0] )for poits in ond_curves['value']]
-            ond_curves['P_ac'] = [float(re.split(',',poits)[1]) for poits in ond_curves['value']]
-            ond_curves['eff']=ond_curves['P_ac']/ond_curves['P_dc']
-        
-            
-            if ond_data[ond_data['key']=='Point_1'].shape[0] > 3:
-                ond_curves['input_voltage']=['' if int(index)<11
-                                    else 'Vmin' if ((int(index)>=11)&(int(index)<22))
-                                    else 'Vnom' if ((int(index)>=22)&(int(index)<33))
-                                    else 'Vmax' 
-                                    for index, _ in ond_curves.iterrows()]
-            else:
-                ond_curves['input_voltage']=['Vmin' if int(index)<11
-                                    else 'Vnom' if ((int(index)>=11)&(int(index)<22))
-                                    else 'Vmax' 
-                                    for index, _ in ond_curves.iterrows()]
-            
-            ond_curves['VNomEff']=[0 if int(index)<11
-                                else float(re.split(',',ond_data.loc['VNomEff']['value'])[0]) 
-                                if ((int(index)>=11)&(int(index)<22))
-                                else float(re.split(',',ond_data.loc['VNomEff']['value'])[1]) 
-                                if ((int(index)>=22)&(int(index)<33))
-                                else float(re.split(',',ond_data.loc['VNomEff']['value'])[2]) 
-                                for index, _ in ond_curves.iterrows()]
-        
-            ond_curves.dropna(inplace=True)
-            ond_curves.drop(columns=['key', 'value'], inplace=True)
-        
-            return ond_curves 
-        
-        
-        self.parameters =  {'PNomConv': value(ond_data,'PNomConv') , #PNomConv - Potência do inversor dada em W
-                            'EfficMax': value(ond_data,'EfficMax'), #EfficMax - Eficiência máxima do inversor
-                            'PMaxOUT': value(ond_data,'PMaxOUT'), #PMaxOUT - Potência máxima de entrada AC
-                            'TPNom': value(ond_data,'TPNom'), #Temperatura de operação para Pnon
-                            'TPMax': value(ond_data,'TPMax'), #Temperatura de operação para Pmax
-                           'VOutConv': value(ond_data,'VOutConv'), #Tensão de saída do conversor
-                           'MonoTri': value(ond_data,'MonoTri')} #Número de fases do inversor
-        
-        self.curve = ond_read_curves(ond_data)
-                            
-
-class Simulation:  
-    
-    def __init__(self, location:object, modulo:object, inversor:object):
-            
-        solar_series = pd.read_csv(location.SOLAR_SERIES_FILE)
-        solar_series['date'] = pd.to_datetime(solar_series['time'], dayfirst=True)
-        solar_series['date'] = \
-                    pd.to_datetime(solar_series['date']).dt.tz_localize('UTC').dt.tz_convert('Etc/GMT+'+str(location.FUSO))
-        solar_series['date'] = solar_series['date']  + datetime.timedelta(hours=int(location.FUSO))
-        t_shift = solar_series['date'] + datetime.timedelta(minutes=30)
-        solar_series.index =   t_shift
-        self.simulation_output = pd.DataFrame(index=t_shift)
-        self.simulation_output['date'] = solar_series['date']
-
-        ################# Angles #################
-        def pvlib_elevation_correction(apparent_elevation_pvlib:float):
-            """
-            Com esta função é possível realizar o ajuste dos valores de elevação aparente
-            do sol obtidos pelo PVLib com o SPA do NREL, de modo que após o ajuste a curva 
-            de correlação com os dados do PVSyst possua valor de R² igual a 1.
-            
-            A função possui somente um argumento [apparent_elevation_pvlib]
-            
-            -------------------
-            apparent_elevation_pvlib - Recebe os valores de elevação solar aparente calculados pelo PVLib.
-            
-            """
-            
-            if apparent_elevation_pvlib >= 7:
-                return apparent_elevation_pvlib
-            elif -7 < apparent_elevation_pvlib and apparent_elevation_pvlib < 7:
-                return 0.5*apparent_elevation_pvlib + 3.5
-            else:
-                return 0
-     
-        #apparent_elevation 
-        pvlib_solar_position = pvlib.solarposition.get_solarposition(time=t_shift, 
-                                                                 latitude=location.LAT, 
-                                                                 longitude=location.LON)
-     
-        self.simulation_output['HSol'] =  (pvlib_solar_position['apparent_elevation'].
-                                           apply(pvlib_elevation_correction))
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
         
-        #azimuth
-        self.simulation_output['AzSol'] =  pvlib_solar_position['azimuth']
-    
-        #zenith
-        ZSol =  90 - self.simulation_output['HSol']
-    
-    
-        #Tracker position
-        tracker = pvlib.tracking.singleaxis(apparent_zenith=ZSol,  
-                                        apparent_azimuth=self.simulation_output['AzSol'],
-                                        axis_tilt=0,
-                                        axis_azimuth=0,
-                                        max_angle=location.MAX_ANGLE,
-                                        backtrack=True,
-                                        gcr=location.GCR)
+        if self.max_memory_bytes is not None:
+            while (len(self._memory) > 1 and 
+                   sum(self._size(stored) for stored in self._memory.values()) > self.max_memory_bytes):
+                self._memory.popitem(last=False)
     
-        self.simulation_output['AngInc'] =  tracker['aoi']
-        self.simulation_output['PhiAng'] =  tracker['tracker_theta']
-    
-    
-        ################# MetData #################
-
-        self.simulation_output['GlobHor'] =  solar_series['GHI']
-        self.simulation_output['DiffHor'] =  solar_series['DIF']
-          
-        """Note que o PVsyst não permite fornecer as três componentes ao mesmo tempo, apenas duas. O time de projetos solares da
-            Casa dos Ventos optou por usar a irradiação global horizontal (GHI) e a componente difusa (DIF), por entender que são
-            dados mais robustos. No início e no final do dia, o cálculo da irradiação direta envolve a divisão por um número pequeno,
-            o que pode levar (e leva) a imprecisões de origem numérica."""
-            
-        self.simulation_output['BeamHor'] =  (self.simulation_output['GlobHor']- self.simulation_output['DiffHor']) /\
-                                                  cosd(ZSol)
-                                                  
+    def get(self, key: str) -> object:
         
-        self.simulation_output['T_Amb'] =  solar_series['TEMP']
-        self.simulation_output['WindVel'] =  solar_series['WS']
-    
-        ################# Transpo #################
-
-            
-        # Irradiação direta no plano inclinado
-        self.simulation_output['BeamInc'] = pvlib.irradiance.beam_component(surface_tilt=tracker['surface_tilt'],
-                                                surface_azimuth=tracker['surface_azimuth'],
-                                                solar_zenith=ZSol,
-                                                solar_azimuth=self.simulation_output['AzSol'],
-                                                dni=self.simulation_output['BeamHor'])
-            
-        # Irradiação extraterrestre (ou topo da atmosfera, ToA) numa superfície normal ao sol
-        dni_extra=pvlib.irradiance.get_extra_radiation(datetime_or_doy=self.simulation_output.index)
+        """
+                Retorna o valor armazenado para a chave ou None, caso a chave não esteja no cache.
+        """
         
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
         
-        # Massa de ar absoluta (ajustada à pressão) 
-        airmass = pvlib.atmosphere.get_absolute_airmass(pvlib.atmosphere.get_relative_airmass(zenith=ZSol))
+        if self.directory is None:
+            return None
         
-        # Irradiação difusa no plano inclinado, modelo de Perez-Ineichen.
-        self.simulation_output['DifSInc'] = pvlib.irradiance.perez(surface_tilt=tracker['surface_tilt'],
-                                                                  surface_azimuth=tracker['surface_azimuth'],
-                                                                  dhi=self.simulation_output['DiffHor'],
-                                                                  dni=self.simulation_output['BeamHor'],
-                                                                  dni_extra= dni_extra,
-                                                                  solar_zenith=ZSol,
-                                                                  solar_azimuth=self.simulation_output['AzSol'],
-                                                                  airmass=airmass)
+        file = self._file(key)
         
-        self.simulation_output['DifSInc'].fillna(0, inplace=True)
+        try:
+            value = self._shared(self._load(file))
+            os.utime(file)
+        except Exception:
+            return None
         
-        # Irradiação refletida do solo no plano inclinado
-        self.simulation_output['Alb_Inc'] = pvlib.irradiance.get_ground_diffuse(tracker['surface_tilt'],
-                                           self.simulation_output['GlobHor'],
-                                           albedo=location.ALBEDO)
+        self._remember(key, value)
         
-        # Irradiação global no plano inclinado
-        self.simulation_output['GlobInc'] = (self.simulation_output['BeamInc'] + 
-                                             self.simulation_output['DifSInc'] + 
-                                             self.simulation_output['Alb_Inc'])
-
-             
-        ################# IncColl #################
+        return value
     
+    def put(self, key: str, value: object) -> object:
         
-        from scipy import interpolate
+        """
+                Armazena o valor para a chave, em memória e, caso configurado, em disco. Retorna o valor 
+                armazenado, que deve ser usado no lugar do valor recebido (ver ArrayCache).
+        """
         
-        # Vetor da direção do Sol (x,y,z)
-        sun_x = cosd(self.simulation_output['HSol']) * \
-            sind(self.simulation_output['AzSol'])
+        shared = self._shared(value)
+        self._remember(key, shared)
         
-        sun_z = sind(self.simulation_output['HSol'])
+        if self.directory is None:
+            return shared
         
-        # Os cálculos subsequentes serão feitos em radianos
-        theta = np.deg2rad(self.simulation_output['PhiAng'])
+        # A gravação é feita em um arquivo temporário para que outros processos nunca leiam um arquivo incompleto
+        file = self._file(key)
+        temporary = file + '.%d.tmp' % os.getpid()
+        self._dump(value, temporary)
+        os.replace(temporary, file)
         
-        # É obtido o ângulo do sol relativo ao plano xz
-        psi = np.arctan2(sun_x, sun_z)
+        self._evict()
         
-       #Near Shading Loss
+        return shared
+    
+    def get_or_compute(self, key: str, compute: object) -> object:
         
-       #Near shading bean loss
-        # beam_loss_factor = perda / total 
-        beam_loss_factor = (np.tan(psi) * np.tan(theta) + 1 - 1/(location.GCR * np.cos(theta))) /\
-            (np.tan(psi) * np.tan(theta) + 1)
-            
-        # Aplica 0 nos valores negativos
-        beam_loss_factor = beam_loss_factor.apply(lambda x: max(x, 0))
-
-        #Obtém a perdas na componente direta fazendo a ponderação da componente direta pelo fator de perda
-        self.simulation_output['ShdBLss'] = self.simulation_output['BeamInc'] * beam_loss_factor
+        """
+                Retorna o valor armazenado para a chave ou, caso a chave não esteja no cache, 
+                calcula o valor com a função compute (sem argumentos) e o armazena.
+        """
         
-        #Near shading diffuse loss
+        value = self.get(key)
         
-        masking_angle = pvlib.shading.masking_angle(surface_tilt = tracker['surface_tilt'], 
-                                          gcr = location.GCR, 
-                                          slant_height = 0)
+        if value is None:
+            value = self.put(key, compute())
         
+        return value
+    
+    def _evict(self) -> None:
         
-        shading_loss_factor = pvlib.shading.sky_diffuse_passias(masking_angle)
+        entries = []
         
-        self.simulation_output['ShdDLss'] = self.simulation_output['DiffHor']*shading_loss_factor
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
         
-
+        total = sum(size for _, size, _ in entries)
         
-        #Near shadings albedo loss
-        C_albedo = 1.15
-
-        self.simulation_output['ShdALss'] = (C_albedo*location.GCR*self.simulation_output['Alb_Inc']*
-                                             (math.pi - abs(theta)))
+        for _, size, name in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+    
+    def clear(self) -> None:
         
+        """
+                Remove todos os resultados do cache, em memória e em disco.
+        """
         
-        #Near shadings loss
-        self.simulation_output['ShdLoss'] = (self.simulation_output['ShdBLss']  + 
-                                             self.simulation_output['ShdDLss']  + 
-                                             self.simulation_output['ShdALss']) 
+        self._memory.clear()
         
-        beam_after_shading = self.simulation_output['BeamInc']  - self.simulation_output['ShdBLss']
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith(self.suffix):
+                    os.remove(os.path.join(self.directory, name))
 
-        diff_after_shading = self.simulation_output['DifSInc'] -  self.simulation_output['ShdDLss']
-        
-        albedo_after_shading = self.simulation_output['Alb_Inc'] - self.simulation_output['ShdALss']
-        
-        #Global corrected for shadings
-        self.simulation_output['GlobShd'] = beam_after_shading + diff_after_shading + albedo_after_shading
-        
-        
-        #IAM Loss
-        
-        tck = interpolate.interp1d(modulo.iam_curve['Angle'], modulo.iam_curve['FIAM'],
-                           fill_value='extrapolate')
 
-        iam_loss_factor_beam = tck(self.simulation_output['AngInc'])
-        
-        # Incidence beam loss
-        
-        beam_after_iam = beam_after_shading * iam_loss_factor_beam
+def cache_directory(name: str) -> str:
+    
+    """
+            Retorna a subpasta do cache em disco definida pela variável de ambiente CVER_CACHE_DIR, 
+            ou None caso a variável não esteja definida (cache apenas em memória). 
+    """
+    
+    root = os.environ.get('CVER_CACHE_DIR')
+    
+    return None if not root else os.path.join(root, name)
 
-        diff_after_iam = diff_after_shading
 
-        albedo_after_iam = albedo_after_shading
-        
-        #Global corrected for IAM
-        self.simulation_output['GlobIAM'] = beam_after_iam + diff_after_iam + albedo_after_iam
-        
-        # Soiling Loss
+# Cache dos arquivos .PAN e .OND já interpretados, indexado pelo hash do conteúdo do arquivo
+PARSE_CACHE = ResultCache(max_entries=64, directory=cache_directory('parse'), max_disk_bytes=64*2**20)
+
+
+class ArrayCache(ResultCache):
+    
+    """
+            Cache de resultados compostos por arrays NumPy (dicionário nome -> array), gravados em 
+            disco no formato .npz. Os arrays retornados são somente leitura, pois são compartilhados 
+            entre as simulações.
+    """
+    
+    def __init__(self, max_entries: int = 16, directory: str = None, max_disk_bytes: int = 512*2**20,
+                 max_memory_bytes: int = 256*2**20) -> None:
         
-        self.simulation_output['SlgLoss'] = self.simulation_output['GlobIAM'] * location.SOILING_LOSS
+        super().__init__(max_entries=max_entries, directory=directory, max_disk_bytes=max_disk_bytes,
+                         max_memory_bytes=max_memory_bytes)
+        self.suffix = '.npz'
+    
+    def _dump(self, value: dict, file: str) -> None:
         
-        # Global corrected for Soiling
-        self.simulation_output['GlobSlg'] = (self.simulation_output['GlobIAM'] - 
-                                             self.simulation_output['SlgLoss'])
+        with open(file, mode='wb') as handle:
+            np.savez(handle, **value)
+    
+    def _load(self, file: str) -> dict:
         
-        # Global effective
+        with np.load(file) as data:
+            return {name: data[name] for name in data.files}
+    
+    def _size(self, value: dict) -> int:
         
-        self.simulation_output['GlobEff'] = self.simulation_output['GlobSlg'] 
+        return sum(array.nbytes for array in value.values())
     
-        ################# Array e Inverter #################
+    def _shared(self, value: dict) -> dict:
         
-        from scipy import constants
+        # São armazenadas e retornadas visões somente leitura, de modo que os arrays de quem armazenou 
+        # o resultado continuam graváveis, mas nenhuma alteração feita por quem lê o cache o corrompe
+        readonly = {}
+        for name, array in value.items():
+            readonly[name] = array.view()
+            readonly[name].flags.writeable = False
         
-        # A eficiência na condição de operação padrão é calculada como sendo a razão da 
-        #potência nominal pela potência disponível na área do painel. 
-        stc_efficiency = \
-            modulo.parameters['nominal_power'] /\
-            (modulo.parameters['surface'] * modulo.parameters['irrad_ref'])
-            
+        return readonly
 
-        # Tensão térmica
-        #Vt = k * T / q
-        Vt = constants.Boltzmann * modulo.parameters['temp_ref'] / constants.e 
-        
-        # Cálculo da corrente de saturação do diodo a partir das condições (0, V_oc) e (I_sc, 0)
-        #I_0 = (Isc  - (Voc - Isc * Rs) / Rsh) * math.exp(-Voc / (ns * ni * Vt))
-        I_0 = ((modulo.parameters['Isc_ref']  - (modulo.parameters['Voc_ref'] - 
-                modulo.parameters['Isc_ref'] * modulo.parameters['R_s']) / 
-                modulo.parameters['R_sh_ref']) * math.exp(-modulo.parameters['Voc_ref'] / 
-                (modulo.parameters['cells_in_series'] * modulo.parameters['gamma_ref'] * Vt))) 
-                                                         
-        #I_ph = I_0 * math.exp(Voc / (ni * ns * Vt)) + Voc / Rsh
-        #Cálculo da fotocorrente pela equação obtida em (0, V_oc)
-        I_ph = (I_0 * math.exp(modulo.parameters['Voc_ref'] / (modulo.parameters['gamma_ref'] * 
-            modulo.parameters['cells_in_series'] * Vt)) + modulo.parameters['Voc_ref'] 
-                / modulo.parameters['R_sh_ref']) 
-        
-        # Potência Nominal
-        self.simulation_output['EArrNom'] = self.simulation_output['GlobEff'] *stc_efficiency*\
-                    modulo.parameters['surface'] *\
-                    location.MODULES_IN_SERIES *\
-                    location.MODULES_IN_PARALLEL
 
-        self.simulation_output['TArray'] = pvlib.temperature.pvsyst_cell( poa_global=self.simulation_output['GlobEff'], 
-                                            temp_air=self.simulation_output['T_Amb'], 
-                                            wind_speed=self.simulation_output['WindVel'] , 
-                                            u_c = location.U_c, 
-                                            u_v = location.U_v, 
-                                            eta_m = stc_efficiency, 
-                                            alpha_absorption = 0.9)
-      
-        
-                            
-        pvsyst_params = pvlib.pvsystem.calcparams_pvsyst(effective_irradiance = self.simulation_output['GlobEff']*(1-location.LID_LOSS-location.QUALITY_LOSS), #Irradiância que é convertida em fotocorrente
-                                                 temp_cell = self.simulation_output['TArray'], #temperatura média das células
-                                                 alpha_sc = modulo.parameters['alpha_sc'], #Coeficiente de temperatura da corrente de curto circuito
-                                                 gamma_ref = modulo.parameters['gamma_ref'], #Fator de idealidade do diodo
-                                                 mu_gamma = modulo.parameters['mu_gamma'], #Coeficiente de temperatura para o fator de idealidade do diodo 
-                                                 I_L_ref = I_ph, #Fotocorrente nas condições de referência
-                                                 I_o_ref = I_0, #Corrente de saturação reversa nas condições de referência
-                                                 R_sh_ref = modulo.parameters['R_sh_ref'], #Resistência shunt em condições de referência
-                                                 R_sh_0 = modulo.parameters['R_sh_0'], #Resistência shunt em condições de irradiância zero
-                                                 R_s = modulo.parameters['R_s'], #Resistência série
-                                                 cells_in_series = modulo.parameters['cells_in_series'], #Número de células em série
-                                                 R_sh_exp=5.5, #The exponent in the equation for shunt resistance
-                                                 EgRef = modulo.parameters['EgRef'], #Bandgap de engergia na temperatura de referência
-                                                 irrad_ref = modulo.parameters['irrad_ref'], #Irradiância de referência
-                                                 temp_ref = modulo.parameters['temp_ref']- 273.15) #Temperatura da célula de referência em Célsius
+def cache_key(*parts) -> str:
+    
+    """
+            Com esta função é possível obter a chave de cache de um conjunto de parâmetros 
+            (escalares, strings ou arrays). 
+    """
+    
+    digest = hashlib.blake2b(digest_size=16)
+    
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(np.ascontiguousarray(part).tobytes())
+            digest.update(str(part.dtype).encode())
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b'|')
+    
+    return digest.hexdigest()
 
-        photocurrent = pvsyst_params[0]
-        
-        saturation_current = pvsyst_params[1]
-        
-        resistance_series = pd.Series(np.empty(len(photocurrent)))
+
+# Cache da posição do sol e da geometria do tracker, indexado pelas coordenadas, pela série 
+# temporal e pelos parâmetros do tracker
+GEOMETRY_CACHE = ArrayCache(max_entries=16, directory=cache_directory('geometry'))
+
+
+class MemmapCache(ArrayCache):
+    
+    """
+            Cache de resultados compostos por arrays 1-D de mesmo tamanho (dicionário nome -> array), 
+            gravados em disco como um único arquivo .npy (array estruturado, uma coluna por array). 
+            Os arquivos são lidos com mapeamento em memória, de modo que a leitura é praticamente 
+            instantânea e as páginas do arquivo são compartilhadas, somente leitura, entre os 
+            processos de um lote.
+    """
+    
+    def __init__(self, max_entries: int = 16, directory: str = None, max_disk_bytes: int = 512*2**20,
+                 max_memory_bytes: int = 256*2**20) -> None:
         
-        resistance_series = resistance_series.apply(lambda x: pvsyst_params[2])
+        super().__init__(max_entries=max_entries, directory=directory, max_disk_bytes=max_disk_bytes,
+                         max_memory_bytes=max_memory_bytes)
+        self.suffix = '.npy'
+    
+    def _dump(self, value: dict, file: str) -> None:
         
-        resistance_series.index = photocurrent.index
+        size = len(next(iter(value.values())))
+        table = np.empty(size, dtype=[(name, array.dtype) for name, array in value.items()])
         
-        resistance_shunt = pvsyst_params[3]
+        for name, array in value.items():
+            table[name] = array
         
-        nNsVth = pvsyst_params[4]
+        with open(file, mode='wb') as handle:
+            np.save(handle, table)
+    
+    def _load(self, file: str) -> dict:
         
-        single_diode_params = pd.DataFrame({'photocurrent': photocurrent, 
-                                            'saturation_current': saturation_current,
-                                            'resistance_series': resistance_series,
-                                            'resistance_shunt': resistance_shunt,
-                                            'nNsVth': nNsVth})
+        table = np.load(file, mmap_mode='r')
         
-        single_diode = pvlib.pvsystem.singlediode(single_diode_params.photocurrent,
-                                                  single_diode_params.
-                                                  saturation_current,
-                                                  single_diode_params.
-                                                  resistance_series,
-                                                  single_diode_params.resistance_shunt,
-                                                  single_diode_params.nNsVth,
-                                                  ivcurve_pnts=None, 
-                                                  method='lambertw')
+        return {name: table[name] for name in table.dtype.names}
+
+
+class Instrumentation:
+    
+    """
+            Registro do tempo de relógio, do tempo de CPU e do pico de memória alocada de cada seção 
+            nomeada da simulação: as etapas de SIMULATION_STAGES (sun, transposition, incidence, array, 
+            inverter, ac_losses, ...) e as seções internas ('shading', 'iam', 'single_diode', 'clipping', 
+            'output', 'metrics', 'csv_write', 'hdf5_write'). Ver instrumentation.
+            
+            -------------------
+            memory : bool - Registra o pico de memória alocada de cada seção (tracemalloc).
+            profile_section : str - Recebe o nome da seção executada sob o cProfile (self.profile).
+    """
+    
+    def __init__(self, memory: bool = True, profile_section: str = None) -> None:
         
-        scaled_value = pvlib.pvsystem.scale_voltage_current_power(single_diode,
-                                                                  location.MODULES_IN_SERIES,
-                                                                  location.MODULES_IN_PARALLEL)
-                            
+        self.memory = memory
+        self.profile_section = profile_section
+        self.profile = None
+        self.records = OrderedDict()
+        self._stack = []
+    
+    @contextlib.contextmanager
+    def section(self, name: str):
+        
+        import tracemalloc
+        
+        # O pico do tracemalloc é global: ao entrar numa seção, o pico até então é repassado às seções 
+        # externas e reiniciado, e ao sair o pico da seção é repassado às seções externas
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            for frame in self._stack:
+                frame[1] = max(frame[1], peak)
+            tracemalloc.reset_peak()
+            frame = [current, current]
+            self._stack.append(frame)
+        
+        profiling = name == self.profile_section
+        if profiling:
+            import cProfile
+            if self.profile is None:
+                self.profile = cProfile.Profile()
+            self.profile.enable()
+        
+        wall, cpu = time.perf_counter(), time.process_time()
         
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            
+            if profiling:
+                self.profile.disable()
+            
+            record = self.records.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_memory': 0})
+            record['calls'] += 1
+            record['wall'] += wall
+            record['cpu'] += cpu
+            
+            if tracing:
+                peak = max(frame[1], tracemalloc.get_traced_memory()[1])
+                self._stack.pop()
+                for parent in self._stack:
+                    parent[1] = max(parent[1], peak)
+                record['peak_memory'] = max(record['peak_memory'], peak - frame[0])
+    
+    def report(self) -> dict:
         
-        # Ohmic wiring loss
+        """
+                Retorna o dicionário seção -> {'calls', 'wall' [s], 'cpu' [s], 'peak_memory' [bytes]}.
+        """
         
-        # Stc parameter
-        single_diode_stc = pvlib.pvsystem.singlediode(I_ph, I_0, modulo.parameters['R_s'], modulo.parameters['R_sh_ref'],
-                                              modulo.parameters['gamma_ref'] * modulo.parameters['cells_in_series'] * Vt)
+        return {name: dict(record) for name, record in self.records.items()}
 
 
-        single_diode_stc = pd.DataFrame({'v_mp': single_diode_stc['v_mp'],
-                                         'v_oc': single_diode_stc['v_oc'],
-                                         'i_mp': single_diode_stc['i_mp'],
-                                         'i_x': single_diode_stc['i_x'],
-                                         'i_xx': single_diode_stc['i_xx'],
-                                         'i_sc': single_diode_stc['i_sc'],
-                                         'p_mp': single_diode_stc['p_mp']},
-                                        index=[0])
-        
-        #Os parâmetros de operação são escalados para que sejam obtidos os parâmetros de todo o sistema
-        scaled_value_stc = pvlib.pvsystem.scale_voltage_current_power(single_diode_stc,
-                                                              location.MODULES_IN_SERIES,
-                                                              location.MODULES_IN_PARALLEL)
+# Instrumentação ativa (ver instrumentation). Sem instrumentação, as seções não têm custo
+_INSTRUMENTATION = None
 
-        #Cálculo do R_dc equivalente para as condições de operação padrão
-        R_equiv_dc = location.STC_OHM_LOSS * scaled_value_stc['p_mp'] /\
-            (scaled_value_stc['i_mp'] ** 2)
-        
-        self.R_equiv_dc = R_equiv_dc[0]
-        
+
+def section(name: str) -> object:
+
+    """
+            Com esta função é possível delimitar uma seção nomeada da simulação (with section(nome):), 
+            registrada apenas quando a instrumentação está ativa.
+    """
+    
+    if _INSTRUMENTATION is None:
+        return contextlib.nullcontext()
+    
+    return _INSTRUMENTATION.section(name)
+
+
+def instrumented(name: str) -> object:
+
+    """
+            Decorador que registra cada chamada da função como uma seção nomeada (ver section).
+    """
+    
+    import functools
+    
+    def decorator(function):
         
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with section(name):
+                return function(*args, **kwargs)
         
-        #Cálculo da perda ôhmica aplicando a resistência equivalente às condições normais de operação do sistema
-        self.simulation_output['OhmLoss']  = self.R_equiv_dc * (scaled_value['i_mp'] ** 2)
-        self.simulation_output['OhmLoss'] = [0 if row['GlobEff']==0 else row['OhmLoss'] for index, row in self.simulation_output.iterrows()]
-       
-        #EM AVALIAÇÃO
-        self.simulation_output['FOhmLoss'] = self.simulation_output['OhmLoss']/scaled_value['p_mp'] 
+        return wrapper
+    
+    return decorator
+
+
+@contextlib.contextmanager
+def instrumentation(memory: bool = True, profile_section: str = None, profile_file: str = None):
+
+    """
+            Com esta função é possível ativar a instrumentação da simulação dentro de um bloco with, 
+            sem alterar o código das etapas:
+            
+                with instrumentation(profile_section='array', profile_file='array.prof') as records:
+                    Simulation(location, modulo, inversor)
+                records.report()
+            
+            -------------------
+            memory : bool - Registra o pico de memória de cada seção. O tracemalloc torna a simulação 
+            mais lenta, de modo que os tempos com memory = True são maiores.
+            profile_section : str - Recebe o nome da seção executada sob o cProfile.
+            profile_file : str - Recebe o arquivo em que o cProfile da seção é gravado ao final 
+            (pstats, ex.: python -m pstats arquivo.prof).
+    """
+    
+    global _INSTRUMENTATION
+    import tracemalloc
+    
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    
+    previous, _INSTRUMENTATION = _INSTRUMENTATION, Instrumentation(memory, profile_section)
+    records = _INSTRUMENTATION
+    
+    try:
+        yield records
+    finally:
+        _INSTRUMENTATION = previous
         
+        if started:
+            tracemalloc.stop()
         
-        # MisLoss
+        if profile_file is not None and records.profile is not None:
+            records.profile.dump_stats(profile_file)
+
+
+def instrumentation_summary(reports: dict) -> dict:
+
+    """
+            Com esta função é possível totalizar os relatórios de instrumentação de vários sites (site -> 
+            relatório, ver Instrumentation.report): chamadas e tempos são somados e o pico de memória é 
+            o maior entre os sites.
+    """
+    
+    summary = OrderedDict()
+    
+    for report in reports.values():
+        for name, record in (report or {}).items():
+            total = summary.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_memory': 0})
+            total['calls'] += record['calls']
+            total['wall'] += record['wall']
+            total['cpu'] += record['cpu']
+            total['peak_memory'] = max(total['peak_memory'], record['peak_memory'])
+    
+    return dict(summary)
+
+
+def read_pvsyst_text(path: str) -> tuple:
+
+    """
+            Com esta função é possível realizar a leitura de um arquivo do PVSyst (.PAN/.OND), 
+            retornando o texto do arquivo e o hash do seu conteúdo. 
+            
+            -------------------
+            path : str - Recebe o endereço do arquivo.
+    """
+    
+    with open(path, mode='rb') as file:
+        data = file.read()
+    
+    try:
+        raw = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        # Arquivos gravados pelo PVSyst em Windows (cp1252)
+        raw = data.decode('latin-1')
+    
+    if raw[:3] == "ï»¿": # this is utf-8-BOM
+        raw = raw[3:] #remove BOM
+    
+    return raw, hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _pvsyst_entries(raw: str):
+
+    """
+            Percorre as linhas de um arquivo do PVSyst, gerando tuplas (indentação, chave, valor). 
+            As linhas 'End of ...' geram (indentação, None, None).
+    """
+    
+    for line in raw.splitlines():
+        content = line.lstrip(' \t')
+        
+        if not content or content.isspace():
+            continue #skip empty lines
+        
+        indent = len(line) - len(content)
+        content = content.rstrip()
+        
+        if content.startswith('End of'):
+            yield indent, None, None
+            continue
+        
+        key, separator, value = content.partition('=')
+        
+        if separator:
+            yield indent, key, value
+
+
+def parse_pvsyst(raw: str) -> dict:
+
+    """
+            Com esta função é possível interpretar, em uma única passagem, o texto de um arquivo do 
+            PVSyst (.PAN/.OND) em um dicionário aninhado, preservando as seções do arquivo. 
+            
+            Uma linha passa a ser uma seção quando as linhas seguintes estão mais indentadas 
+            (ex.: 'ProfilPIOV1=TCubicProfile'). Nesse caso, o valor da linha é guardado na chave '_value' 
+            da seção. Assim, chaves repetidas em seções diferentes (ex.: 'Point_1' das curvas de 
+            eficiência de cada tensão) não colidem.
+            
+            -------------------
+            raw : str - Recebe o texto do arquivo.
+    """
+    
+    root = {}
+    stack = [(-1, root)]
+    last = None
+    
+    for indent, key, value in _pvsyst_entries(raw):
+        
+        # A linha anterior abre uma seção
+        if last is not None and indent > last[0]:
+            section = {'_value': last[1][last[2]]}
+            last[1][last[2]] = section
+            stack.append((last[0], section))
+        
+        while stack[-1][0] >= indent:
+            stack.pop()
+        
+        if key is None:
+            last = None
+            continue
+        
+        current = stack[-1][1]
+        current[key] = value
+        last = (indent, current, key)
+    
+    return root
+
+
+def pvsyst_find(tree: dict, key: str) -> object:
+
+    """
+            Com esta função é possível obter o valor (ou a seção) da primeira ocorrência de uma chave 
+            no dicionário aninhado gerado por parse_pvsyst. Retorna None caso a chave não exista. 
+            
+            -------------------
+            tree : dict - Recebe o dicionário aninhado.
+            key : str - Recebe a chave buscada.
+    """
+    
+    if key in tree:
+        return tree[key]
+    
+    for value in tree.values():
+        if isinstance(value, dict):
+            found = pvsyst_find(value, key)
+            if found is not None:
+                return found
+    
+    return None
+
+
+def pvsyst_points(section: dict) -> object:
+
+    """
+            Com esta função é possível extrair os pontos 'Point_N' de uma seção de curva do PVSyst 
+            (ex.: 'TCubicProfile') como um array NumPy, uma linha por ponto, na ordem de N. 
+            
+            -------------------
+            section : dict - Recebe a seção da curva.
+    """
+    
+    points = sorted((int(key[6:]), value) for key, value in section.items()
+                    if key.startswith('Point_') and key[6:].isdigit())
+    
+    return np.array([[float(number) for number in value.split(',') if number.strip()]
+                     for _, value in points], dtype=float)
+
+
+class PVModulo:
+
+    def __init__(self, path: str) -> None: 
+         
+        """
+                A função realiza a leitura dos dados do arquivo .PAN. 
+               
+                
+                A função possui somente um argumento.
+                
+                -------------------
+                path : str - Recebe o endereço do aquivo .pan.
+        """
+                
+        def e_gap(pan_data: dict, technol: str) -> float:
+            """
+            Com esta função é obter o valor de energia do gap do semicondutor
+        
+            -------------------
+            technol - recebe a tecnologia do módulo extraída do arquivo .PAN. 
+        
+            """  
+            technol_module = pvsyst_find(pan_data, technol)
+            e_gap = {'mtSiPoly':1.12,
+                     'mtCdTe': 1.5,
+                     'mtSiMono':1.12}
+            
+            return e_gap[technol_module]
+           
+        def value(pan_data: dict, parameter: str) -> float:
+                
+            return float(pvsyst_find(pan_data, parameter))
+        
+        raw, self.content_hash = read_pvsyst_text(path)
+        
+        # Os parâmetros já interpretados são reaproveitados enquanto o conteúdo do arquivo não mudar
+        cache_key = 'pan-' + self.content_hash
+        cached = PARSE_CACHE.get(cache_key)
+        
+        if cached is not None:
+            self.parameters = dict(cached[0])
+            self.iam = cached[1].copy()
+            self.iam_curve = pd.DataFrame({'Angle': self.iam[:, 0], 'FIAM': self.iam[:, 1]})
+            return None
+    
+        pan_data = parse_pvsyst(raw)
+         
+        self.parameters = {'alpha_sc': value(pan_data,'muISC') / 1000, #muISC - Coeficiente de temperatura da corrente de curto circuito
+                           'gamma_ref': value(pan_data,'Gamma'), #Gamma - Fator de idealidade do Diodo
+                           'mu_gamma': value(pan_data,'muGamma'), #muGamma - Coeficiente de temperatura para o fator de idealidade do diodo
+                           'R_sh_ref': value(pan_data,'RShunt'), #RShunt - Resistência shunt em condições de referência
+                           'R_sh_0': value(pan_data,'Rp_0'), #Rp_0 - Resistência shunt em condições de irradiância zero
+                           'R_s': value(pan_data,'RSerie'), #RSerie - Resistência em série nas condições de referência
+                           'cells_in_series': value(pan_data,'NCelS'), #NCelS - Número de células em série
+                           'cells_in_parallel': value(pan_data,'NCelP'), #NCelP - Número de células em paralelo
+                           'R_sh_exp':value(pan_data,'Rp_Exp'), #Rp_Exp - Expoente da equação para resistência de derivação (Padrão 5.5)
+                           'EgRef': e_gap(pan_data,'Technol'), #Bandgap de energia na temperatura de referência
+                           'irrad_ref': value(pan_data,'GRef'), #GRef - Irradiância de referência
+                           'temp_ref': value(pan_data,'TRef') + 273.15 , #TRef - Temperatura de referência [K]
+                           'cell_area': value(pan_data,'CellArea') / 10000,# CellArea
+                           'nominal_power': value(pan_data,'Imp') * value(pan_data,'Vmp'), #PNom = Imp * Vmp
+                           'Imp': value(pan_data,'Imp'),
+                           'Vmp': value(pan_data,'Vmp'),
+                           'Isc_ref': value(pan_data,'Isc'), #Isc
+                           'Voc_ref': value(pan_data,'Voc'), #Voc
+                           'Width': value(pan_data,'Width'),
+                           'Height':  value(pan_data,'Height'),
+                           'surface': value(pan_data,'Width')*value(pan_data,'Height')} 
+
+        # Curva IAM (ângulo de incidência [°], fator IAM)
+        self.iam = pvsyst_points(pvsyst_find(pan_data, 'IAMProfile'))[:9, :2]
+        self.iam_curve = pd.DataFrame({'Angle': self.iam[:, 0], 'FIAM': self.iam[:, 1]})
+         
+        PARSE_CACHE.put(cache_key, (dict(self.parameters), self.iam.copy()))
+         
+
+class Inverter:
+    
+    
+    def __init__(self, path: str) -> None:
+        
+        """
+                A função realiza a leitura dos dados do arquivo .OND. 
+               
+                
+                A função possui somente um argumento.
+                
+                -------------------
+                path : str - Recebe o endereço do aquivo .ond.
+        """
+        
+        def value(ond_data: dict, parameter:str) -> float:
+            
+            if parameter == 'MonoTri':
+                if pvsyst_find(ond_data, parameter) == 'Tri':
+                    return 3
+                elif pvsyst_find(ond_data, parameter) == 'Mono':
+                    return 1
+            else:   
+                return float(pvsyst_find(ond_data, parameter))
+        
+        def ond_read_curves(ond_data: dict) -> dict:
+            """
+            Com esta função é possível extrair as curvas P_dc/P_ac do arquivo .OND, uma para 
+            cada tensão de entrada, como arrays NumPy com as colunas [P_dc, P_ac, eff]. 
+            
+            A curva 'ProfilPIO' é identificada por '' e as curvas 'ProfilPIOV1', 'ProfilPIOV2' e 
+            'ProfilPIOV3' por 'Vmin', 'Vnom' e 'Vmax', nas tensões de 'VNomEff'. Caso o arquivo 
+            possua apenas a curva 'ProfilPIO', ela é utilizada como 'Vnom'.
+        
+            -------------------
+            ond_data - recebe o dicionário aninhado com os dados do arquivo .ond.
+        
+            """
+            profiles = {'': 'ProfilPIO', 'Vmin': 'ProfilPIOV1', 'Vnom': 'ProfilPIOV2', 'Vmax': 'ProfilPIOV3'}
+            
+            v_nom_eff = pvsyst_find(ond_data, 'VNomEff')
+            v_nom_eff = [float(number) for number in v_nom_eff.split(',') if number.strip()] if v_nom_eff else []
+            
+            curves = {}
+            voltages = {}
+            
+            for position, (input_voltage, profile) in enumerate(profiles.items()):
+                section = pvsyst_find(ond_data, profile)
+                if not isinstance(section, dict):
+                    continue
+                
+                points = pvsyst_points(section)[:, :2]
+                
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    eff = points[:, 1]/points[:, 0]
+                
+                # Os pontos não preenchidos da curva (0, 0) são descartados
+                valid = ~np.isnan(eff)
+                curves[input_voltage] = np.column_stack([points[valid], eff[valid]])
+                voltages[input_voltage] = (0 if position == 0 or position > len(v_nom_eff) 
+                                           else v_nom_eff[position - 1])
+            
+            if 'Vnom' not in curves and '' in curves:
+                curves['Vnom'] = curves.pop('')
+                voltages['Vnom'] = voltages.pop('')
+            
+            return curves, voltages
+        
+        raw, self.content_hash = read_pvsyst_text(path)
+        
+        # Os parâmetros já interpretados são reaproveitados enquanto o conteúdo do arquivo não mudar
+        cache_key = 'ond-' + self.content_hash
+        cached = PARSE_CACHE.get(cache_key)
+        
+        if cached is not None:
+            self.parameters = dict(cached[0])
+            self.curves = {input_voltage: curve.copy() for input_voltage, curve in cached[1].items()}
+            self.voltages = dict(cached[2])
+        
+        else:
+            ond_data = parse_pvsyst(raw)
+        
+            self.parameters =  {'PNomConv': value(ond_data,'PNomConv') , #PNomConv - Potência do inversor dada em W
+                                'EfficMax': value(ond_data,'EfficMax'), #EfficMax - Eficiência máxima do inversor
+                                'PMaxOUT': value(ond_data,'PMaxOUT'), #PMaxOUT - Potência máxima de entrada AC
+                                'TPNom': value(ond_data,'TPNom'), #Temperatura de operação para Pnon
+                                'TPMax': value(ond_data,'TPMax'), #Temperatura de operação para Pmax
+                               'VOutConv': value(ond_data,'VOutConv'), #Tensão de saída do conversor
+                               'MonoTri': value(ond_data,'MonoTri')} #Número de fases do inversor
+            
+            self.curves, self.voltages = ond_read_curves(ond_data)
+            
+            # São armazenadas cópias das curvas, que não são compartilhadas com esta instância
+            PARSE_CACHE.put(cache_key, (dict(self.parameters), 
+                                        {input_voltage: curve.copy() for input_voltage, curve in self.curves.items()},
+                                        dict(self.voltages)))
+        
+        # Dataframe com todas as curvas: P_dc, P_ac, eff, input_voltage e VNomEff
+        self.curve = pd.concat([pd.DataFrame({'P_dc': curve[:, 0], 'P_ac': curve[:, 1], 'eff': curve[:, 2],
+                                              'input_voltage': input_voltage, 
+                                              'VNomEff': self.voltages[input_voltage]})
+                                for input_voltage, curve in self.curves.items()], ignore_index=True)
+    
+    def efficiency_grid(self, points: int = 4096) -> dict:
+        
+        """
+                Com esta função é possível obter a tabela de eficiência do inversor em função da potência 
+                DC de entrada (eixo uniforme de points pontos, de 0 à maior potência das curvas) e da 
+                tensão DC de entrada (tensões VNomEff das curvas 'Vmin', 'Vnom' e 'Vmax'). Caso o arquivo 
+                não informe as tensões, a tabela possui apenas a curva 'Vnom'.
+                
+                As curvas são interpoladas (e extrapoladas) linearmente em potência, como no modelo 
+                'vnom'. A tabela é calculada uma única vez para cada arquivo .OND (PARSE_CACHE) e é 
+                compartilhada entre as instâncias, de modo que seus arrays são somente leitura.
+                
+                -------------------
+                points : int - Recebe o número de pontos do eixo de potência.
+                
+                Retorna um dicionário com os eixos 'power' [W] e 'voltage' [V] e a tabela 'eff' (tensão x potência).
+        """
+        
+        key = 'ond-grid-' + cache_key(self.content_hash, points)
+        grid = PARSE_CACHE.get(key)
+        
+        if grid is None:
+            from scipy import interpolate
+            
+            names = [name for name in ['Vmin', 'Vnom', 'Vmax'] if name in self.curves and self.voltages[name] > 0]
+            names = sorted(names, key=lambda name: self.voltages[name]) if len(names) > 0 else ['Vnom']
+            
+            power = np.linspace(0, max(self.curves[name][:, 0].max() for name in names), points)
+            eff = np.array([interpolate.interp1d(self.curves[name][:, 0], self.curves[name][:, 2], 
+                                                 fill_value='extrapolate')(power) for name in names])
+            
+            grid = {'power': power, 'voltage': np.array([self.voltages[name] for name in names], dtype=float), 
+                    'eff': eff}
+            PARSE_CACHE.put(key, grid)
+        
+        for array in grid.values():
+            array.flags.writeable = False
+        
+        return grid
+
+
+# Modelos de eficiência do inversor (ver inverter_stage)
+INVERTER_EFFICIENCY_MODELS = ['vnom', 'voltage']
+
+
+def inverter_efficiency(grid: dict, power: object, voltage: object) -> object:
+
+    """
+            Com esta função é possível obter a eficiência do inversor por interpolação bilinear na 
+            tabela de Inverter.efficiency_grid, para todos os instantes de uma só vez. 
+            
+            O eixo de potência é uniforme, de modo que a posição de cada ponto é obtida diretamente, sem 
+            busca. Acima da maior potência das curvas a eficiência é extrapolada linearmente, como no 
+            modelo 'vnom'. Fora do intervalo de tensões das curvas é utilizada a curva mais próxima. 
+            Nos instantes com potência ou tensão não finitas a eficiência é NaN, como no modelo 'vnom'.
+            
+            -------------------
+            grid : dict - Recebe a tabela de eficiência (ver Inverter.efficiency_grid).
+            power : array - Recebe a potência DC de entrada de cada inversor [W].
+            voltage : array - Recebe a tensão DC de entrada [V].
+    """
+    
+    power, voltage = np.broadcast_arrays(np.asarray(power, dtype=float), np.asarray(voltage, dtype=float))
+    eff = grid['eff'].ravel()
+    points = len(grid['power'])
+    
+    # Os instantes com potência ou tensão não finitas são calculados com zero e retornados como NaN, 
+    # pois um NaN convertido em índice estaria fora da tabela
+    finite = np.isfinite(power) if len(grid['voltage']) == 1 else np.isfinite(power) & np.isfinite(voltage)
+    if not finite.all():
+        power, voltage = np.where(finite, power, 0), np.where(finite, voltage, 0)
+    
+    # Posição no eixo de potência: célula i e fração t (t > 1 na extrapolação acima da tabela)
+    position = power*(1/(grid['power'][1] - grid['power'][0]))
+    i = np.clip(position, 0, points - 2).astype(np.intp)
+    t = position - i
+    
+    if len(grid['voltage']) == 1:
+        efficiency = eff.take(i)*(1 - t) + eff.take(i + 1)*t
+    else:
+        # Posição no eixo de tensão: curva j e fração u, limitada ao intervalo das curvas
+        j = np.clip(np.searchsorted(grid['voltage'], voltage, side='right') - 1, 0, len(grid['voltage']) - 2)
+        u = np.clip((voltage - grid['voltage'].take(j))/(grid['voltage'].take(j + 1) - grid['voltage'].take(j)), 0, 1)
+        
+        # Índices das células na tabela achatada (tensão x potência)
+        cell = j*points + i
+        low = eff.take(cell)*(1 - t) + eff.take(cell + 1)*t
+        high = eff.take(cell + points)*(1 - t) + eff.take(cell + points + 1)*t
+        efficiency = low*(1 - u) + high*u
+    
+    return efficiency if finite.all() else np.where(finite, efficiency, np.nan)
+
+
+@instrumented('clipping')
+def clipping_operating_point(v_mp, v_oc, target_power, photocurrent, saturation_current,
+                             resistance_series, resistance_shunt, nNsVth, modules_in_series: int,
+                             modules_in_parallel: int, current_factor, tolerance: float = 0.1):
+    """
+            Com esta função é possível obter, de uma só vez para todas as horas com clipping, a tensão
+            de operação do arranjo deslocada do MPP em direção ao Voc, na qual a potência entregue
+            (já descontadas as perdas de mismatch e ôhmica na corrente) é igual à potência limitada
+            pelo inversor.
+
+            A busca é feita por bisseção vetorizada no intervalo [v_mp, v_oc], onde a potência do
+            arranjo é monotonicamente decrescente com a tensão.
+
+            -------------------
+            v_mp, v_oc : array - Tensões de máxima potência e de circuito aberto do arranjo [V].
+            target_power : array - Potência DC limitada pelo inversor (EArray) [W].
+            photocurrent, saturation_current, resistance_series, resistance_shunt, nNsVth : array -
+            Parâmetros do modelo de um diodo do módulo.
+            modules_in_series, modules_in_parallel : int - Configuração do arranjo.
+            current_factor : array - Fator aplicado à corrente (1 - MISMATCH_LOSS - FOhmLoss).
+            tolerance : float - Tolerância na tensão do arranjo [V].
+
+            Retorna as tensões [V] e as correntes corrigidas [A] do arranjo.
+    """
+    
+    import pvlib
+
+    v_low = np.asarray(v_mp, dtype=float)
+    v_high = np.asarray(v_oc, dtype=float)
+    target_power = np.asarray(target_power, dtype=float)
+
+    def array_power(v):
+        i = pvlib.pvsystem.i_from_v(resistance_shunt=resistance_shunt,
+                                    resistance_series=resistance_series,
+                                    nNsVth=nNsVth,
+                                    voltage=v/modules_in_series,
+                                    saturation_current=saturation_current,
+                                    photocurrent=photocurrent,
+                                    method='lambertw')*modules_in_parallel*current_factor
+        return i*v, i
+
+    if v_low.size == 0:
+        return v_low, v_low.copy()
+
+    # Número de bisseções necessárias para que o intervalo de cada hora fique abaixo da tolerância. 
+    # Cada hora é bisseccionada apenas até a sua própria tolerância, de modo que o resultado de uma 
+    # hora não depende das demais horas calculadas em conjunto (ex.: simulação por blocos)
+    span = np.nan_to_num(v_high - v_low)
+    iterations = np.ceil(np.log2(np.maximum(span, tolerance)/tolerance))
+
+    for iteration in range(int(iterations.max())):
+        v_mid = 0.5*(v_low + v_high)
+        power, _i = array_power(v_mid)
+        above = power >= target_power
+        active = iteration < iterations
+        v_low = np.where(above & active, v_mid, v_low)
+        v_high = np.where(above | ~active, v_high, v_mid)
+
+    v = 0.5*(v_low + v_high)
+    _p, i = array_power(v)
+
+    return v, np.asarray(i, dtype=float)
+
+
+# Métodos de solução do modelo de um diodo (ver single_diode)
+SINGLE_DIODE_METHODS = ['lambertw', 'newton', 'analytic']
+
+
+@instrumented('single_diode')
+def single_diode(photocurrent, saturation_current, resistance_series, resistance_shunt, nNsVth,
+                 method: str = 'lambertw', tolerance: float = 1e-9, max_iterations: int = 50) -> dict:
+    """
+            Com esta função é possível obter o ponto de máxima potência e a tensão de circuito aberto 
+            do modelo de um diodo, com três métodos de solução:
+            
+            'lambertw' - solução de referência do pvlib (pvlib.pvsystem.singlediode).
+            'newton' - método de Newton vetorizado na tensão do diodo (parametrização de Bishop), 
+            protegido por bisseção, iterado até a convergência.
+            'analytic' - aproximação analítica do MPP (função W de Lambert assintótica, desprezando 
+            Rs e Rsh) corrigida por três passos de Newton, sem iterações até a convergência. O erro 
+            em p_mp é tipicamente inferior a 0,01%.
+            
+            Nos métodos 'newton' e 'analytic' apenas as horas com fotocorrente são calculadas, e cada 
+            hora deixa de ser iterada ao convergir, de modo que o resultado de uma hora não depende das 
+            demais horas calculadas em conjunto. No método 'lambertw' a busca do MPP (seção áurea do 
+            pvlib) itera todas as horas até a convergência da última, e o resultado varia (~1e-8 V) 
+            com o conjunto de horas calculadas.
+
+            -------------------
+            photocurrent, saturation_current, resistance_series, resistance_shunt, nNsVth : array -
+            Parâmetros do modelo de um diodo do módulo.
+            method : str - Recebe o método de solução ('lambertw', 'newton' ou 'analytic').
+            tolerance : float - Tolerância relativa na tensão do diodo (método 'newton').
+            max_iterations : int - Número máximo de iterações (método 'newton').
+
+            Retorna um dicionário com os arrays 'v_mp', 'i_mp', 'p_mp' e 'v_oc' do módulo.
+    """
+    
+    import pvlib
+    
+    if method not in SINGLE_DIODE_METHODS:
+        raise ValueError("Método '%s' inválido, use um de %s" % (method, SINGLE_DIODE_METHODS))
+    
+    if method == 'lambertw':
+        single_diode_output = pvlib.pvsystem.singlediode(photocurrent, saturation_current, resistance_series,
+                                                         resistance_shunt, nNsVth, ivcurve_pnts=None,
+                                                         method='lambertw')
+        return {name: np.asarray(single_diode_output[name], dtype=float) for name in ['v_mp', 'i_mp', 'p_mp', 'v_oc']}
+    
+    parameters = np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in 
+                                       [photocurrent, saturation_current, resistance_series, resistance_shunt, nNsVth]])
+    
+    output = {name: np.zeros(parameters[0].shape) for name in ['v_mp', 'i_mp', 'p_mp', 'v_oc']}
+    
+    lit = parameters[0] > 0
+    args = [value[lit] for value in parameters]
+    I_L, I_0, _R_s, R_sh, n_vt = args
+    
+    iterations = 3 if method == 'analytic' else max_iterations
+    
+    # Tensão de circuito aberto: Newton em i(v_d) = 0 a partir do menor dos limites superiores sem 
+    # Rsh e sem diodo, que fica à direita da raiz (i é côncava e decrescente em v_d), de modo que a 
+    # convergência é monotônica
+    v_oc = np.minimum(pvlib.singlediode.estimate_voc(I_L, I_0, n_vt), I_L*R_sh)
+    
+    active = np.ones(v_oc.shape, dtype=bool)
+    
+    for _ in range(iterations):
+        i = I_L - I_0*np.expm1(v_oc/n_vt) - v_oc/R_sh
+        step = np.where(active, i/(I_0*np.exp(v_oc/n_vt)/n_vt + 1/R_sh), 0)
+        v_oc = v_oc + step
+        active &= np.abs(step) > tolerance*n_vt
+        if not active.any():
+            break
+    
+    # Estimativa analítica do MPP sem Rs e Rsh: (1 + x)*exp(x) = 1 + I_L/I_0, com x = v_d/n_vt,
+    # cuja solução x = W(e*(1 + I_L/I_0)) - 1 usa a expansão assintótica de W. Em baixa irradiância 
+    # a curva é dominada por Rsh e o MPP se aproxima de I_L*R_sh/2
+    L1 = 1 + np.log1p(I_L/I_0)
+    L2 = np.log(L1)
+    v_d = np.minimum(n_vt*(L1 - L2 + L2/L1 - 1), 0.5*I_L*R_sh)
+    
+    # Newton em dp/dv = 0, mantendo v_d no intervalo [0, v_oc] que contém o MPP
+    v_low = np.zeros_like(v_d)
+    v_high = v_oc.copy()
+    active = np.ones(v_d.shape, dtype=bool)
+    
+    for _ in range(iterations):
+        gradients = pvlib.singlediode.bishop88(v_d, *args, gradients=True)
+        dp_dv, d2p_dv_dvd = gradients[6], gradients[7]
+        
+        v_low = np.where(active & (dp_dv > 0), v_d, v_low)
+        v_high = np.where(active & (dp_dv <= 0), v_d, v_high)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            v_new = v_d - dp_dv/d2p_dv_dvd
+        
+        outside = ~((v_new >= v_low) & (v_new <= v_high))
+        v_new = np.where(outside, 0.5*(v_low + v_high), v_new)
+        v_new = np.where(active, v_new, v_d)
+        
+        active &= np.abs(v_new - v_d) > tolerance*n_vt
+        v_d = v_new
+        if not active.any():
+            break
+    
+    i_mp, v_mp, p_mp = pvlib.singlediode.bishop88(v_d, *args)
+    
+    output['v_mp'][lit] = v_mp
+    output['i_mp'][lit] = i_mp
+    output['p_mp'][lit] = p_mp
+    output['v_oc'][lit] = v_oc
+    
+    return output
+
+
+def single_diode_deviation(result: dict, photocurrent, saturation_current, resistance_series, resistance_shunt,
+                           nNsVth, sample: int = None) -> float:
+    """
+            Com esta função é possível obter o desvio relativo máximo de p_mp de um método de solução 
+            do modelo de um diodo em relação à solução de referência (Lambert W), calculada em todas as 
+            horas com fotocorrente (uma solução adicional do modelo de um diodo, apenas nessas horas).
+
+            -------------------
+            result : dict - Recebe o resultado de single_diode.
+            photocurrent, saturation_current, resistance_series, resistance_shunt, nNsVth : array -
+            Parâmetros do modelo de um diodo do módulo.
+            sample : int - Recebe o número máximo de horas comparadas. Caso seja informado, a referência 
+            é calculada numa amostra de até sample horas igualmente espaçadas, e o valor é apenas uma 
+            estimativa (limite inferior) do desvio máximo, que ocorre em geral nas horas de baixa 
+            irradiância. Com None (padrão), todas as horas são comparadas.
+    """
+    
+    parameters = np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in 
+                                       [photocurrent, saturation_current, resistance_series, resistance_shunt, nNsVth]])
+    
+    lit = np.flatnonzero(parameters[0] > 0)
+    
+    if lit.size == 0:
+        return 0.0
+    
+    if sample is not None and lit.size > sample:
+        lit = lit[np.linspace(0, lit.size - 1, sample).astype(int)]
+    
+    reference = single_diode(*[value.ravel()[lit] for value in parameters], method='lambertw')
+    
+    p_mp = np.asarray(result['p_mp']).ravel()[lit]
+    
+    return float(np.max(np.abs(p_mp - reference['p_mp'])/reference['p_mp']))
+
+
+def pvlib_elevation_correction(apparent_elevation_pvlib: object) -> object:
+    """
+    Com esta função é possível realizar o ajuste dos valores de elevação aparente
+    do sol obtidos pelo PVLib com o SPA do NREL, de modo que após o ajuste a curva 
+    de correlação com os dados do PVSyst possua valor de R² igual a 1.
+    
+    A função possui somente um argumento [apparent_elevation_pvlib]
+    
+    -------------------
+    apparent_elevation_pvlib - Recebe os valores de elevação solar aparente calculados pelo PVLib.
+    
+    """
+    
+    return np.where(apparent_elevation_pvlib >= 7, apparent_elevation_pvlib,
+                    np.where((-7 < apparent_elevation_pvlib) & (apparent_elevation_pvlib < 7),
+                             0.5*apparent_elevation_pvlib + 3.5, 0))
+
+
+# Número de horas calculadas de cada vez na geometria solar (ver in_blocks)
+GEOMETRY_BLOCK = 24*366
+
+
+def in_blocks(compute_block: object, size: int, block_size: int = GEOMETRY_BLOCK) -> dict:
+
+    """
+            Com esta função é possível calcular, em blocos de block_size linhas, um resultado em que 
+            cada linha é independente das demais, de modo que os arrays temporários do pvlib ocupam 
+            memória de apenas um bloco de cada vez, mesmo nas séries de vários anos.
+            
+            -------------------
+            compute_block : function - Recebe a função compute_block(slice) que retorna um dicionário de arrays.
+            size : int - Recebe o número de linhas.
+            block_size : int - Recebe o número de linhas de cada bloco.
+    """
+    
+    if size <= block_size:
+        return compute_block(slice(0, size))
+    
+    result = None
+    for start in range(0, size, block_size):
+        block = slice(start, min(start + block_size, size))
+        values = compute_block(block)
+        if result is None:
+            result = {name: np.empty(size, dtype=value.dtype) for name, value in values.items()}
+        for name, value in values.items():
+            result[name][block] = value
+    
+    return result
+
+
+def solar_position(times: object, latitude: float, longitude: float) -> dict:
+
+    """
+            Com esta função é possível obter a elevação (corrigida, ver pvlib_elevation_correction) e o 
+            azimute do sol. O resultado é armazenado no GEOMETRY_CACHE, de modo que sites com as mesmas 
+            coordenadas e a mesma série temporal não recalculam o SPA.
+            
+            -------------------
+            times : DatetimeIndex - Recebe os instantes da simulação.
+            latitude, longitude : float - Recebem as coordenadas do site [°].
+            
+            Retorna um dicionário com os arrays 'HSol' e 'AzSol'.
+    """
+    
+    import pvlib
+    
+    times = pd.DatetimeIndex(times)
+    
+    def compute_block(block: object) -> dict:
+        pvlib_solar_position = pvlib.solarposition.get_solarposition(time=times[block], 
+                                                                     latitude=latitude, 
+                                                                     longitude=longitude)
+        return {'HSol': pvlib_elevation_correction(pvlib_solar_position['apparent_elevation'].values),
+                'AzSol': pvlib_solar_position['azimuth'].values}
+    
+    def compute() -> dict:
+        return in_blocks(compute_block, len(times))
+    
+    key = 'sun-' + cache_key(float(latitude), float(longitude), times.asi8)
+    
+    return GEOMETRY_CACHE.get_or_compute(key, compute)
+
+
+def tracker_geometry(times: object, sun: dict, max_angle: float, gcr: float) -> dict:
+
+    """
+            Com esta função é possível obter a geometria do tracker de eixo horizontal norte-sul com 
+            backtracking. O resultado é armazenado no GEOMETRY_CACHE, indexado pela posição do sol e 
+            pelos parâmetros do tracker.
+            
+            -------------------
+            times : DatetimeIndex - Recebe os instantes da simulação.
+            sun : dict - Recebe a posição do sol (ver solar_position).
+            max_angle : float - Recebe o ângulo máximo de rotação do tracker [°].
+            gcr : float - Recebe o ground coverage ratio (L/D).
+            
+            Retorna um dicionário com os arrays 'AngInc', 'PhiAng', 'surface_tilt' e 'surface_azimuth'.
+    """
+    
+    import pvlib
+    
+    times = pd.DatetimeIndex(times)
+    
+    def compute_block(block: object) -> dict:
+        tracker = pvlib.tracking.singleaxis(apparent_zenith=pd.Series(90 - sun['HSol'][block], index=times[block]),  
+                                            apparent_azimuth=pd.Series(sun['AzSol'][block], index=times[block]),
+                                            axis_tilt=0,
+                                            axis_azimuth=0,
+                                            max_angle=max_angle,
+                                            backtrack=True,
+                                            gcr=gcr)
+        return {'AngInc': tracker['aoi'].values,
+                'PhiAng': tracker['tracker_theta'].values,
+                'surface_tilt': tracker['surface_tilt'].values,
+                'surface_azimuth': tracker['surface_azimuth'].values}
+    
+    def compute() -> dict:
+        return in_blocks(compute_block, len(times))
+    
+    key = 'tracker-' + cache_key(sun['HSol'], sun['AzSol'], float(max_angle), float(gcr))
+    
+    return GEOMETRY_CACHE.get_or_compute(key, compute)
+
+
+def series_step(dates: object) -> object:
+
+    """
+            Com esta função é possível obter o passo de tempo de uma série (mediana dos intervalos entre 
+            registros consecutivos), de uma hora caso a série tenha menos de dois registros.
+    """
+    
+    dates = pd.DatetimeIndex(dates)
+    
+    return pd.Timedelta(np.median(np.diff(dates.asi8))) if len(dates) > 1 else pd.Timedelta(hours=1)
+
+
+def prepare_solar_series(solar_series: object, fuso: int, step: object = None) -> object:
+
+    """
+            Com esta função é possível preparar a série solar lida do arquivo: as datas são convertidas 
+            para o fuso horário do site e o índice corresponde ao centro do intervalo de cada registro, 
+            deslocado de meio passo de tempo (step, por padrão o passo da própria série, ver series_step).
+    """
+    
+    # O formato da série gerada pelo hybridsim é informado explicitamente, o que evita a inferência 
+    # do formato data a data. Outros formatos são inferidos, com o dia antes do mês
+    try:
+        solar_series['date'] = pd.to_datetime(solar_series['time'], format='%d/%m/%Y %H:%M')
+    except (ValueError, TypeError):
+        solar_series['date'] = pd.to_datetime(solar_series['time'], dayfirst=True)
+    solar_series['date'] = \
+                pd.to_datetime(solar_series['date']).dt.tz_localize('UTC').dt.tz_convert('Etc/GMT+'+str(fuso))
+    solar_series['date'] = solar_series['date']  + datetime.timedelta(hours=int(fuso))
+    step = series_step(solar_series['date']) if step is None else step
+    t_shift = solar_series['date'] + step/2
+    solar_series.index =   t_shift
+    
+    return solar_series
+
+
+def file_signature(path: str) -> tuple:
+
+    """
+            Com esta função é possível obter a assinatura (caminho, data de modificação e tamanho) de 
+            um arquivo, usada nas chaves de cache dos resultados que dependem do arquivo.
+    """
+    
+    stat = os.stat(path)
+    
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def series_arrays(solar_series: object) -> dict:
+
+    """
+            Série solar convertida em arrays: instantes (centro do intervalo) e datas em nanossegundos 
+            UTC, e as colunas GHI, DIF, TEMP e WS.
+    """
+    
+    return {'time': solar_series.index.asi8, 
+            'date': pd.DatetimeIndex(solar_series['date']).asi8,
+            'GHI': solar_series['GHI'].values.astype(float),
+            'DIF': solar_series['DIF'].values.astype(float),
+            'TEMP': solar_series['TEMP'].values.astype(float),
+            'WS': solar_series['WS'].values.astype(float)}
+
+
+# Cache das séries solares já interpretadas, indexado pelo arquivo (caminho, data de modificação e 
+# tamanho) e pelo fuso horário
+SERIES_CACHE = MemmapCache(max_entries=16, directory=cache_directory('series'))
+
+
+def load_solar_series(location: object) -> dict:
+
+    """
+            Com esta função é possível obter a série solar de um site já interpretada (ver 
+            read_solar_series e series_arrays). O resultado é armazenado no SERIES_CACHE, de modo que 
+            os sites que usam o mesmo arquivo e o mesmo fuso horário não leem o arquivo novamente. 
+            Com a variável de ambiente CVER_CACHE_DIR definida, o cache é gravado em disco e lido 
+            com mapeamento em memória, compartilhado entre execuções e entre os processos de um lote.
+            
+            -------------------
+            location : object - Recebe objeto onde estão armazenados os parâmetros base da simulação.
+            
+            Retorna um dicionário com os arrays 'time', 'date', 'GHI', 'DIF', 'TEMP' e 'WS'.
+    """
+    
+    # O índice é deslocado de meio passo de tempo da série (ver prepare_solar_series), e não mais de 
+    # 30 minutos: o prefixo distingue as séries gravadas em disco antes dessa mudança
+    key = 'series-step-' + cache_key(file_signature(location.SOLAR_SERIES_FILE), int(location.FUSO))
+    
+    return SERIES_CACHE.get_or_compute(key, lambda: series_arrays(read_solar_series(location)))
+
+
+def read_solar_series(location: object, chunksize: int = None) -> object:
+
+    """
+            Com esta função é possível realizar a leitura da série solar (TMY) de um site (ver 
+            prepare_solar_series).
+            
+            -------------------
+            location : object - Recebe objeto onde estão armazenados os parâmetros base da simulação.
+            chunksize : int - Recebe o número de linhas de cada bloco. Caso seja informado, retorna um 
+            iterador sobre os blocos da série, que é lida aos poucos. O passo de tempo do primeiro bloco é 
+            usado em todos os blocos (ver prepare_solar_series).
+    """
+    
+    if chunksize is None:
+        return prepare_solar_series(pd.read_csv(location.SOLAR_SERIES_FILE), location.FUSO)
+    
+    def chunks():
+        step = None
+        for chunk in pd.read_csv(location.SOLAR_SERIES_FILE, chunksize=chunksize):
+            chunk = prepare_solar_series(chunk, location.FUSO, step)
+            step = series_step(chunk['date']) if step is None else step
+            yield chunk
+    
+    return chunks()
+
+
+"""
+        Etapas da simulação. 
+        
+        Cada etapa recebe os resultados das etapas anteriores (dicionários de arrays) e os parâmetros 
+        do site (location) e retorna um dicionário de arrays. As séries temporais podem ter formato (T,) 
+        ou (T, 1) e os parâmetros do site podem ser escalares ou arrays (S,), de modo que a mesma etapa 
+        calcula um único cenário ou S cenários de uma só vez (arrays T x S, ver scenario_sweep).
+"""
+
+
+def meteo_stage(solar_series: object) -> dict:
+
+    """
+            MetData: dados meteorológicos da série solar.
+    """
+    
+    return {'GlobHor': np.asarray(solar_series['GHI'], dtype=float),
+            'DiffHor': np.asarray(solar_series['DIF'], dtype=float),
+            'T_Amb': np.asarray(solar_series['TEMP'], dtype=float),
+            'WindVel': np.asarray(solar_series['WS'], dtype=float)}
+
+
+def atmosphere_stage(times: object, sun: dict) -> dict:
+
+    """
+            Irradiação extraterrestre e massa de ar, que dependem apenas da série temporal e da posição do sol.
+    """
+    
+    import pvlib
+    
+    ZSol = 90 - sun['HSol']
+    
+    # Irradiação extraterrestre (ou topo da atmosfera, ToA) numa superfície normal ao sol
+    dni_extra = pvlib.irradiance.get_extra_radiation(datetime_or_doy=pd.DatetimeIndex(times)).values
+    
+    # Massa de ar absoluta (ajustada à pressão) 
+    airmass = pvlib.atmosphere.get_absolute_airmass(pvlib.atmosphere.get_relative_airmass(zenith=ZSol))
+    
+    return {'dni_extra': np.reshape(dni_extra, np.shape(ZSol)), 'airmass': airmass}
+
+
+def transposition_stage(meteo: dict, sun: dict, atmosphere: dict, tracker: dict, location: object) -> dict:
+
+    """
+            Transpo: transposição da irradiação para o plano do tracker.
+    """
+    
+    import pvlib
+    
+    ZSol = 90 - sun['HSol']
+    
+    """Note que o PVsyst não permite fornecer as três componentes ao mesmo tempo, apenas duas. O time de projetos solares da
+        Casa dos Ventos optou por usar a irradiação global horizontal (GHI) e a componente difusa (DIF), por entender que são
+        dados mais robustos. No início e no final do dia, o cálculo da irradiação direta envolve a divisão por um número pequeno,
+        o que pode levar (e leva) a imprecisões de origem numérica."""
+        
+    BeamHor = (meteo['GlobHor'] - meteo['DiffHor'])/np.cos(np.radians(ZSol))
+    
+    # Irradiação direta no plano inclinado
+    BeamInc = pvlib.irradiance.beam_component(surface_tilt=tracker['surface_tilt'],
+                                              surface_azimuth=tracker['surface_azimuth'],
+                                              solar_zenith=ZSol,
+                                              solar_azimuth=sun['AzSol'],
+                                              dni=BeamHor)
+    
+    # Irradiação difusa no plano inclinado, modelo de Perez-Ineichen.
+    DifSInc = pvlib.irradiance.perez(surface_tilt=tracker['surface_tilt'],
+                                     surface_azimuth=tracker['surface_azimuth'],
+                                     dhi=meteo['DiffHor'],
+                                     dni=BeamHor,
+                                     dni_extra=atmosphere['dni_extra'],
+                                     solar_zenith=ZSol,
+                                     solar_azimuth=sun['AzSol'],
+                                     airmass=atmosphere['airmass'])
+    
+    DifSInc = np.where(np.isnan(DifSInc), 0, DifSInc)
+    
+    # Irradiação refletida do solo no plano inclinado
+    Alb_Inc = pvlib.irradiance.get_ground_diffuse(tracker['surface_tilt'],
+                                                  meteo['GlobHor'],
+                                                  albedo=location.ALBEDO)
+    
+    # Irradiação global no plano inclinado
+    GlobInc = BeamInc + DifSInc + Alb_Inc
+    
+    return {'BeamHor': BeamHor, 'BeamInc': BeamInc, 'DifSInc': DifSInc, 'Alb_Inc': Alb_Inc, 'GlobInc': GlobInc}
+
+
+def shading_loss_factors(HSol: object, AzSol: object, tracker: dict, gcr: float) -> dict:
+
+    """
+            Com esta função é possível obter os fatores de perda por sombreamento próximo do tracker a 
+            partir da posição do sol e da geometria do tracker: 'beam' (fração da irradiação direta 
+            sombreada), 'diffuse' (fração da irradiação difusa sombreada) e 'albedo' (pi - |PhiAng|, 
+            ver incidence_stage).
+    """
+    
+    import pvlib
+    
+    # Vetor da direção do Sol (x,y,z)
+    sun_x = np.cos(np.radians(HSol)) * np.sin(np.radians(AzSol))
+    
+    sun_z = np.sin(np.radians(HSol))
+    
+    # Os cálculos subsequentes serão feitos em radianos
+    theta = np.deg2rad(tracker['PhiAng'])
+    
+    # É obtido o ângulo do sol relativo ao plano xz
+    psi = np.arctan2(sun_x, sun_z)
+    
+    #Near shading bean loss
+    # beam_loss_factor = perda / total 
+    beam_loss_factor = (np.tan(psi) * np.tan(theta) + 1 - 1/(gcr * np.cos(theta))) /\
+        (np.tan(psi) * np.tan(theta) + 1)
+    
+    # Aplica 0 nos valores negativos
+    beam_loss_factor = np.where(beam_loss_factor < 0, 0, beam_loss_factor)
+    
+    #Near shading diffuse loss
+    
+    masking_angle = pvlib.shading.masking_angle(surface_tilt = tracker['surface_tilt'], 
+                                                gcr = gcr, 
+                                                slant_height = 0)
+    
+    shading_loss_factor = pvlib.shading.sky_diffuse_passias(masking_angle)
+    
+    return {'beam': beam_loss_factor, 'diffuse': shading_loss_factor, 'albedo': math.pi - abs(theta)}
+
+
+def iam_loss_factor(iam: object, AngInc: object) -> object:
+
+    """
+            Com esta função é possível obter o fator de IAM da irradiação direta, interpolando a curva 
+            de IAM do arquivo .PAN (colunas ângulo e fator) no ângulo de incidência.
+    """
+    
+    from scipy import interpolate
+    
+    tck = interpolate.interp1d(iam[:, 0], iam[:, 1], fill_value='extrapolate')
+    
+    return tck(AngInc)
+
+
+# Fatores das tabelas de sombreamento e IAM (ver shading_table)
+SHADING_FACTORS = ['beam', 'diffuse', 'albedo', 'iam']
+
+
+# Número de subdivisões de cada célula das tabelas de shading_table na verificação do erro da interpolação
+SHADING_CHECK = 4
+
+
+def shading_table(max_angle: float, gcr: float, modulo: object, tolerance: float, step: float = 0.5) -> dict:
+
+    """
+            Com esta função é possível obter as tabelas dos fatores de sombreamento próximo e de IAM 
+            (ver SHADING_FACTORS) em função da elevação (0 a 90°) e do azimute do sol (0 a 360°), em 
+            passos de step graus. Com a geometria do tracker fixada por MAX_ANGLE e GCR, os fatores 
+            dependem apenas da posição do sol. O valor em cada nó é calculado exatamente, com a 
+            mesma geometria do tracker da simulação (ver tracker_geometry).
+            
+            O erro da interpolação bilinear é verificado numa grade de (SHADING_CHECK + 1)² pontos de cada 
+            célula, incluindo as arestas, pois os fatores são fortemente não lineares próximo do horizonte 
+            e nas transições do backtracking. As células com erro acima de tolerance em algum desses pontos 
+            e fatores são marcadas em 'exact', e nelas os fatores são calculados exatamente (ver 
+            shading_factors). A verificação é amostral: entre os pontos da grade o erro pode exceder 
+            tolerance. As tabelas são armazenadas no GEOMETRY_CACHE, indexadas por 
+            MAX_ANGLE, GCR, arquivo .PAN, tolerance e step.
+            
+            A função possui cinco argumentos.
+            
+            -------------------
+            max_angle : float - Recebe o ângulo máximo de rotação do tracker [°].
+            gcr : float - Recebe o ground coverage ratio (L/D).
+            modulo : object - Recebe objeto com os dados do arquivo .PAN (curva de IAM).
+            tolerance : float - Recebe o erro admitido nos fatores interpolados, nos pontos verificados.
+            step : float - Recebe o passo das tabelas em elevação e azimute [°].
+    """
+    
+    import pvlib
+    
+    def exact(HSol, AzSol):
+        HSol, AzSol = [np.ravel(value) for value in np.broadcast_arrays(HSol, AzSol)]
+        tracker = pvlib.tracking.singleaxis(apparent_zenith=pd.Series(90 - HSol), 
+                                            apparent_azimuth=pd.Series(AzSol),
+                                            axis_tilt=0,
+                                            axis_azimuth=0,
+                                            max_angle=max_angle,
+                                            backtrack=True,
+                                            gcr=gcr)
+        tracker = {'PhiAng': tracker['tracker_theta'].values, 'surface_tilt': tracker['surface_tilt'].values, 
+                   'AngInc': tracker['aoi'].values}
+        factors = shading_loss_factors(HSol, AzSol, tracker, gcr)
+        factors['iam'] = iam_loss_factor(modulo.iam, tracker['AngInc'])
+        return factors
+    
+    def compute() -> dict:
+        elevation = np.linspace(0, 90, int(round(90/step)) + 1)
+        azimuth = np.linspace(0, 360, int(round(360/step)) + 1)
+        shape = (len(elevation), len(azimuth))
+        
+        nodes = {name: np.reshape(value, shape) for name, value in exact(elevation[:, None], azimuth[None, :]).items()}
+        
+        # Erro da interpolação bilinear numa grade com SHADING_CHECK subdivisões de cada célula em elevação 
+        # e em azimute: cada célula é verificada nos (SHADING_CHECK + 1)² pontos da grade que contém, 
+        # incluindo as arestas, compartilhadas com as células vizinhas
+        fine_elevation = np.linspace(0, 90, SHADING_CHECK*(shape[0] - 1) + 1)
+        fine_azimuth = np.linspace(0, 360, SHADING_CHECK*(shape[1] - 1) + 1)
+        HSol, AzSol = [np.ravel(value) for value in np.meshgrid(fine_elevation, fine_azimuth, indexing='ij')]
+        fine = exact(HSol, AzSol)
+        interpolated = shading_lookup(dict(nodes, elevation=elevation, azimuth=azimuth, 
+                                           exact=np.zeros((shape[0] - 1, shape[1] - 1), dtype=bool)), HSol, AzSol)
+        
+        error = np.zeros(len(HSol))
+        for name in SHADING_FACTORS:
+            with np.errstate(invalid='ignore'):
+                deviation = np.abs(interpolated[name] - fine[name])
+            error = np.fmax(error, np.where(np.isnan(interpolated[name]) | np.isnan(fine[name]), np.inf, deviation))
+        
+        error = np.reshape(error, (len(fine_elevation), len(fine_azimuth)))
+        for axis in [0, 1]:
+            windows = np.lib.stride_tricks.sliding_window_view(error, SHADING_CHECK + 1, axis=axis)
+            error = np.take(windows, np.arange(0, windows.shape[axis], SHADING_CHECK), axis=axis).max(axis=-1)
+        
+        table = {'elevation': elevation, 'azimuth': azimuth, 'exact': error > tolerance}
+        table.update(nodes)
+        return table
+    
+    key = 'shading-' + cache_key(float(max_angle), float(gcr), modulo.content_hash, float(tolerance), float(step))
+    
+    return GEOMETRY_CACHE.get_or_compute(key, compute)
+
+
+def shading_lookup(table: dict, HSol: object, AzSol: object) -> dict:
+
+    """
+            Com esta função é possível obter os fatores de sombreamento e de IAM por interpolação 
+            bilinear nas tabelas de shading_table, para todos os instantes de uma só vez. Os eixos são 
+            uniformes, de modo que a célula de cada instante é obtida diretamente, sem busca. 
+            
+            Retorna os fatores (ver SHADING_FACTORS) e o array 'exact', que indica os instantes em 
+            células cuja interpolação não atende à tolerância da tabela.
+    """
+    
+    elevation, azimuth = table['elevation'], table['azimuth']
+    columns = len(azimuth)
+    
+    x = np.asarray(HSol, dtype=float)*(1/(elevation[1] - elevation[0]))
+    y = np.asarray(AzSol, dtype=float)*(1/(azimuth[1] - azimuth[0]))
+    i = np.clip(x, 0, len(elevation) - 2).astype(np.intp)
+    j = np.clip(y, 0, columns - 2).astype(np.intp)
+    t = np.clip(x - i, 0, 1)
+    u = np.clip(y - j, 0, 1)
+    
+    cell = i*columns + j
+    factors = {}
+    
+    for name in SHADING_FACTORS:
+        value = table[name].ravel()
+        factors[name] = (value.take(cell)*(1 - u) + value.take(cell + 1)*u)*(1 - t) +\
+            (value.take(cell + columns)*(1 - u) + value.take(cell + columns + 1)*u)*t
+    
+    factors['exact'] = table['exact'].ravel().take(i*(columns - 1) + j)
+    
+    return factors
+
+
+def shading_factors(sun: dict, tracker: dict, max_angle: float, gcr: float, modulo: object, 
+                    tolerance: float) -> dict:
+
+    """
+            Com esta função é possível obter os fatores de sombreamento próximo e de IAM (ver 
+            SHADING_FACTORS) pelas tabelas de shading_table. Nos instantes em células em que a verificação 
+            da tabela (ver shading_table) não atende à tolerância, os fatores são 
+            calculados exatamente, com a geometria do tracker já calculada. 
+            
+            MAX_ANGLE e GCR podem ser arrays (um valor por coluna, ver scenario_sweep): é usada uma 
+            tabela para cada coluna.
+    """
+    
+    shape = np.broadcast(sun['HSol'], tracker['PhiAng']).shape
+    HSol, AzSol = np.broadcast_to(sun['HSol'], shape), np.broadcast_to(sun['AzSol'], shape)
+    max_angle, gcr = np.broadcast_to(max_angle, shape[1:]), np.broadcast_to(gcr, shape[1:])
+    
+    factors = {name: np.empty(shape) for name in SHADING_FACTORS}
+    
+    for index in np.ndindex(*shape[1:]):
+        column = (slice(None),) + index
+        
+        table = shading_table(float(max_angle[index]), float(gcr[index]), modulo, tolerance)
+        values = shading_lookup(table, HSol[column], AzSol[column])
+        
+        rows = np.flatnonzero(values.pop('exact'))
+        if rows.size > 0:
+            subset = {name: np.broadcast_to(tracker[name], shape)[column][rows] 
+                      for name in ['PhiAng', 'surface_tilt', 'AngInc']}
+            exact = shading_loss_factors(HSol[column][rows], AzSol[column][rows], subset, float(gcr[index]))
+            exact['iam'] = iam_loss_factor(modulo.iam, subset['AngInc'])
+            for name in SHADING_FACTORS:
+                values[name][rows] = exact[name]
+        
+        for name in SHADING_FACTORS:
+            factors[name][column] = values[name]
+    
+    return factors
+
+
+def incidence_stage(meteo: dict, sun: dict, tracker: dict, transposition: dict, modulo: object, location: object,
+                    shading_tolerance: float = None) -> dict:
+
+    """
+            IncColl: perdas por sombreamento próximo, IAM e sujidade.
+            
+            Com shading_tolerance = None, os fatores de sombreamento e de IAM são calculados exatamente 
+            em cada instante. Caso contrário, são interpolados em tabelas por posição do sol, com o erro 
+            verificado em pontos de cada célula das tabelas (ver shading_table e shading_factors).
+    """
+    
+    #Near Shading Loss
+    
+    if shading_tolerance is None:
+        with section('shading'):
+            factors = shading_loss_factors(sun['HSol'], sun['AzSol'], tracker, location.GCR)
+        
+        with section('iam'):
+            factors['iam'] = iam_loss_factor(modulo.iam, tracker['AngInc'])
+    
+    else:
+        with section('shading'):
+            factors = shading_factors(sun, tracker, location.MAX_ANGLE, location.GCR, modulo, shading_tolerance)
+    
+    #Obtém a perdas na componente direta fazendo a ponderação da componente direta pelo fator de perda
+    ShdBLss = transposition['BeamInc'] * factors['beam']
+    
+    #Near shading diffuse loss
+    ShdDLss = meteo['DiffHor']*factors['diffuse']
+    
+    #Near shadings albedo loss
+    C_albedo = 1.15
+
+    ShdALss = C_albedo*location.GCR*transposition['Alb_Inc']*factors['albedo']
+    
+    #Near shadings loss
+    ShdLoss = ShdBLss + ShdDLss + ShdALss
+    
+    beam_after_shading = transposition['BeamInc'] - ShdBLss
+
+    diff_after_shading = transposition['DifSInc'] - ShdDLss
+    
+    albedo_after_shading = transposition['Alb_Inc'] - ShdALss
+    
+    #Global corrected for shadings
+    GlobShd = beam_after_shading + diff_after_shading + albedo_after_shading
+    
+    #IAM Loss
+    
+    # Incidence beam loss
+    
+    beam_after_iam = beam_after_shading * factors['iam']
+
+    diff_after_iam = diff_after_shading
+
+    albedo_after_iam = albedo_after_shading
+    
+    #Global corrected for IAM
+    GlobIAM = beam_after_iam + diff_after_iam + albedo_after_iam
+    
+    # Soiling Loss
+    
+    SlgLoss = GlobIAM * location.SOILING_LOSS
+    
+    # Global corrected for Soiling
+    GlobSlg = GlobIAM - SlgLoss
+    
+    # Global effective
+    
+    GlobEff = GlobSlg
+    
+    return {'ShdBLss': ShdBLss, 'ShdDLss': ShdDLss, 'ShdALss': ShdALss, 'ShdLoss': ShdLoss, 'GlobShd': GlobShd,
+            'GlobIAM': GlobIAM, 'SlgLoss': SlgLoss, 'GlobSlg': GlobSlg, 'GlobEff': GlobEff}
+
+
+def module_reference(modulo: object) -> dict:
+
+    """
+            Com esta função é possível obter os parâmetros do modelo de um diodo do módulo nas 
+            condições de referência (STC), calculados a partir dos dados do arquivo .PAN.
+            
+            -------------------
+            modulo : object - Recebe objeto com os dados do arquivo .PAN.
+    """
+    
+    import pvlib
+    from scipy import constants
+    
+    # A eficiência na condição de operação padrão é calculada como sendo a razão da 
+    #potência nominal pela potência disponível na área do painel. 
+    stc_efficiency = \
+        modulo.parameters['nominal_power'] /\
+        (modulo.parameters['surface'] * modulo.parameters['irrad_ref'])
+        
+    # Tensão térmica
+    #Vt = k * T / q
+    Vt = constants.Boltzmann * modulo.parameters['temp_ref'] / constants.e 
+    
+    # Cálculo da corrente de saturação do diodo a partir das condições (0, V_oc) e (I_sc, 0)
+    #I_0 = (Isc  - (Voc - Isc * Rs) / Rsh) * math.exp(-Voc / (ns * ni * Vt))
+    I_0 = ((modulo.parameters['Isc_ref']  - (modulo.parameters['Voc_ref'] - 
+            modulo.parameters['Isc_ref'] * modulo.parameters['R_s']) / 
+            modulo.parameters['R_sh_ref']) * math.exp(-modulo.parameters['Voc_ref'] / 
+            (modulo.parameters['cells_in_series'] * modulo.parameters['gamma_ref'] * Vt))) 
+                                                     
+    #I_ph = I_0 * math.exp(Voc / (ni * ns * Vt)) + Voc / Rsh
+    #Cálculo da fotocorrente pela equação obtida em (0, V_oc)
+    I_ph = (I_0 * math.exp(modulo.parameters['Voc_ref'] / (modulo.parameters['gamma_ref'] * 
+        modulo.parameters['cells_in_series'] * Vt)) + modulo.parameters['Voc_ref'] 
+            / modulo.parameters['R_sh_ref']) 
+    
+    # Stc parameter
+    single_diode_stc = pvlib.pvsystem.singlediode(I_ph, I_0, modulo.parameters['R_s'], modulo.parameters['R_sh_ref'],
+                                                  modulo.parameters['gamma_ref'] * modulo.parameters['cells_in_series'] * Vt)
+    
+    return {'stc_efficiency': stc_efficiency, 'Vt': Vt, 'I_0': I_0, 'I_ph': I_ph,
+            'p_mp': float(single_diode_stc['p_mp']), 'i_mp': float(single_diode_stc['i_mp'])}
+
+
+def module_stage(meteo: dict, incidence: dict, modulo: object, location: object, 
+                 single_diode_method: str = 'lambertw', single_diode_sample: int = None) -> dict:
+
+    """
+            Ponto de operação de um módulo: temperatura das células e modelo de um diodo.
+            
+            Depende apenas de U_c, U_v, LID_LOSS e QUALITY_LOSS do local, e não do número de módulos 
+            e inversores, de modo que pode ser compartilhado entre cenários (ver scenario_sweep).
+    """
+    
+    import pvlib
+    
+    reference = module_reference(modulo)
+    stc_efficiency = reference['stc_efficiency']
+    GlobEff = incidence['GlobEff']
+    
+    TArray = pvlib.temperature.pvsyst_cell( poa_global=GlobEff, 
+                                            temp_air=meteo['T_Amb'], 
+                                            wind_speed=meteo['WindVel'] , 
+                                            u_c = location.U_c, 
+                                            u_v = location.U_v, 
+                                            eta_m = stc_efficiency, 
+                                            alpha_absorption = 0.9)
+                        
+    pvsyst_params = pvlib.pvsystem.calcparams_pvsyst(effective_irradiance = GlobEff*(1-location.LID_LOSS-location.QUALITY_LOSS), #Irradiância que é convertida em fotocorrente
+                                             temp_cell = TArray, #temperatura média das células
+                                             alpha_sc = modulo.parameters['alpha_sc'], #Coeficiente de temperatura da corrente de curto circuito
+                                             gamma_ref = modulo.parameters['gamma_ref'], #Fator de idealidade do diodo
+                                             mu_gamma = modulo.parameters['mu_gamma'], #Coeficiente de temperatura para o fator de idealidade do diodo 
+                                             I_L_ref = reference['I_ph'], #Fotocorrente nas condições de referência
+                                             I_o_ref = reference['I_0'], #Corrente de saturação reversa nas condições de referência
+                                             R_sh_ref = modulo.parameters['R_sh_ref'], #Resistência shunt em condições de referência
+                                             R_sh_0 = modulo.parameters['R_sh_0'], #Resistência shunt em condições de irradiância zero
+                                             R_s = modulo.parameters['R_s'], #Resistência série
+                                             cells_in_series = modulo.parameters['cells_in_series'], #Número de células em série
+                                             R_sh_exp=5.5, #The exponent in the equation for shunt resistance
+                                             EgRef = modulo.parameters['EgRef'], #Bandgap de engergia na temperatura de referência
+                                             irrad_ref = modulo.parameters['irrad_ref'], #Irradiância de referência
+                                             temp_ref = modulo.parameters['temp_ref']- 273.15) #Temperatura da célula de referência em Célsius
+
+    photocurrent, saturation_current, resistance_series, resistance_shunt, nNsVth = \
+        np.broadcast_arrays(*[np.asarray(value, dtype=float) for value in pvsyst_params])
+    
+    single_diode_output = single_diode(photocurrent,
+                                       saturation_current,
+                                       resistance_series,
+                                       resistance_shunt,
+                                       nNsVth,
+                                       method=single_diode_method)
+    
+    if single_diode_method == 'lambertw':
+        p_mp_deviation = 0.0
+    else:
+        p_mp_deviation = single_diode_deviation(single_diode_output, photocurrent, saturation_current, 
+                                                resistance_series, resistance_shunt, nNsVth, 
+                                                sample=single_diode_sample)
+    
+    return {'TArray': TArray, 'p_mp_deviation': p_mp_deviation,
+            'v_mp': single_diode_output['v_mp'], 'v_oc': single_diode_output['v_oc'], 
+            'i_mp': single_diode_output['i_mp'], 'p_mp': single_diode_output['p_mp'],
+            'photocurrent': photocurrent, 'saturation_current': saturation_current, 
+            'resistance_series': resistance_series, 'resistance_shunt': resistance_shunt, 'nNsVth': nNsVth}
+
+
+def array_stage(meteo: dict, incidence: dict, modulo: object, location: object, 
+                single_diode_method: str = 'lambertw', single_diode_sample: int = None, 
+                module: dict = None) -> dict:
+
+    """
+            Array: temperatura das células, modelo de um diodo e perdas ôhmica e de mismatch do arranjo.
+            
+            O modelo de um diodo é resolvido pelo método single_diode_method (ver single_diode). Com 
+            métodos diferentes da referência ('lambertw'), o desvio relativo máximo de p_mp em relação 
+            à referência em todas as horas com irradiação (ou, caso single_diode_sample seja informado, 
+            numa amostra de single_diode_sample horas, ver single_diode_deviation) é retornado em 
+            'p_mp_deviation'.
+            
+            O ponto de operação de um módulo já calculado por module_stage pode ser passado em module.
+    """
+    
+    reference = module_reference(modulo)
+    stc_efficiency = reference['stc_efficiency']
+    GlobEff = incidence['GlobEff']
+    
+    # Potência Nominal
+    EArrNom = GlobEff *stc_efficiency*\
+                modulo.parameters['surface'] *\
+                location.MODULES_IN_SERIES *\
+                location.MODULES_IN_PARALLEL
+
+    if module is None:
+        module = module_stage(meteo, incidence, modulo, location, single_diode_method, single_diode_sample)
+    
+    #Os parâmetros de operação são escalados para que sejam obtidos os parâmetros de todo o sistema
+    v_mp = module['v_mp'] * location.MODULES_IN_SERIES
+    v_oc = module['v_oc'] * location.MODULES_IN_SERIES
+    i_mp = module['i_mp'] * location.MODULES_IN_PARALLEL
+    p_mp = module['p_mp'] * location.MODULES_IN_SERIES * location.MODULES_IN_PARALLEL
+    
+    # Ohmic wiring loss
+
+    #Cálculo do R_dc equivalente para as condições de operação padrão
+    R_equiv_dc = location.STC_OHM_LOSS * (reference['p_mp'] * location.MODULES_IN_SERIES * location.MODULES_IN_PARALLEL) /\
+        ((reference['i_mp'] * location.MODULES_IN_PARALLEL) ** 2)
+    
+    # Horas sem irradiância efetiva, nas quais as perdas e a energia do arranjo são nulas
+    no_irradiance = GlobEff == 0
+
+    #Cálculo da perda ôhmica aplicando a resistência equivalente às condições normais de operação do sistema
+    OhmLoss = R_equiv_dc * (i_mp ** 2)
+    OhmLoss = np.where(no_irradiance, 0, OhmLoss)
+   
+    #EM AVALIAÇÃO
+    with np.errstate(divide='ignore', invalid='ignore'):
+        FOhmLoss = OhmLoss/p_mp
+    
+    # MisLoss
+    
+    MisLoss = p_mp * location.MISMATCH_LOSS
+    MisLoss = np.where(no_irradiance, 0, MisLoss)
+    
+    # Array virtual energy at MPP                    
+    
+    EArrMPP = p_mp - OhmLoss - MisLoss
+    EArrMPP = np.where(no_irradiance, 0, EArrMPP)
+    
+    return {'EArrNom': EArrNom, 'TArray': module['TArray'], 'OhmLoss': OhmLoss, 'FOhmLoss': FOhmLoss, 
+            'MisLoss': MisLoss, 'EArrMPP': EArrMPP, 'R_equiv_dc': R_equiv_dc, 
+            'p_mp_deviation': module['p_mp_deviation'], 'UArray': v_mp, 'IArray': i_mp, 'VocArray': v_oc,
+            'photocurrent': module['photocurrent'], 'saturation_current': module['saturation_current'], 
+            'resistance_series': module['resistance_series'], 'resistance_shunt': module['resistance_shunt'], 
+            'nNsVth': module['nNsVth']}
+
+
+def inverter_stage(meteo: dict, incidence: dict, array: dict, inversor: object, location: object,
+                   clipping_tolerance: float = 0.1, inverter_efficiency_model: str = 'vnom') -> dict:
+
+    """
+            Inverter: eficiência e limite de potência do inversor, clipping e ponto de operação do arranjo.
+            
+            Com inverter_efficiency_model = 'vnom', a eficiência é obtida da curva do arquivo .OND na 
+            tensão nominal. Com 'voltage', é obtida da tabela potência x tensão das curvas Vmin, Vnom 
+            e Vmax (ver Inverter.efficiency_grid), na tensão do MPP do arranjo.
+    """
+    
+    import pvlib
+    from scipy import interpolate
+    
+    if inverter_efficiency_model not in INVERTER_EFFICIENCY_MODELS:
+        raise ValueError("Modelo de eficiência '%s' inválido, use um de %s" % (inverter_efficiency_model, 
+                                                                              INVERTER_EFFICIENCY_MODELS))
+    
+    GlobEff = incidence['GlobEff']
+    EArrMPP = array['EArrMPP']
+    no_irradiance = GlobEff == 0
+    
+    #Curva de eficiência do inversor 
+    
+    if inverter_efficiency_model == 'voltage':
+        eff_inverter = inverter_efficiency(inversor.efficiency_grid(), EArrMPP/location.INVERTERS, array['UArray'])
+    
+    else:
+        efficiency_curve = inversor.curves['Vnom']
+    
+        eff = interpolate.interp1d(efficiency_curve[:, 0], 
+                                   efficiency_curve[:, 2],
+                                   fill_value='extrapolate')
+    
+        eff_inverter = eff(EArrMPP/location.INVERTERS)
+    
+    eff_inverter = np.where(eff_inverter > 0, eff_inverter, 0)
+    
+    #Potência AC máxima de entrada dos Inversores
+    PMaxOUT = np.where(location.PMAX_OUT == 0, inversor.parameters['PMaxOUT'], location.PMAX_OUT)*1000*location.INVERTERS
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        
+        #Potência DC máxima de entrada dos Inversores com base na curva de eficiência 
+        PMaxIN = PMaxOUT/eff_inverter
+        
+        #Corficientes da curva de correção térmica do Inversor
+        a = (inversor.parameters['PMaxOUT'] - inversor.parameters['PNomConv'])/(inversor.parameters['TPMax'] - inversor.parameters['TPNom'])
+        b = (inversor.parameters['PMaxOUT'] - inversor.parameters['TPMax']*a)
+        
+        #Corrige o valor da potência DC máxima de entrada em função da curva potência x temperatura
+        no_derate = (meteo['T_Amb'] <= inversor.parameters['TPMax']) | (GlobEff < location.GHI_MIN_THRESHOLD)
+        
+        PMaxIN = np.where(no_derate, PMaxIN, ((((a*meteo['T_Amb']) + b)/eff_inverter)*1000*location.INVERTERS))
+        
+        #Calcula a potência AC de saída do inversor
+        EOutInv = pvlib.inverter.pvwatts(*np.broadcast_arrays(EArrMPP, PMaxIN, eff_inverter))
+    
+    EOutInv = np.where(np.isnan(EOutInv), 0, EOutInv)
+    
+    # Aplicação do Clipping na Pmpp
+    EArray = np.where(PMaxIN > EArrMPP, EArrMPP, PMaxIN)
+    
+    # Ponto de operação no clipping: a tensão é deslocada do MPP em direção ao Voc até que a
+    # potência entregue seja igual à potência limitada pelo inversor
+    shape = np.broadcast(EArrMPP, PMaxIN, array['UArray']).shape
+    clipped = np.broadcast_to(EArrMPP > PMaxIN, shape)
+    
+    def subset(value):
+        return np.broadcast_to(value, shape)[clipped]
+    
+    current_factor = 1 - location.MISMATCH_LOSS - array['FOhmLoss']
+    
+    v_clipped, _ = clipping_operating_point(
+        v_mp=subset(array['UArray']),
+        v_oc=subset(array['VocArray']),
+        target_power=subset(EArray),
+        photocurrent=subset(array['photocurrent']),
+        saturation_current=subset(array['saturation_current']),
+        resistance_series=subset(array['resistance_series']),
+        resistance_shunt=subset(array['resistance_shunt']),
+        nNsVth=subset(array['nNsVth']),
+        modules_in_series=subset(location.MODULES_IN_SERIES),
+        modules_in_parallel=subset(location.MODULES_IN_PARALLEL),
+        current_factor=subset(current_factor),
+        tolerance=clipping_tolerance)
+
+    UArray = np.array(np.broadcast_to(array['UArray'], shape), dtype=float)
+    UArray[clipped] = v_clipped
+
+    UArray = np.where(no_irradiance, 0, UArray*current_factor)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        IArray = EArray/UArray
+    IArray = np.where(np.isnan(IArray), 0, IArray)
+    IArray = np.where(no_irradiance, 0, IArray)
+    
+    return {'eff_inverter': eff_inverter, 'PMaxIN': PMaxIN, 'EOutInv': EOutInv, 'EArray': EArray,
+            'UArray': UArray, 'IArray': IArray}
+
+
+def ac_losses_stage(inverter: dict, modulo: object, inversor: object, location: object) -> dict:
+
+    """
+            Perdas ôhmicas AC e perdas no transformador de média tensão.
+    """
+    
+    #Perdas ôhmicas AC
+    P_AC_STC = (modulo.parameters['nominal_power']*location.MODULES_IN_SERIES*location.MODULES_IN_PARALLEL)*\
+        (inversor.parameters['EfficMax']/100)
+
+    Phase = inversor.parameters['MonoTri']
+
+    VOutConv = inversor.parameters['VOutConv']*(Phase**0.5)
+    
+    Rac = (location.STC_OHM_LOSS_AC*VOutConv)/\
+        ((P_AC_STC)/(VOutConv))
+
+    IoutConv = inverter['EOutInv']/(VOutConv)
+    
+    EACOhmL = ((Phase**0.5) * ((IoutConv)**2)*Rac)/3
+
+    # Perdas no Medium Voltage Transformer
+
+    Res_EMVTrfL = (P_AC_STC*location.COPPER_LOSS/((P_AC_STC/VOutConv)**2))
+
+    EMVTrfL = (IoutConv**(2))*(Res_EMVTrfL) + P_AC_STC*location.IRON_LOSS
+
+    Res_EMVOhmL = (P_AC_STC*location.MV_LOSS_STC/((P_AC_STC/VOutConv)**2))
+
+    EMVOhmL = (IoutConv**(2))*(Res_EMVOhmL)
+
+    E_Grid = inverter['EOutInv'] - EACOhmL - EMVTrfL - EMVOhmL
+    
+    return {'EACOhmL': EACOhmL, 'EMVTrfL': EMVTrfL, 'EMVOhmL': EMVOhmL, 'E_Grid': E_Grid}
+
+
+# Colunas de simulation_output, na ordem das etapas da simulação
+OUTPUT_COLUMNS = ['HSol', 'AzSol', 'AngInc', 'PhiAng', 'GlobHor', 'DiffHor', 'BeamHor', 'T_Amb', 'WindVel',
+                  'BeamInc', 'DifSInc', 'Alb_Inc', 'GlobInc', 'ShdBLss', 'ShdDLss', 'ShdALss', 'ShdLoss', 'GlobShd',
+                  'GlobIAM', 'SlgLoss', 'GlobSlg', 'GlobEff', 'EArrNom', 'TArray', 'OhmLoss', 'MisLoss', 'EArrMPP',
+                  'EOutInv', 'EArray', 'UArray', 'IArray', 'EACOhmL', 'EMVTrfL', 'EMVOhmL', 'E_Grid']
+
+
+# Perfis de saída da simulação (colunas de simulation_output): 'minimal' para os arquivos .csv, 
+# 'loss-chain' com as colunas comparáveis à exportação horária do PVsyst e 'full' com todas as colunas
+OUTPUT_PROFILES = {'minimal': ['GlobHor', 'E_Grid'],
+                   'loss-chain': ['HSol', 'AzSol', 'AngInc', 'PhiAng', 'GlobHor', 'DiffHor', 'BeamHor', 'T_Amb', 
+                                  'WindVel', 'BeamInc', 'DifSInc', 'Alb_Inc', 'GlobInc', 'ShdLoss', 'GlobShd', 
+                                  'GlobIAM', 'SlgLoss', 'GlobEff', 'EArrNom', 'TArray', 'OhmLoss', 'MisLoss', 
+                                  'EArrMPP', 'EOutInv', 'EArray', 'UArray', 'IArray', 'EACOhmL', 'EMVTrfL', 
+                                  'EMVOhmL', 'E_Grid'],
+                   'full': OUTPUT_COLUMNS}
+
+
+def series_stage(location: object) -> dict:
+
+    """
+            Série solar do site convertida em arrays (ver load_solar_series).
+    """
+    
+    return load_solar_series(location)
+
+
+def series_times(series: dict, fuso: int, column: str = 'time') -> object:
+
+    """
+            Com esta função é possível reconstruir o DatetimeIndex (no fuso horário do site) a partir 
+            dos instantes da etapa series.
+    """
+    
+    return pd.DatetimeIndex(series[column]).tz_localize('UTC').tz_convert('Etc/GMT+'+str(fuso))
+
+
+class Stage:
+    
+    def __init__(self, name: str, compute: object, inputs: list = (), parameters: list = (), 
+                 files: list = (), modulo: bool = False, inversor: bool = False, options: list = ()) -> None:
         
-        self.simulation_output['MisLoss'] = (scaled_value['p_mp']) * location.MISMATCH_LOSS
-        self.simulation_output['MisLoss'] = [0 if row['GlobEff']==0 else row['MisLoss'] for index, row in self.simulation_output.iterrows()]
+        """
+                Declaração de uma etapa da simulação.
+                
+                O resultado da etapa é armazenado no STAGE_CACHE com uma chave formada pelas chaves das 
+                etapas de entrada, pelos valores dos parâmetros declarados e, caso declarados, pela 
+                assinatura dos arquivos e pelo hash dos arquivos .PAN/.OND. Assim, ao alterar um 
+                parâmetro, apenas as etapas que dependem dele (direta ou indiretamente) são recalculadas.
+                
+                -------------------
+                name : str - Recebe o nome da etapa.
+                compute : function - Recebe a função compute(results, location, modulo, inversor, options), 
+                que retorna um dicionário de arrays. results contém os resultados das etapas de entrada.
+                inputs : list - Recebe os nomes das etapas das quais a etapa depende.
+                parameters : list - Recebe os parâmetros do site (atributos de DataLocations) usados pela etapa.
+                files : list - Recebe os parâmetros do site que são caminhos de arquivos lidos pela etapa.
+                modulo, inversor : bool - Indicam se a etapa usa os dados do arquivo .PAN/.OND.
+                options : list - Recebe as opções da simulação usadas pela etapa (ex.: clipping_tolerance).
+        """
         
+        self.name = name
+        self.compute = compute
+        self.inputs = list(inputs)
+        self.parameters = list(parameters)
+        self.files = list(files)
+        self.modulo = modulo
+        self.inversor = inversor
+        self.options = list(options)
+    
+    def key(self, input_keys: dict, location: object, modulo: object, inversor: object, options: dict) -> str:
+        
+        return cache_key(self.name,
+                         [input_keys[name] for name in self.inputs],
+                         [(parameter, getattr(location, parameter)) for parameter in self.parameters],
+                         [file_signature(getattr(location, parameter)) for parameter in self.files],
+                         modulo.content_hash if self.modulo else None,
+                         inversor.content_hash if self.inversor else None,
+                         [(option, options[option]) for option in self.options])
+
+
+class StageLocation:
+    
+    """
+            Visão dos parâmetros do site restrita aos parâmetros declarados pela etapa. O acesso a um 
+            parâmetro não declarado gera um erro, de modo que a chave de cache de cada etapa sempre 
+            contém todos os parâmetros dos quais o resultado depende.
+    """
+    
+    def __init__(self, location: object, stage: object) -> None:
         
-        # Array virtual energy at MPP                    
+        self._location = location
+        self._stage = stage
+    
+    def __getattr__(self, parameter: str) -> object:
         
-        self.simulation_output['EArrMPP']  = scaled_value['p_mp'] - self.simulation_output['OhmLoss'] - self.simulation_output['MisLoss']
-        self.simulation_output['EArrMPP'] = [0 if row['GlobEff']==0 else row['EArrMPP'] for index, row in self.simulation_output.iterrows()]
+        if parameter not in self._stage.parameters and parameter not in self._stage.files:
+            raise AttributeError("A etapa '%s' não declara o parâmetro '%s'" % (self._stage.name, parameter))
         
+        return getattr(self._location, parameter)
+
+
+def daylight_index(GlobHor: object, DiffHor: object) -> object:
+
+    """
+            Com esta função é possível obter os índices das horas com irradiação (GlobHor ou DiffHor 
+            não nulas). Nas demais horas a irradiação em todas as etapas é nula, de modo que as etapas 
+            pesadas (transposição, sombreamento, IAM, modelo de um diodo e inversor) são calculadas 
+            apenas nas horas com irradiação. 
+            
+            O critério usa a irradiação e não a elevação do sol (HSol), pois a série solar pode ter 
+            irradiação com o sol abaixo do horizonte (crepúsculo), e essas horas fazem parte da saída.
+    """
+    
+    return np.flatnonzero((np.asarray(GlobHor) != 0) | (np.asarray(DiffHor) != 0))
+
+
+def take_rows(result: dict, index: object) -> dict:
+
+    """
+            Com esta função é possível selecionar as linhas (primeiro eixo, tempo) dos arrays do 
+            resultado de uma etapa. Os valores escalares são mantidos.
+    """
+    
+    return {name: value[index] if np.ndim(value) > 0 else value for name, value in result.items()}
+
+
+def scatter_rows(result: dict, index: object, size: int, night: dict = None) -> dict:
+
+    """
+            Com esta função é possível devolver à série completa (size linhas) os arrays de uma etapa 
+            calculados apenas nas linhas index (ver take_rows). As demais linhas recebem zero ou, para 
+            as grandezas de night, o valor informado (array com size linhas).
+    """
+    
+    night = {} if night is None else night
+    output = {}
+    
+    for name, value in result.items():
+        value = np.asarray(value)
         
+        if value.ndim == 0:
+            output[name] = value
+            continue
         
+        if name in night:
+            full = np.array(np.broadcast_to(night[name], (size,) + value.shape[1:]), dtype=value.dtype)
+        else:
+            full = np.zeros((size,) + value.shape[1:], dtype=value.dtype)
         
-        # Modelo do inversor
+        full[index] = value
+        output[name] = full
+    
+    return output
+
+
+def on_daylight(compute: object, night: object = None) -> object:
+
+    """
+            Com esta função é possível executar o cálculo de uma etapa (ver Stage) apenas nas horas com 
+            irradiação (etapa 'daylight'), devolvendo o resultado à série completa. 
+            
+            -------------------
+            compute : function - Recebe a função de cálculo da etapa.
+            night : function - Recebe a função night(results) que retorna os valores das grandezas não 
+            nulas nas horas sem irradiação (ex.: TArray = T_Amb).
+    """
+    
+    def daylight_compute(results, location, modulo, inversor, options):
+        index = results['daylight']['index']
+        size = int(results['daylight']['size'])
+        subset = {name: take_rows(result, index) for name, result in results.items() if name != 'daylight'}
+        result = compute(subset, location, modulo, inversor, options)
+        return scatter_rows(result, index, size, night(results) if night is not None else None)
+    
+    return daylight_compute
+
+
+def _stage_meteo(results, location, modulo, inversor, options):
+    
+    return meteo_stage(results['series'])
+
+
+# Etapas da simulação, na ordem de execução
+SIMULATION_STAGES = [
+    Stage('series', lambda results, location, modulo, inversor, options: series_stage(location),
+          parameters=['FUSO'], files=['SOLAR_SERIES_FILE']),
+    Stage('sun', lambda results, location, modulo, inversor, options: 
+          solar_position(series_times(results['series'], location.FUSO), location.LAT, location.LON),
+          inputs=['series'], parameters=['FUSO', 'LAT', 'LON']),
+    Stage('tracker', lambda results, location, modulo, inversor, options: 
+          tracker_geometry(series_times(results['series'], location.FUSO), results['sun'], 
+                           location.MAX_ANGLE, location.GCR),
+          inputs=['series', 'sun'], parameters=['FUSO', 'MAX_ANGLE', 'GCR']),
+    Stage('meteo', _stage_meteo, inputs=['series']),
+    Stage('daylight', lambda results, location, modulo, inversor, options: 
+          {'index': daylight_index(results['meteo']['GlobHor'], results['meteo']['DiffHor']), 
+           'size': len(results['meteo']['GlobHor'])},
+          inputs=['meteo']),
+    Stage('atmosphere', lambda results, location, modulo, inversor, options: 
+          atmosphere_stage(series_times(results['series'], location.FUSO), results['sun']),
+          inputs=['series', 'sun'], parameters=['FUSO']),
+    Stage('transposition', on_daylight(lambda results, location, modulo, inversor, options: 
+          transposition_stage(results['meteo'], results['sun'], results['atmosphere'], results['tracker'], location)),
+          inputs=['daylight', 'meteo', 'sun', 'atmosphere', 'tracker'], parameters=['ALBEDO']),
+    Stage('incidence', on_daylight(lambda results, location, modulo, inversor, options: 
+          incidence_stage(results['meteo'], results['sun'], results['tracker'], results['transposition'], 
+                          modulo, location, options['shading_tolerance'])),
+          inputs=['daylight', 'meteo', 'sun', 'tracker', 'transposition'], 
+          parameters=['GCR', 'MAX_ANGLE', 'SOILING_LOSS'], modulo=True, options=['shading_tolerance']),
+    Stage('array', on_daylight(lambda results, location, modulo, inversor, options: 
+          array_stage(results['meteo'], results['incidence'], modulo, location, 
+                      options['single_diode_method'], options['single_diode_sample']),
+          # Sem irradiação a temperatura das células é igual à temperatura ambiente
+          night=lambda results: {'TArray': results['meteo']['T_Amb']}),
+          inputs=['daylight', 'meteo', 'incidence'], 
+          parameters=['MODULES_IN_SERIES', 'MODULES_IN_PARALLEL', 'U_c', 'U_v', 'LID_LOSS', 'QUALITY_LOSS', 
+                      'STC_OHM_LOSS', 'MISMATCH_LOSS'], 
+          modulo=True, options=['single_diode_method', 'single_diode_sample']),
+    Stage('inverter', on_daylight(lambda results, location, modulo, inversor, options: 
+          inverter_stage(results['meteo'], results['incidence'], results['array'], inversor, location, 
+                         options['clipping_tolerance'], options['inverter_efficiency_model'])),
+          inputs=['daylight', 'meteo', 'incidence', 'array'], 
+          parameters=['INVERTERS', 'PMAX_OUT', 'GHI_MIN_THRESHOLD', 'MISMATCH_LOSS', 'MODULES_IN_SERIES', 
+                      'MODULES_IN_PARALLEL'],
+          inversor=True, options=['clipping_tolerance', 'inverter_efficiency_model']),
+    Stage('ac_losses', lambda results, location, modulo, inversor, options: 
+          ac_losses_stage(results['inverter'], modulo, inversor, location),
+          inputs=['inverter'], 
+          parameters=['MODULES_IN_SERIES', 'MODULES_IN_PARALLEL', 'STC_OHM_LOSS_AC', 'COPPER_LOSS', 
+                      'IRON_LOSS', 'MV_LOSS_STC'],
+          modulo=True, inversor=True)]
+
+
+# Valores padrão das opções da simulação usadas pelas etapas
+SIMULATION_OPTIONS = {'clipping_tolerance': 0.1, 'single_diode_method': 'lambertw', 'single_diode_sample': None,
+                      'inverter_efficiency_model': 'vnom', 'shading_tolerance': None}
+
+
+# Cache dos resultados das etapas da simulação, indexado pela chave de cada etapa (ver Stage)
+STAGE_CACHE = ArrayCache(max_entries=128, directory=cache_directory('stages'), max_memory_bytes=512*2**20)
+
+
+def transient_stage_cache() -> object:
+
+    """
+            Com esta função é possível obter um cache das etapas que não mantém resultados em memória, 
+            apenas na pasta em disco do STAGE_CACHE (caso configurada). É usado quando os resultados 
+            intermediários não serão reaproveitados (perfis de saída diferentes de 'full' e processos 
+            de simulation_batch), pois o STAGE_CACHE manteria em memória os arrays liberados da saída.
+    """
+    
+    return ArrayCache(max_entries=0, directory=STAGE_CACHE.directory, max_disk_bytes=STAGE_CACHE.max_disk_bytes)
+
+
+def run_stages(location: object, modulo: object, inversor: object, stages: list = None, 
+               cache: object = None, given: dict = None, outputs: list = None, **options) -> tuple:
+
+    """
+            Com esta função é possível executar as etapas da simulação, reaproveitando os resultados 
+            das etapas cujas entradas não mudaram desde a última execução.
+            
+            A função possui sete argumentos, além das opções da simulação (ver SIMULATION_OPTIONS).
+            
+            -------------------
+            location : object - Recebe objeto onde estão armazenados os parâmetros base da simulação.
+            modulo : object - Recebe objeto com os dados do arquivo .PAN.
+            inversor : object - Recebe objeto com os dados do arquivo .OND.
+            stages : list - Recebe a lista de etapas (Stage). Por padrão, SIMULATION_STAGES.
+            cache : object - Recebe o cache dos resultados. Por padrão, STAGE_CACHE.
+            given : dict - Recebe resultados já calculados de algumas etapas (etapa -> resultado), 
+            ex.: {'series': series_arrays(bloco)} para simular um bloco da série solar.
+            outputs : list - Recebe os nomes dos arrays que devem ser retornados. Caso seja informada, os 
+            demais arrays de cada etapa são liberados assim que as etapas que dependem dela são executadas 
+            (os arrays mantidos pelo cache não são afetados).
+            
+            Retorna o dicionário etapa -> resultado e o relatório etapa -> 'reused'/'recomputed'/'given'.
+    """
+    
+    stages = SIMULATION_STAGES if stages is None else stages
+    cache = STAGE_CACHE if cache is None else cache
+    options = dict(SIMULATION_OPTIONS, **options)
+    given = {} if given is None else given
+    
+    keys = {}
+    results = {}
+    report = OrderedDict()
+    
+    # Número de etapas que ainda usarão o resultado de cada etapa
+    consumers = {stage.name: sum(stage.name in later.inputs for later in stages) for stage in stages}
+    
+    def release(stage):
         
-        #Curva de eficiência do inversor 
+        for name in stage.inputs:
+            consumers[name] -= 1
         
-        efficiency_curve = inversor.curve[inversor.curve['input_voltage']=='Vnom']
+        for name in set(stage.inputs) | {stage.name}:
+            if outputs is not None and consumers[name] == 0:
+                results[name] = {key: value for key, value in results[name].items() if key in outputs}
+    
+    for stage in stages:
+        if stage.name in given:
+            result = {name: np.asarray(value) for name, value in given[stage.name].items()}
+            keys[stage.name] = 'given-' + cache_key(stage.name, *[result[name] for name in sorted(result)])
+            results[stage.name] = result
+            report[stage.name] = 'given'
+            release(stage)
+            continue
+        
+        keys[stage.name] = key = 'stage-' + stage.key(keys, location, modulo, inversor, options)
+        result = cache.get(key)
+        
+        if result is None:
+            inputs = {name: results[name] for name in stage.inputs}
+            with section(stage.name):
+                result = stage.compute(inputs, StageLocation(location, stage), modulo, inversor, options)
+            result = cache.put(key, {name: np.asarray(value) for name, value in result.items()})
+            report[stage.name] = 'recomputed'
+        else:
+            report[stage.name] = 'reused'
         
-        eff = interpolate.interp1d(efficiency_curve['P_dc'].astype(float), 
-                                   efficiency_curve['eff'].astype(float),
-                                   fill_value='extrapolate')
+        results[stage.name] = result
+        release(stage)
+    
+    return results, report
+
+
+@instrumented('output')
+def stage_output(stages: dict, location: object, columns: list = None, float32: bool = False) -> object:
+
+    """
+            Com esta função é possível montar o dataframe de saída da simulação (colunas date e 
+            OUTPUT_COLUMNS, ou as colunas informadas, ver OUTPUT_PROFILES) a partir dos resultados das 
+            etapas (ver run_stages). Com float32 = True, as colunas são armazenadas em float32.
+    """
+    
+    columns = OUTPUT_COLUMNS if columns is None else columns
+    
+    results = {}
+    for name in ['sun', 'tracker', 'meteo', 'transposition', 'incidence', 'array', 'inverter', 'ac_losses']:
+        results.update(stages[name])
+    
+    output = {'date': series_times(stages['series'], location.FUSO, column='date')}
+    output.update({column: results[column].astype(np.float32) if float32 else results[column] for column in columns})
+    
+    return pd.DataFrame(output, index=series_times(stages['series'], location.FUSO))
+
+
+class Simulation:
+
+    def __init__(self, location:object, modulo:object, inversor:object, clipping_tolerance: float = 0.1,
+                 single_diode_method: str = 'lambertw', single_diode_sample: int = None, 
+                 output_profile: str = 'full', float32: bool = False, inverter_efficiency_model: str = 'vnom', 
+                 shading_tolerance: float = None, cache: object = None):
+
+        """
+                A função realiza a simulação horária da usina para uma localidade.
+                
+                A simulação é executada por etapas (ver SIMULATION_STAGES e run_stages): ao simular 
+                novamente um site com parâmetros alterados, apenas as etapas que dependem dos parâmetros 
+                alterados são recalculadas. O relatório das etapas reaproveitadas e recalculadas fica em 
+                self.stage_report.
+
+
+                A função possui onze argumentos.
+
+                -------------------
+                location : object - Recebe objeto onde estão armazenados os parâmetros base da simulação.
+                modulo : object - Recebe objeto com os dados do arquivo .PAN.
+                inversor : object - Recebe objeto com os dados do arquivo .OND.
+                clipping_tolerance : float - Tolerância [V] na busca da tensão de operação nas horas com clipping.
+                single_diode_method : str - Recebe o método de solução do modelo de um diodo ('lambertw', 
+                'newton' ou 'analytic', ver single_diode). O desvio relativo máximo de p_mp em relação 
+                ao método de referência ('lambertw') fica em self.single_diode_deviation.
+                single_diode_sample : int - Recebe o número de horas usadas no cálculo do desvio. Com None 
+                (padrão), todas as horas com irradiação; caso seja informado, o desvio é uma estimativa 
+                amostral (ver single_diode_deviation).
+                output_profile : str - Recebe o perfil de saída ('minimal', 'loss-chain' ou 'full', ver 
+                OUTPUT_PROFILES). Os resultados intermediários que não fazem parte da saída são liberados 
+                ao longo da simulação e, com o cache padrão, não são mantidos em memória no STAGE_CACHE.
+                float32 : bool - Armazena as colunas de simulation_output em float32.
+                inverter_efficiency_model : str - Recebe o modelo de eficiência do inversor: 'vnom' (curva 
+                na tensão nominal) ou 'voltage' (tabela potência x tensão, ver inverter_stage).
+                shading_tolerance : float - Recebe o erro admitido nos fatores de sombreamento e de IAM 
+                interpolados nas tabelas por posição do sol, verificado em pontos de cada célula (ver 
+                shading_table). Com None (padrão), os 
+                fatores são calculados exatamente.
+                cache : object - Recebe o cache dos resultados das etapas. Por padrão, STAGE_CACHE com o 
+                perfil 'full' e transient_stage_cache() com os demais perfis.
+        """
         
-        self.simulation_output['eff_inverter'] = eff(self.simulation_output['EArrMPP']/location.INVERTERS)
+        if output_profile not in OUTPUT_PROFILES:
+            raise ValueError("Perfil de saída '%s' inválido, use um de %s" % (output_profile, list(OUTPUT_PROFILES)))
         
-        self.simulation_output['eff_inverter'] = self.simulation_output['eff_inverter'].apply(lambda x: max(0, x))
+        columns = OUTPUT_PROFILES[output_profile]
         
-        #Potência AC máxima de entrada dos Inversores
-        if location.PMAX_OUT == 0:
-            PMaxOUT = inversor.parameters['PMaxOUT']*1000*location.INVERTERS
-        else:
-            PMaxOUT = location.PMAX_OUT*1000*location.INVERTERS
+        if cache is None:
+            cache = STAGE_CACHE if output_profile == 'full' else transient_stage_cache()
         
+        stages, self.stage_report = run_stages(location, modulo, inversor, cache=cache,
+                                               outputs=['time', 'date', 'R_equiv_dc', 'p_mp_deviation'] + columns,
+                                               clipping_tolerance=clipping_tolerance,
+                                               single_diode_method=single_diode_method, 
+                                               single_diode_sample=single_diode_sample,
+                                               inverter_efficiency_model=inverter_efficiency_model,
+                                               shading_tolerance=shading_tolerance)
         
-        #Potência DC máxima de entrada dos Inversores com base na curva de eficiência 
-        self.simulation_output['PMaxIN']=(PMaxOUT/self.simulation_output['eff_inverter'])
+        self.R_equiv_dc = float(stages['array']['R_equiv_dc'])
+        self.single_diode_deviation = float(stages['array']['p_mp_deviation'])
         
-        #Corficientes da curva de correção térmica do Inversor
-        a = (inversor.parameters['PMaxOUT'] - inversor.parameters['PNomConv'])/(inversor.parameters['TPMax'] - inversor.parameters['TPNom'])
-        b = (inversor.parameters['PMaxOUT'] - inversor.parameters['TPMax']*a)
+        if single_diode_method != 'lambertw':
+            logging.info('Modelo de um diodo (%s): desvio máximo de p_mp em relação ao lambertw de %.4f%% (%s)', 
+                         single_diode_method, 100*self.single_diode_deviation, 
+                         'todas as horas' if single_diode_sample is None else 
+                         'estimativa numa amostra de %d horas' % single_diode_sample)
+        
+        self.simulation_output = stage_output(stages, location, columns=columns, float32=float32)
+
+
+def simulation_stream(location: object, modulo: object, inversor: object, output_file: str, 
+                      chunk_size: int = 24*366, clipping_tolerance: float = 0.1, 
+                      single_diode_method: str = 'lambertw', single_diode_sample: int = None, 
+                      float32: bool = False) -> dict:
+
+    """
+            Com esta função é possível simular séries solares longas (ex.: séries plurianuais ou 
+            sub-horárias) com memória limitada: a série é lida em blocos de chunk_size linhas, cada 
+            bloco passa pelas etapas da simulação e a saída (colunas de simulation_output) é acrescentada 
+            ao arquivo output_file (.csv, separado por ';', ou .h5, ver create_hdf5) ao final de cada bloco.
+            
+            Cada registro é simulado de forma independente dos demais, de modo que o resultado reproduz 
+            o da simulação da série completa (Simulation) com o mesmo método do modelo de um diodo. Com 
+            'newton' e 'analytic' o resultado é idêntico. Com o método padrão, 'lambertw' (o mesmo de 
+            Simulation), a busca do MPP do pvlib depende do conjunto de horas calculadas em conjunto, e 
+            os blocos podem diferir da série completa em ~1e-10 (relativo). Nas séries sub-horárias, o 
+            índice de cada registro é deslocado de meio passo de tempo da série (ver prepare_solar_series).
+            
+            A função possui nove argumentos.
+            
+            -------------------
+            location : object - Recebe objeto onde estão armazenados os parâmetros base da simulação.
+            modulo : object - Recebe objeto com os dados do arquivo .PAN.
+            inversor : object - Recebe objeto com os dados do arquivo .OND.
+            output_file : str - Recebe o caminho do arquivo de saída. Um arquivo existente é substituído.
+            chunk_size : int - Recebe o número de linhas da série solar em cada bloco.
+            clipping_tolerance : float - Tolerância [V] na busca da tensão de operação nas horas com clipping.
+            single_diode_method : str - Recebe o método de solução do modelo de um diodo (ver single_diode).
+            single_diode_sample : int - Recebe o número de horas de cada bloco usadas no cálculo do desvio 
+            do modelo de um diodo. Com None (padrão), todas as horas com irradiação.
+            float32 : bool - Grava as colunas do arquivo .h5 em float32.
+            
+            Retorna um dicionário com o número de linhas ('rows') e de blocos ('chunks'), o desvio 
+            máximo de p_mp ('single_diode_deviation') e a soma de cada coluna da saída multiplicada pelo 
+            passo de tempo da série [h] ('sums'), isto é, a energia [Wh] e a irradiação [Wh/m²] da série.
+    """
+    
+    # Os resultados dos blocos não são armazenados no cache das etapas
+    cache = ArrayCache(max_entries=0)
+    
+    summary = {'rows': 0, 'chunks': 0, 'single_diode_deviation': 0.0, 'sums': None}
+    step = None
+    
+    if os.path.exists(output_file):
+        os.remove(output_file)
+    
+    for solar_series in read_solar_series(location, chunksize=chunk_size):
+        # Passo de tempo da série [h], o mesmo em todos os blocos (ver read_solar_series)
+        step = series_step(solar_series['date'])/pd.Timedelta(hours=1) if step is None else step
         
-       
+        stages, _ = run_stages(location, modulo, inversor, cache=cache, 
+                               given={'series': series_arrays(solar_series)},
+                               clipping_tolerance=clipping_tolerance, 
+                               single_diode_method=single_diode_method,
+                               single_diode_sample=single_diode_sample)
         
-        #Corrige o valor da potência DC máxima de entrada em função da curva potência x temperatura
-        self.simulation_output['PMaxIN'] = [row['PMaxIN'] 
-                                            if (row['T_Amb']<=inversor.parameters['TPMax'])|(row['GlobEff']<location.GHI_MIN_THRESHOLD)  
-                                            else (((((a)*row['T_Amb'])+b)/row['eff_inverter'])*1000*location.INVERTERS) 
-                                            for index, row in self.simulation_output.iterrows()]
+        output = stage_output(stages, location)
+        
+        if output_file.endswith(('.h5', '.hdf5')):
+            create_hdf5(location, output, output_file, float32=float32, append=True)
+        else:
+            output.to_csv(output_file, sep=';', index=False, mode='a', header=summary['chunks'] == 0)
         
+        sums = output[OUTPUT_COLUMNS].sum()*step
+        summary['sums'] = sums if summary['sums'] is None else summary['sums'] + sums
+        summary['rows'] += len(output)
+        summary['chunks'] += 1
+        summary['single_diode_deviation'] = max(summary['single_diode_deviation'], 
+                                                float(stages['array']['p_mp_deviation']))
         
-        #Calcula a potência AC de saída do inversor
-        self.simulation_output['EOutInv'] = pvlib.inverter.pvwatts(pdc=self.simulation_output['EArrMPP'],
-                                                                    pdc0= self.simulation_output['PMaxIN'],
-                                                                    eta_inv_nom=self.simulation_output['eff_inverter'])
+        del stages, output
+    
+    return summary
+
+
+def scenario_location(location: object, parameters: dict) -> object:
+
+    """
+            Com esta função é possível obter uma cópia dos parâmetros do site (DataLocations) em que 
+            alguns parâmetros são substituídos por arrays (S,), um valor por cenário. O GCR é 
+            recalculado a partir de L e D.
+            
+            -------------------
+            location : object - Recebe objeto onde estão armazenados os parâmetros base da simulação.
+            parameters : dict - Recebe o dicionário parâmetro -> array de valores.
+    """
+    
+    import copy
+    
+    scenario = copy.copy(location)
+    
+    for parameter, values in parameters.items():
+        setattr(scenario, parameter, np.asarray(values))
+    
+    scenario.GCR = np.asarray(scenario.L / scenario.D, dtype=float)
+    
+    return scenario
+
+
+# Parâmetros dos quais dependem a geometria do tracker, a transposição, a incidência e o ponto de operação 
+# de um módulo (module_stage), compartilhados em scenario_sweep pelos cenários em que são iguais
+SCENARIO_GROUP_PARAMETERS = ['MAX_ANGLE', 'GCR', 'ALBEDO', 'SOILING_LOSS', 'U_c', 'U_v', 'LID_LOSS', 'QUALITY_LOSS']
+
+
+def scenario_sweep(location: object, modulo: object, inversor: object, grid: dict, 
+                   block_size: int = 16, clipping_tolerance: float = 0.1, 
+                   single_diode_method: str = 'lambertw', shading_tolerance: float = None) -> object:
+
+    """
+            Com esta função é possível simular várias configurações da usina para um mesmo site de uma 
+            só vez (ex.: variação do pitch D e da razão Pnom via MODULES_IN_PARALLEL/INVERTERS). 
+            
+            As etapas que não dependem dos parâmetros variados (posição do sol, massa de ar, irradiação 
+            extraterrestre e dados meteorológicos) são calculadas uma única vez. A geometria do tracker 
+            é calculada uma vez para cada par (MAX_ANGLE, GCR) distinto, e a transposição, a incidência e 
+            o ponto de operação de um módulo (modelo de um diodo) uma vez para cada combinação distinta 
+            de SCENARIO_GROUP_PARAMETERS. Apenas o escalonamento do arranjo, o inversor e as perdas AC 
+            são calculados como arrays (tempo x cenário): numa variação de MODULES_IN_PARALLEL ou 
+            INVERTERS o modelo de um diodo é resolvido uma única vez. Os cenários são processados em 
+            blocos de block_size cenários para limitar a memória.
+            
+            A função possui oito argumentos.
+            
+            -------------------
+            location : object - Recebe objeto onde estão armazenados os parâmetros base da simulação.
+            modulo : object - Recebe objeto com os dados do arquivo .PAN.
+            inversor : object - Recebe objeto com os dados do arquivo .OND.
+            grid : dict - Recebe o dicionário parâmetro -> lista de valores (ex.: {'D': [5, 5.5, 6], 
+            'MODULES_IN_PARALLEL': [500, 600]}). São simuladas todas as combinações.
+            block_size : int - Recebe o número de cenários calculados simultaneamente.
+            clipping_tolerance : float - Tolerância [V] na busca da tensão de operação nas horas com clipping.
+            single_diode_method : str - Recebe o método de solução do modelo de um diodo (ver single_diode).
+            shading_tolerance : float - Recebe o erro admitido nos fatores de sombreamento e de IAM 
+            interpolados nas tabelas por posição do sol, verificado em pontos de cada célula (ver 
+            shading_table), reaproveitadas entre 
+            cenários e execuções com o mesmo par (MAX_ANGLE, GCR). Com None, são calculados exatamente.
+            
+            Retorna um dataframe com os parâmetros de cada cenário e a energia anual [Wh] de cada etapa
+            (EArrNom, EArrMPP, EOutInv, E_Grid), além da irradiação efetiva GlobEff [Wh/m²].
+    """
+    
+    import copy
+    import itertools
+    
+    names = list(grid.keys())
+    combinations = list(itertools.product(*[list(grid[name]) for name in names]))
+    
+    solar_series = load_solar_series(location)
+    t_shift = series_times(solar_series, location.FUSO)
+    
+    # Duração de cada registro da série [h]
+    step = (np.median(np.diff(t_shift.asi8))/3.6e12) if len(t_shift) > 1 else 1.0
+    
+    # Etapas independentes dos cenários, calculadas uma única vez com formato (T, 1)
+    sun = solar_position(t_shift, location.LAT, location.LON)
+    meteo = {name: values[:, None] for name, values in meteo_stage(solar_series).items()}
+    atmosphere = {name: values[:, None] for name, values in atmosphere_stage(t_shift, sun).items()}
+    sun_2d = {name: values[:, None] for name, values in sun.items()}
+    
+    # As etapas pesadas são calculadas apenas nas horas com irradiação (ver daylight_index)
+    index = daylight_index(meteo['GlobHor'][:, 0], meteo['DiffHor'][:, 0])
+    meteo_day, sun_day, atmosphere_day = take_rows(meteo, index), take_rows(sun_2d, index), take_rows(atmosphere, index)
+    
+    energy_columns = ['EArrNom', 'EArrMPP', 'EOutInv', 'E_Grid', 'GlobEff']
+    results = []
+    
+    for start in range(0, len(combinations), block_size):
+        block = combinations[start:start + block_size]
+        scenario = scenario_location(location, {name: [combination[position] for combination in block]
+                                                for position, name in enumerate(names)})
+        
+        # Cenários com os mesmos parâmetros de SCENARIO_GROUP_PARAMETERS compartilham a geometria do tracker, 
+        # a transposição, a incidência e o ponto de operação de um módulo: essas etapas são calculadas com 
+        # formato (T, G), uma coluna por grupo distinto, e apenas as etapas seguintes com formato (T, S)
+        keys = np.column_stack([np.broadcast_to(np.asarray(getattr(scenario, name), dtype=float), (len(block),))
+                                for name in SCENARIO_GROUP_PARAMETERS])
+        _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        
+        group = copy.copy(scenario)
+        for position, name in enumerate(SCENARIO_GROUP_PARAMETERS):
+            setattr(group, name, keys[first, position])
+        
+        # Geometria do tracker: uma vez por par (MAX_ANGLE, GCR) distinto
+        pairs = list(zip(group.MAX_ANGLE.tolist(), group.GCR.tolist()))
+        geometries = {}
+        for pair in set(pairs):
+            geometries[pair] = tracker_geometry(t_shift, sun, pair[0], pair[1])
+        tracker = {name: np.column_stack([geometries[pair][name][index] for pair in pairs])
+                   for name in ['AngInc', 'PhiAng', 'surface_tilt', 'surface_azimuth']}
+        
+        transposition = transposition_stage(meteo_day, sun_day, atmosphere_day, tracker, group)
+        incidence = incidence_stage(meteo_day, sun_day, tracker, transposition, modulo, group, shading_tolerance)
+        module = module_stage(meteo_day, incidence, modulo, group, single_diode_method)
+        
+        # Colunas dos grupos -> colunas dos cenários. Com um único grupo os arrays (T, 1) são mantidos
+        incidence, module = [{name: value[:, inverse] if np.ndim(value) == 2 and np.shape(value)[1] > 1 else value
+                              for name, value in values.items()} for values in [incidence, module]]
+        
+        array = array_stage(meteo_day, incidence, modulo, scenario, single_diode_method, module=module)
+        inverter = inverter_stage(meteo_day, incidence, array, inversor, scenario, clipping_tolerance)
+        
+        # As perdas no transformador (perdas no ferro) existem também nas horas sem irradiação
+        inverter = scatter_rows({'EOutInv': np.broadcast_to(inverter['EOutInv'], (len(index), len(block)))}, 
+                                index, len(t_shift))
+        ac_losses = ac_losses_stage(inverter, modulo, inversor, scenario)
+        
+        stages = {'EArrNom': array['EArrNom'], 'EArrMPP': array['EArrMPP'], 'EOutInv': inverter['EOutInv'],
+                  'E_Grid': ac_losses['E_Grid'], 'GlobEff': incidence['GlobEff']}
+        
+        totals = {name: np.broadcast_to(stages[name], (len(stages[name]), len(block))).sum(axis=0)*step
+                  for name in energy_columns}
+        
+        for position, combination in enumerate(block):
+            row = dict(zip(names, combination))
+            row.update({name: totals[name][position] for name in energy_columns})
+            results.append(row)
+    
+    return pd.DataFrame(results, columns=names + energy_columns)
+
+
+# Parâmetros que devem ser iguais em todos os blocos de uma usina (série solar e posição do sol)
+BLOCK_SHARED_PARAMETERS = ['SOLAR_SERIES_FILE', 'FUSO', 'LAT', 'LON']
+
+# Parâmetros que podem variar entre os blocos, usados pelas etapas calculadas como arrays (tempo x bloco). 
+# O GCR é recalculado a partir de L e D (ver scenario_location)
+BLOCK_PARAMETERS = ['L', 'D', 'ALBEDO', 'SOILING_LOSS', 'MODULES_IN_SERIES', 'MODULES_IN_PARALLEL', 'U_c', 'U_v', 
+                    'LID_LOSS', 'QUALITY_LOSS', 'STC_OHM_LOSS', 'MISMATCH_LOSS', 'INVERTERS', 'PMAX_OUT', 
+                    'GHI_MIN_THRESHOLD', 'STC_OHM_LOSS_AC', 'COPPER_LOSS', 'IRON_LOSS', 'MV_LOSS_STC']
+
+# Colunas comuns a todos os blocos e colunas de energia [W], somadas sobre os blocos na saída da usina
+BLOCK_SHARED_COLUMNS = ['HSol', 'AzSol', 'GlobHor', 'DiffHor', 'T_Amb', 'WindVel']
+BLOCK_ENERGY_COLUMNS = ['EArrNom', 'OhmLoss', 'MisLoss', 'EArrMPP', 'EOutInv', 'EArray', 'EACOhmL', 'EMVTrfL', 
+                        'EMVOhmL', 'E_Grid']
+
+# Colunas (tempo x bloco) de BlockSimulation.block_results
+BLOCK_COLUMNS = ['GlobInc', 'ShdLoss', 'GlobIAM', 'SlgLoss', 'GlobEff', 'TArray', 'UArray', 'IArray'] + \
+    BLOCK_ENERGY_COLUMNS
+
+
+class BlockSimulation:
+
+    def __init__(self, blocks: list, clipping_tolerance: float = 0.1, single_diode_method: str = 'lambertw',
+                 inverter_efficiency_model: str = 'vnom'):
+
+        """
+                A função realiza a simulação horária de uma usina formada por blocos (sub-arranjos) 
+                heterogêneos: comprimentos de string, modelos de módulo e de inversor, pitch e ângulo 
+                máximo do tracker podem variar de um bloco para outro (ver Locations.get_blocks).
+                
+                A série solar, a posição do sol, os dados meteorológicos e a massa de ar são calculados 
+                uma única vez (e reaproveitados pelo STAGE_CACHE, ver run_stages), e a geometria do 
+                tracker uma vez para cada par (MAX_ANGLE, GCR) distinto. As demais etapas (transposição, 
+                incidência, arranjo, inversor e perdas AC) são calculadas como arrays (tempo x bloco), 
+                uma vez para cada par de arquivos .PAN/.OND.
+                
+                Os resultados de cada bloco ficam em self.block_results (coluna -> array tempo x bloco, 
+                ver BLOCK_COLUMNS), a saída da usina, com as colunas de energia somadas sobre os blocos e 
+                a coluna E_Grid_<bloco> de cada bloco, em self.simulation_output, e a energia [Wh] de 
+                cada etapa por bloco e da usina em self.block_summary.
+                
+                A função possui quatro argumentos.
+                
+                -------------------
+                blocks : list - Recebe a lista de objetos DataLocations, um por bloco. Os parâmetros de 
+                BLOCK_SHARED_PARAMETERS devem ser iguais em todos os blocos.
+                clipping_tolerance : float - Tolerância [V] na busca da tensão de operação nas horas com clipping.
+                single_diode_method : str - Recebe o método de solução do modelo de um diodo (ver single_diode).
+                inverter_efficiency_model : str - Recebe o modelo de eficiência do inversor (ver inverter_stage).
+        """
+        
+        if len(blocks) == 0:
+            raise ValueError('A usina não possui blocos')
+        
+        for parameter in BLOCK_SHARED_PARAMETERS:
+            if len({getattr(block, parameter) for block in blocks}) > 1:
+                raise ValueError("O parâmetro '%s' deve ser igual em todos os blocos da usina" % parameter)
         
+        location = blocks[0]
+        self.block_names = [str(block.BLOCK_NAME) if block.BLOCK_NAME is not None else str(position) 
+                            for position, block in enumerate(blocks)]
         
-        self.simulation_output['EOutInv'].fillna(0, inplace=True)
+        # Etapas comuns a todos os blocos e geometria do tracker de cada par (MAX_ANGLE, GCR) distinto
+        geometry_stages = [stage for stage in SIMULATION_STAGES 
+                           if stage.name in ['series', 'sun', 'tracker', 'meteo', 'daylight', 'atmosphere']]
+        pairs = [(float(block.MAX_ANGLE), float(block.GCR)) for block in blocks]
+        trackers = {}
         
-        # Aplicação do Clipping na Pmpp
-        self.simulation_output['EArray'] = [row['EArrMPP'] if row['PMaxIN']>row['EArrMPP'] else row['PMaxIN'] for index, row in self.simulation_output.iterrows()]
+        for pair, block in zip(pairs, blocks):
+            if pair not in trackers:
+                stages, report = run_stages(block, None, None, stages=geometry_stages)
+                trackers[pair] = stages['tracker']
+                if len(trackers) == 1:
+                    self.stage_report = report
         
-        self.simulation_output['UArray'] = scaled_value['v_mp']
+        index = stages['daylight']['index']
+        size = int(stages['daylight']['size'])
         
-        self.simulation_output['IArray'] = scaled_value['i_mp']
+        # Formato (T, 1) nas horas com irradiação, de modo que as etapas seguintes resultem em (T, bloco)
+        meteo_day = {name: values[index][:, None] for name, values in stages['meteo'].items()}
+        sun_day = {name: values[index][:, None] for name, values in stages['sun'].items()}
+        atmosphere_day = {name: values[index][:, None] for name, values in stages['atmosphere'].items()}
         
-        self.simulation_output['VocArray'] = scaled_value['v_oc']
+        self.block_results = {column: np.zeros((size, len(blocks))) for column in BLOCK_COLUMNS}
+        self.single_diode_deviation = 0.0
         
-        self.simulation_output['resistance_shunt'] = resistance_shunt
+        groups = OrderedDict()
+        for position, block in enumerate(blocks):
+            groups.setdefault((block.PAN_FILE, block.OND_FILE), []).append(position)
+        
+        for (pan_file, ond_file), members in groups.items():
+            modulo = PVModulo(path = pan_file)
+            inversor = Inverter(path = ond_file)
+            
+            group = scenario_location(location, {parameter: [getattr(blocks[member], parameter) for member in members]
+                                                 for parameter in BLOCK_PARAMETERS})
+            tracker = {name: np.column_stack([trackers[pairs[member]][name][index] for member in members])
+                       for name in ['AngInc', 'PhiAng', 'surface_tilt', 'surface_azimuth']}
+            
+            transposition = transposition_stage(meteo_day, sun_day, atmosphere_day, tracker, group)
+            incidence = incidence_stage(meteo_day, sun_day, tracker, transposition, modulo, group)
+            array = array_stage(meteo_day, incidence, modulo, group, single_diode_method)
+            inverter = inverter_stage(meteo_day, incidence, array, inversor, group, clipping_tolerance, 
+                                      inverter_efficiency_model)
+            
+            self.single_diode_deviation = max(self.single_diode_deviation, float(array['p_mp_deviation']))
+            
+            day = dict(transposition, **incidence)
+            day.update({name: array[name] for name in ['EArrNom', 'TArray', 'OhmLoss', 'MisLoss', 'EArrMPP']})
+            day.update(inverter)
+            day = {column: np.broadcast_to(day[column], (len(index), len(members))) 
+                   for column in BLOCK_COLUMNS if column in day}
+            
+            # Sem irradiação a temperatura das células é igual à temperatura ambiente, e as perdas no 
+            # transformador (perdas no ferro) existem também nas horas sem irradiação
+            results = scatter_rows(day, index, size, night={'TArray': stages['meteo']['T_Amb'][:, None]})
+            results.update(ac_losses_stage(results, modulo, inversor, group))
+            
+            for column in BLOCK_COLUMNS:
+                self.block_results[column][:, members] = np.broadcast_to(results[column], (size, len(members)))
         
-        self.simulation_output['saturation_current'] = saturation_current
+        output = {'date': series_times(stages['series'], location.FUSO, column='date')}
+        output.update({column: dict(stages['sun'], **stages['meteo'])[column] for column in BLOCK_SHARED_COLUMNS})
+        output.update({column: self.block_results[column].sum(axis=1) for column in BLOCK_ENERGY_COLUMNS})
+        output.update({'E_Grid_' + name: self.block_results['E_Grid'][:, position] 
+                       for position, name in enumerate(self.block_names)})
         
-        self.simulation_output['photocurrent'] = photocurrent
+        self.simulation_output = pd.DataFrame(output, index=series_times(stages['series'], location.FUSO))
         
-        self.simulation_output['resistance_series'] = resistance_series
+        # Duração de cada registro da série [h]
+        times = stages['series']['time']
+        step = (np.median(np.diff(times.astype(np.int64)))/3.6e12) if len(times) > 1 else 1.0
         
-        self.simulation_output['nNsVth'] = nNsVth
+        summary = pd.DataFrame({column: self.block_results[column].sum(axis=0)*step for column in BLOCK_ENERGY_COLUMNS},
+                               index=self.block_names)
+        summary.loc['plant'] = summary.sum()
+        self.block_summary = summary
 
-        v_clippado=[]
-        i_clippado=[]
-        
-        for index, row in self.simulation_output.iterrows():
-            if row['EArrMPP']>row['PMaxIN']:
-                v_calculated = 0
-                i_calculated = 0
-                diff_min = row['EArray']
-                v = row['UArray']
-                cont=0 
+
+                       
+# Desvios padrão típicos das incertezas da análise de Monte Carlo (ver MonteCarlo). 'IRRADIANCE' é o 
+# desvio relativo da irradiação anual (variabilidade interanual), os demais são absolutos
+MONTE_CARLO_UNCERTAINTY = {'SOILING_LOSS': 0.01, 'LID_LOSS': 0.005, 'QUALITY_LOSS': 0.005, 'MISMATCH_LOSS': 0.005, 
+                           'ALBEDO': 0.05, 'U_c': 2.0, 'U_v': 0.5, 'IRRADIANCE': 0.04}
+
+# Número de horas de cada bloco de amostras comparadas com a solução de referência do modelo de um diodo
+MONTE_CARLO_DEVIATION_SAMPLE = 256
+
+# Intervalo de valores válidos de cada parâmetro incerto. QUALITY_LOSS negativo é um ganho de qualidade do módulo
+MONTE_CARLO_BOUNDS = {'SOILING_LOSS': (0, 1), 'LID_LOSS': (0, 1), 'QUALITY_LOSS': (-1, 1), 'MISMATCH_LOSS': (0, 1), 
+                      'ALBEDO': (0, 1), 'U_c': (0, np.inf), 'U_v': (0, np.inf), 'IRRADIANCE': (0, np.inf)}
+
+
+class MonteCarlo:
+
+    def __init__(self, location: object, modulo: object, inversor: object, uncertainty: dict = None, 
+                 samples: int = 1000, seed: int = 0, block_size: int = 16, exceedance: list = (50, 90, 99), 
+                 clipping_tolerance: float = 0.1, single_diode_method: str = 'analytic'):
+
+        """
+                A função realiza a análise de incerteza da energia anual da usina por Monte Carlo, com as 
+                probabilidades de excedência (P50, P90, P99).
                 
-                #incrementa a tensão em passos de 10 V
-                for v in np.arange(row['UArray'], row['VocArray'], 10):   
-        
-                    #Calcula a corrente para a tensão especificada
-                    i = pvlib.pvsystem.i_from_v(row.resistance_shunt, 
-                                                  row.resistance_series, 
-                                                  row.nNsVth, 
-                                                  v/location.MODULES_IN_SERIES, 
-                                                  row.saturation_current,
-                                                  row.photocurrent, 
-                                                  method='lambertw')*location.MODULES_IN_PARALLEL
-                    
-                    
-                    #Aplica a perda ôhmica e de mismatch no valor de corrente
-                    i = i *(1 - location.MISMATCH_LOSS - row['FOhmLoss'])
-                    
-                    #Calcula a diferença absoluta entre a 
-                    diff = abs(i*v - row['EArray'])
-                    
-                    #Verifica se a diferença é inferior à diferença mínima 
-                    if diff < diff_min:
-                        diff_min = diff
-                        v_calculated = v 
-                        i_calculated = i
-                        
-                    else:
-                        cont+=1
-                        if cont>5:
-                            break  
-                        
-                v_clippado.append(v_calculated) 
-                i_clippado.append(i_calculated) 
+                Os parâmetros incertos são sorteados com distribuição normal centrada no valor do site e 
+                truncada no intervalo de MONTE_CARLO_BOUNDS (os valores fora do intervalo são sorteados 
+                novamente), e a 
+                variabilidade interanual da irradiação é um fator multiplicativo de GlobHor e DiffHor 
+                sorteado para cada amostra. As etapas que não dependem dos parâmetros sorteados (série 
+                solar, posição do sol, geometria do tracker, massa de ar) são calculadas uma única vez 
+                (e reaproveitadas pelo STAGE_CACHE, ver run_stages), e as demais etapas são calculadas 
+                como arrays (tempo x amostra), em blocos de block_size amostras.
+                
+                Todas as amostras são sorteadas de uma só vez pelo gerador com a semente seed, de modo 
+                que o resultado não depende de block_size e é reprodutível.
                 
-            else:
-                v_clippado.append(row['UArray']) 
-                i_clippado.append(row['IArray'])
+                Os parâmetros e a energia anual [Wh] de cada amostra ficam em self.samples, e a média, o 
+                desvio padrão e as probabilidades de excedência da energia anual em self.exceedance. 
+                
+                Comparar todas as horas de todas as amostras com a solução de referência do modelo de um 
+                diodo custaria mais que a própria análise, de modo que self.single_diode_deviation é uma 
+                estimativa, em MONTE_CARLO_DEVIATION_SAMPLE horas de cada bloco (ver single_diode_deviation).
+                
+                A função possui dez argumentos.
+                
+                -------------------
+                location : object - Recebe objeto onde estão armazenados os parâmetros base da simulação.
+                modulo : object - Recebe objeto com os dados do arquivo .PAN.
+                inversor : object - Recebe objeto com os dados do arquivo .OND.
+                uncertainty : dict - Recebe o dicionário parâmetro -> desvio padrão. Por padrão, 
+                MONTE_CARLO_UNCERTAINTY. São aceitos os parâmetros de MONTE_CARLO_BOUNDS.
+                samples : int - Recebe o número de amostras.
+                seed : int - Recebe a semente do gerador de números aleatórios.
+                block_size : int - Recebe o número de amostras calculadas simultaneamente.
+                exceedance : list - Recebe as probabilidades de excedência [%] (ex.: 90 para o P90).
+                clipping_tolerance : float - Tolerância [V] na busca da tensão de operação nas horas com clipping.
+                single_diode_method : str - Recebe o método de solução do modelo de um diodo (ver 
+                single_diode). Por padrão 'analytic', com desvio em p_mp inferior a 0,01%.
+        """
+        
+        uncertainty = MONTE_CARLO_UNCERTAINTY if uncertainty is None else uncertainty
+        accepted = list(MONTE_CARLO_BOUNDS)
+        
+        for parameter in uncertainty:
+            if parameter not in accepted:
+                raise ValueError("Parâmetro '%s' inválido, use um de %s" % (parameter, accepted))
+        
+        # Sorteio de todas as amostras, numa ordem fixa dos parâmetros
+        names = sorted(uncertainty)
+        rng = np.random.default_rng(seed)
+        draws = rng.standard_normal((samples, len(names)))
+        
+        drawn = OrderedDict()
+        for position, parameter in enumerate(names):
+            center = 1.0 if parameter == 'IRRADIANCE' else float(getattr(location, parameter))
+            lower, upper = MONTE_CARLO_BOUNDS[parameter]
+            if not lower <= center <= upper:
+                raise ValueError("Valor %s de '%s' fora do intervalo [%s, %s]" % (center, parameter, lower, upper))
+            
+            values = center + uncertainty[parameter]*draws[:, position]
+            outside = (values < lower) | (values > upper)
+            while outside.any():
+                values[outside] = center + uncertainty[parameter]*rng.standard_normal(int(outside.sum()))
+                outside = (values < lower) | (values > upper)
+            drawn[parameter] = values
+        
+        irradiance = drawn.get('IRRADIANCE', np.ones(samples))
+        parameters = {parameter: values for parameter, values in drawn.items() if parameter != 'IRRADIANCE'}
+        
+        # Etapas independentes das amostras
+        geometry_stages = [stage for stage in SIMULATION_STAGES 
+                           if stage.name in ['series', 'sun', 'tracker', 'meteo', 'daylight', 'atmosphere']]
+        stages, self.stage_report = run_stages(location, modulo, inversor, stages=geometry_stages)
+        
+        index = stages['daylight']['index']
+        size = int(stages['daylight']['size'])
+        
+        # Formato (T, 1) nas horas com irradiação, de modo que as etapas seguintes resultem em (T, amostra)
+        meteo_day = {name: values[index][:, None] for name, values in stages['meteo'].items()}
+        sun_day = {name: values[index][:, None] for name, values in stages['sun'].items()}
+        atmosphere_day = {name: values[index][:, None] for name, values in stages['atmosphere'].items()}
+        tracker_day = {name: values[index][:, None] for name, values in stages['tracker'].items()}
+        
+        # Número de anos da série solar
+        times = stages['series']['time']
+        step = (np.median(np.diff(times.astype(np.int64)))/3.6e12) if len(times) > 1 else 1.0
+        years = size*step/8760
+        
+        energy = np.empty(samples)
+        self.single_diode_deviation = 0.0
+        
+        for start in range(0, samples, block_size):
+            block = slice(start, min(start + block_size, samples))
+            scenario = scenario_location(location, {parameter: values[block] for parameter, values in parameters.items()})
+            
+            meteo = dict(meteo_day, GlobHor=meteo_day['GlobHor']*irradiance[block], 
+                         DiffHor=meteo_day['DiffHor']*irradiance[block])
+            
+            transposition = transposition_stage(meteo, sun_day, atmosphere_day, tracker_day, scenario)
+            incidence = incidence_stage(meteo, sun_day, tracker_day, transposition, modulo, scenario)
+            array = array_stage(meteo, incidence, modulo, scenario, single_diode_method, MONTE_CARLO_DEVIATION_SAMPLE)
+            inverter = inverter_stage(meteo, incidence, array, inversor, scenario, clipping_tolerance)
+            
+            self.single_diode_deviation = max(self.single_diode_deviation, float(array['p_mp_deviation']))
+            
+            # As perdas no transformador (perdas no ferro) existem também nas horas sem irradiação
+            columns = block.stop - block.start
+            inverter = scatter_rows({'EOutInv': np.broadcast_to(inverter['EOutInv'], (len(index), columns))}, 
+                                    index, size)
+            E_Grid = ac_losses_stage(inverter, modulo, inversor, scenario)['E_Grid']
+            
+            energy[block] = np.broadcast_to(E_Grid, (size, columns)).sum(axis=0)*step/years
         
+        self.samples = pd.DataFrame(drawn)
+        self.samples['E_Grid'] = energy
         
-        self.simulation_output['UArray'] = v_clippado
-        self.simulation_output['UArray'] = [0 if row['GlobEff']==0 else row['UArray']
-                                            *(1 - location.MISMATCH_LOSS - row['FOhmLoss']) 
-                                            for index, row in self.simulation_output.iterrows()]
+        statistics = {'mean': energy.mean(), 'std': energy.std(ddof=1) if samples > 1 else 0.0}
         
-        self.simulation_output['IArray'] = self.simulation_output['EArray']/self.simulation_output['UArray']
-        self.simulation_output['IArray'].fillna(0, inplace=True)
-        self.simulation_output['IArray'] = [0 if row['GlobEff']==0 else row['IArray'] for index, row in self.simulation_output.iterrows()]
+        # P90: energia excedida com 90% de probabilidade (percentil 10)
+        statistics.update({'P%g' % probability: np.percentile(energy, 100 - probability) 
+                           for probability in exceedance})
         
-        #Perdas ôhmicas AC
-        P_AC_STC = (modulo.parameters['nominal_power']*location.MODULES_IN_SERIES*location.MODULES_IN_PARALLEL)*\
-            (inversor.parameters['EfficMax']/100)
+        self.exceedance = pd.Series(statistics, name='E_Grid')
 
-        Phase = inversor.parameters['MonoTri']
 
-        VOutConv = inversor.parameters['VOutConv']*(Phase**0.5)
-        
-        Rac = (location.STC_OHM_LOSS_AC*VOutConv)/\
-            ((P_AC_STC)/(VOutConv))
+def read_pvsyst_hourly(path: str, fuso: int) -> dict:
+
+    """
+            Com esta função é possível ler o arquivo de valores horários exportado pelo PVsyst e 
+            convertê-lo em arrays já na convenção do pvlib: azimute solar convertido, sinal do ângulo 
+            do tracker (PhiAng) invertido e a parcela circunsolar (CircTrp) somada à difusa (DifSInc).
+            
+            -------------------
+            path : str - Recebe o endereço do arquivo .CSV do PVsyst.
+            fuso : int - Recebe o fuso horário do site.
+            
+            Retorna um dicionário com o array 'time' (centro do intervalo horário, em nanossegundos UTC) 
+            e um array float por coluna do arquivo.
+    """
+    
+    # As 10 primeiras linhas são o cabeçalho do PVsyst e a linha após os nomes das colunas traz as 
+    # unidades, de modo que as demais colunas são lidas diretamente como números
+    pvsyst_data = pd.read_csv(path, sep=';', skiprows=list(range(10)) + [11], encoding='ISO-8859-1')
+    
+    # O formato de data do PVsyst é informado explicitamente, com o dia antes do mês como alternativa
+    try:
+        date = pd.to_datetime(pvsyst_data['date'], format='%d/%m/%y %H:%M')
+    except (ValueError, TypeError):
+        date = pd.to_datetime(pvsyst_data['date'], dayfirst=True)
+    
+    # Datas no fuso horário do site, com os valores correspondendo aos centros dos intervalos horários
+    time = pd.DatetimeIndex(date).asi8 + int(fuso)*3600*10**9 + 30*60*10**9
+    
+    arrays = {'time': time}
+    for column in pvsyst_data.columns[1:]:
+        arrays[column] = pd.to_numeric(pvsyst_data[column]).values.astype(float)
+    
+    # Os azimutes do PVsyst seguem uma convenção diferente do pvlib
+    arrays['AzSol'] = np.where(arrays['AzSol'] > 0, 360.0 - arrays['AzSol'], -arrays['AzSol']) + 0.0
+    arrays['PhiAng'] = -arrays['PhiAng']
+    arrays['DifSInc'] = arrays['DifSInc'] + arrays['CircTrp']
+    
+    return arrays
 
-        IoutConv = self.simulation_output['EOutInv']/(VOutConv)
-        
-        self.simulation_output['EACOhmL'] = ((Phase**0.5) * ((IoutConv)**2)*Rac)/3
 
-        # Perdas no Medium Voltage Transformer
+# Cache dos arquivos horários do PVsyst já interpretados, indexado pelo hash do conteúdo e pelo fuso horário
+PVSYST_HOURLY_CACHE = MemmapCache(max_entries=16, directory=cache_directory('pvsyst'))
 
-        Res_EMVTrfL = (P_AC_STC*location.COPPER_LOSS/((P_AC_STC/VOutConv)**2))
 
-        self.simulation_output['EMVTrfL'] = (IoutConv**(2))*(Res_EMVTrfL) + P_AC_STC*location.IRON_LOSS
+def load_pvsyst_hourly(path: str, fuso: int) -> dict:
+
+    """
+            Com esta função é possível obter o arquivo horário do PVsyst já interpretado (ver 
+            read_pvsyst_hourly). O resultado é armazenado no PVSYST_HOURLY_CACHE, de modo que validar 
+            novamente o mesmo arquivo não repete a leitura do texto. Com a variável de ambiente 
+            CVER_CACHE_DIR definida, o cache é gravado em disco e lido com mapeamento em memória.
+            
+            -------------------
+            path : str - Recebe o endereço do arquivo .CSV do PVsyst.
+            fuso : int - Recebe o fuso horário do site.
+    """
+    
+    key = 'pvsyst-' + cache_key(file_hash(path), int(fuso))
+    
+    return PVSYST_HOURLY_CACHE.get_or_compute(key, lambda: read_pvsyst_hourly(path, fuso))
 
-        Res_EMVOhmL = (P_AC_STC*location.MV_LOSS_STC/((P_AC_STC/VOutConv)**2))
 
-        self.simulation_output['EMVOhmL'] = (IoutConv**(2))*(Res_EMVOhmL)
+@instrumented('metrics')
+def validation_metrics(simulated: object, reference: object, valid: object, groups: object = None, 
+                       n_groups: int = 1) -> dict:
+
+    """
+            Com esta função é possível calcular, de uma só vez para todos os parâmetros, as métricas de 
+            comparação entre o simulador e o PVsyst: o R² da regressão linear (com intercepto) dos 
+            valores do PVsyst em função dos valores do simulador, o RMSE percentual (em relação à média 
+            do simulador) e a diferença percentual das somas (em relação à soma do PVsyst).
+            
+            Em cada parâmetro são consideradas as horas de valid em que os dois valores são válidos 
+            (não NaN). As métricas podem ser calculadas por grupo de horas (ex.: mês ou hora do dia).
+            
+            -------------------
+            simulated : array - Recebe os valores do simulador (horas x parâmetros).
+            reference : array - Recebe os valores do PVsyst (horas x parâmetros).
+            valid : array - Recebe a máscara das horas consideradas (horas,).
+            groups : array - Recebe o grupo de cada hora (inteiros de 0 a n_groups - 1). Por padrão, 
+            todas as horas formam um único grupo.
+            n_groups : int - Recebe o número de grupos.
+            
+            Retorna um dicionário com os arrays (grupos x parâmetros) 'r2', 'RMSE' e 'diff_per_cent_signal'. 
+            Os grupos sem horas válidas recebem NaN.
+    """
+    
+    simulated = np.asarray(simulated, dtype=float)
+    reference = np.asarray(reference, dtype=float)
+    hours, parameters = simulated.shape
+    
+    valid = np.asarray(valid, dtype=bool)[:, None] & ~np.isnan(simulated) & ~np.isnan(reference)
+    groups = np.zeros(hours, dtype=int) if groups is None else np.asarray(groups, dtype=int)
+    
+    # Cada par (grupo, parâmetro) recebe um índice, de modo que as somas de todos os parâmetros e 
+    # grupos são obtidas com um único bincount
+    bins = (groups[:, None]*parameters + np.arange(parameters)).ravel()
+    
+    def group_sum(values):
+        return np.bincount(bins, weights=np.where(valid, values, 0).ravel(), 
+                           minlength=n_groups*parameters).reshape(n_groups, parameters)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        
+        count = group_sum(np.ones_like(simulated))
+        sum_x = group_sum(simulated)
+        sum_y = group_sum(reference)
+        mean_x = sum_x/count
+        mean_y = sum_y/count
+        
+        dx = simulated - mean_x[groups]
+        dy = reference - mean_y[groups]
+        sxx = group_sum(dx*dx)
+        syy = group_sum(dy*dy)
+        sxy = group_sum(dx*dy)
+        squared_error = group_sum((simulated - reference)**2)
+        
+        # R² = 1 - SSres/SStot da regressão linear. Sem variância no PVsyst a regressão é exata (R² = 1) 
+        # e sem variância no simulador a regressão é constante (SSres = SStot)
+        explained = np.where(sxx > 0, sxy**2/sxx, 0)
+        r2 = np.where(syy > 0, explained/syy, 1.0)
+        
+        rmse = np.sqrt(squared_error/count)/mean_x*100
+        diff_per_cent = (sum_x - sum_y)/sum_y*100
+    
+    empty = count == 0
+    
+    return {'r2': np.where(empty, np.nan, r2), 
+            'RMSE': np.where(empty, np.nan, rmse), 
+            'diff_per_cent_signal': np.where(empty, np.nan, diff_per_cent)}
+
 
-        
-        self.simulation_output['E_Grid'] =  self.simulation_output['EOutInv'] - self.simulation_output['EACOhmL'] \
-            - self.simulation_output['EMVTrfL'] - self.simulation_output['EMVOhmL']
-        
-        self.simulation_output.drop(columns=['PMaxIN', 'nNsVth', 'resistance_series', 'photocurrent', 'saturation_current', 
-                                                   'resistance_shunt', 'VocArray', 'eff_inverter', 'FOhmLoss'], inplace=True)
-        
-                       
 class MetricsComplete:
     
-    def __init__(self, location: object, output_simulation: object):
+    def __init__(self, location: object, output_simulation: object, breakdown: bool = False):
         
         """
-                A função realiza o cálculo das métricas de desempenho do simulador.  
+                A função realiza o cálculo das métricas de desempenho do simulador (ver validation_metrics).  
                
                 
-                A função possui dois argumentos.
+                A função possui três argumentos.
                 
                 -------------------
                 location : object - Recebe objeto onde estão armazenados os parâmetros base da simulação.
                 output_simulation: object - Recebe o dataframe de saída da simulação.
+                breakdown : bool - Calcula também as métricas por mês (self.metrics_monthly) e por hora 
+                do dia (self.metrics_hourly).
         """
         
-        from sklearn.linear_model import LinearRegression
-        from sklearn.metrics import mean_squared_error
-        
-        def r2_calculation(df_x: object, df_y: object, parameter: str, ghi_min_threshold: int = location.GHI_MIN_THRESHOLD):
-    
-            """
-            Com esta função é possível realizar o cálculo do valor do R² de um modelo linear obtido a partir da variável alvo y
-            e da variável preditora x.
-            A função possui três argumentos [df_x, df_y, parameter]
-            
-            -------------------
-            df_x : dataframe - Recebe o dataframe com os dados do PVLib
-            df_y : dataframe - Recebe o dataframe com os dados do PVSyst
-            x    : str       - Recebe o parâmetro que será avaliado
-            
-            """
-
-            df = pd.DataFrame({'pvlib': df_x[parameter],
-                               'pvsyst': df_y[parameter],
-                               'ghi': df_y['GlobEff']})
-            df = df[df['ghi']>ghi_min_threshold]
-            df.dropna(inplace=True)
-            modelo = LinearRegression()
-            modelo.fit(df[['pvlib']],df[['pvsyst']])
-            return round(modelo.score(df[['pvlib']],df[['pvsyst']]), 4)
-
-        def rsme_calculation(df_x: object, df_y: object, parameter: str, ghi_min_threshold: int = location.GHI_MIN_THRESHOLD):
-    
-            """
-            Com esta função é possível realizar o cálculo do valor do RMSE percentual de um modelo linear obtido a partir da variável alvo y
-            e da variável preditora x.
-            A função possui três argumentos [df_x, df_y, parameter]
+        def metrics_table(metrics: dict, parameters: list, index: list) -> object:
             
-            -------------------
-            df_x : dataframe - Recebe o dataframe com os dados do PVLib
-            df_y : dataframe - Recebe o dataframe com os dados do PVSyst
-            x    : str       - Recebe o parâmetro que será avaliado
+            table = {}
+            for position, parameter in enumerate(parameters):
+                table[parameter+'_r2'] = np.round(metrics['r2'][:, position], 4)
+                table[parameter+'_RMSE'] = np.round(metrics['RMSE'][:, position], 4)
+                table[parameter+'_diff_per_cent_signal'] = np.round(metrics['diff_per_cent_signal'][:, position], 4)
+                table[parameter+'_diff_per_cent'] = abs(table[parameter+'_diff_per_cent_signal'])
             
-            """
-            df = pd.DataFrame({'pvlib': df_x[parameter],
-                               'pvsyst': df_y[parameter],
-                               'ghi': df_y['GlobEff']})
-            df = df[df['ghi']>ghi_min_threshold]
-            df.dropna(inplace=True)
-            mse_value = mean_squared_error(df[['pvlib']],df[['pvsyst']])
-            rmse = np.sqrt(mse_value)
-            rmse_percentual = rmse/np.mean(df['pvlib'])*100
-            return round(rmse_percentual, 4)
-        
-        def diff_ratio(df_x: object, df_y: object, parameter: str, ghi_min_threshold: int = location.GHI_MIN_THRESHOLD):
-
-            """
-            Com esta função é possível realizar o cálculo da diferença percentual de um modelo linear obtido a partir da variável alvo y
-            e da variável preditora x.
-            A função possui três argumentos [df_x, df_y, parameter]
-        
-            -------------------
-            df_x : dataframe - Recebe o dataframe com os dados do PVLib
-            df_y : dataframe - Recebe o dataframe com os dados do PVSyst
-            x    : str       - Recebe o parâmetro que será avaliado
-        
-            """
-            df = pd.DataFrame({'pvlib': df_x[parameter],
-                               'pvsyst': df_y[parameter],
-                               'ghi': df_y['GlobEff']})
-            df = df[df['ghi']>ghi_min_threshold]
-            df.dropna(inplace=True)
-                    
-            diff_per_cent = ((df['pvlib'].sum()-df['pvsyst'].sum())/df['pvsyst'].sum())*100
-            return round(diff_per_cent, 4)        
-
-        # Os azimutes do PVsyst seguem uma convenção diferente do pvlib
-        def convert_pvsyst_azimuth_to_pvlib(x:float):
-        
-            if x == 0:
-        
-                return x
-        
-            elif x > 0:
-        
-                return 360.0 - x
-        
-            else:
-        
-                return -x        
+            return pd.DataFrame(table, index=index)
         
         if location.PVSYST_FILE is None:
             
             return ('Arquivo pvsyst inválido. Por favor, verifique o diretório indicado na base de dados.')
         
         else: 
-            pvsyst_data = pd.read_csv(location.PVSYST_FILE,
-                              sep=';', skiprows=10, encoding='ISO-8859-1')
-            
-            # Removendo linha com unidades
-            pvsyst_data = pvsyst_data.loc[1:, ]
+            pvsyst_data = load_pvsyst_hourly(location.PVSYST_FILE, location.FUSO)
+            pvsyst_index = series_times(pvsyst_data, location.FUSO)
             
-            # Conversão dos dados. dayfirst indica que no formato da data o dia vem primeiro
-            pvsyst_data['date'] = pd.to_datetime(pvsyst_data['date'], dayfirst=True)
-            # Aplica a informação de fuso horário a data
-            pvsyst_data.date = \
-              pvsyst_data.date.dt.tz_localize('UTC').dt.tz_convert('Etc/GMT+'+str(location.FUSO)) 
-            #Soma as três horas perdidas no processo de aplicação do d
-            pvsyst_data.date = pvsyst_data.date + datetime.timedelta(hours=int(location.FUSO)) 
+            # Parâmetros presentes nas duas saídas, na ordem da saída do simulador
+            parameters = [parameter for parameter in output_simulation.columns 
+                          if parameter not in ('date', 'time') and parameter in pvsyst_data]
             
-            # Lista as colunas do dataframe
-            columns = list(pvsyst_data.columns) 
-            #Remove a coluna de data
-            columns = columns[1:] 
+            # Horas presentes nas duas saídas, alinhadas pelo índice
+            hours = output_simulation.index.intersection(pvsyst_index)
+            rows = pvsyst_index.get_indexer(hours)
+            simulated = output_simulation.loc[hours, parameters].values
+            reference = np.column_stack([pvsyst_data[parameter][rows] for parameter in parameters])
             
+            # Máscara comum a todos os parâmetros: horas com irradiação efetiva no PVsyst
+            valid = pvsyst_data['GlobEff'][rows] > location.GHI_MIN_THRESHOLD
             
-            for column in columns:
-                #Converte todos os dados das demais colunas em dados numéricos
-                pvsyst_data[column] = pd.to_numeric(pvsyst_data[column]) 
+            self.metrics_output = pd.concat([pd.DataFrame({'Site': [location.SITE_NAME]}, index=[location.SITE_NAME]),
+                                             metrics_table(validation_metrics(simulated, reference, valid), 
+                                                           parameters, [location.SITE_NAME])], axis=1)
             
-            # Os valores de cada timestamp correspondem aos centros dos intervalos
-            # horários.
-            t = pvsyst_data['date']
-            
-            # Para evitar problemas mais à frente
-            pvsyst_data.index = list(t + datetime.timedelta(minutes=30))
-
-            self.metrics_output = pd.DataFrame(index = [location.SITE_NAME],columns = ['Site'])
-            self.metrics_output['Site'][location.SITE_NAME] = location.SITE_NAME
-                    
-            pvsyst_data['AzSol']  =  pvsyst_data['AzSol'].apply(convert_pvsyst_azimuth_to_pvlib)
-            pvsyst_data['PhiAng'] = -pvsyst_data['PhiAng']
-            pvsyst_data['DifSInc'] += pvsyst_data['CircTrp']
-            
-            output_simulation.drop(columns = 'date', inplace=True)
-
-            for parameter in output_simulation.columns:
-                
-                if parameter in pvsyst_data.columns:
-                    self.metrics_output[parameter+'_r2'] = r2_calculation(output_simulation, pvsyst_data, parameter)
-                    self.metrics_output[parameter+'_RMSE'] = rsme_calculation(output_simulation, pvsyst_data, parameter)  
-                    self.metrics_output[parameter+'_diff_per_cent_signal'] = diff_ratio(output_simulation, pvsyst_data, parameter)
-                    self.metrics_output[parameter+'_diff_per_cent'] = abs(self.metrics_output[parameter+'_diff_per_cent_signal'])
+            if breakdown:
+                self.metrics_monthly = metrics_table(validation_metrics(simulated, reference, valid, 
+                                                                        groups=hours.month - 1, n_groups=12),
+                                                     parameters, pd.Index(range(1, 13), name='month'))
+                self.metrics_hourly = metrics_table(validation_metrics(simulated, reference, valid, 
+                                                                       groups=hours.hour, n_groups=24),
+                                                    parameters, pd.Index(range(24), name='hour'))
             
                         
+@instrumented('csv_write')
 def create_csv (location:object, output:object, path: str):
     
     import csv
@@ -1054,36 +3388,564 @@ def create_csv (location:object, output:object, path: str):
     index = False, header=False, sep = ';', mode = 'a')
 
         
-def simulation(path: str, site_name: str or int, pvsyst_validation: bool):
+# Parâmetros do site gravados como atributos nos arquivos de saída binários
+SITE_METADATA = ['SITE_NAME', 'PVSYST_FILE', 'SOLAR_SERIES_FILE', 'PAN_FILE', 'OND_FILE', 'LAT', 'LON', 'ALTITUDE',
+                 'ALBEDO', 'MAX_ANGLE', 'D', 'L', 'GCR', 'INVERTERS', 'MODULES_IN_SERIES', 'MODULES_IN_PARALLEL', 
+                 'U_c', 'U_v', 'STC_OHM_LOSS', 'STC_OHM_LOSS_AC', 'QUALITY_LOSS', 'LID_LOSS', 'MISMATCH_LOSS', 
+                 'SOILING_LOSS', 'GHI_MIN_THRESHOLD', 'FUSO', 'IRON_LOSS', 'COPPER_LOSS', 'MV_LOSS_STC', 'PMAX_OUT']
+
+
+@instrumented('hdf5_write')
+def create_hdf5(location: object, output: object, file: str, group: str = None, float32: bool = False,
+                compression: str = 'gzip', append: bool = False) -> None:
 
     """
-                Com esta função é possível realizar a simulação do cenário para uma determinada localidade.   
+            Com esta função é possível gravar todas as colunas da saída da simulação num arquivo HDF5, 
+            num grupo por site (um mesmo arquivo pode conter vários sites). Os parâmetros do site 
+            (SITE_METADATA) e a versão do simulador são gravados como atributos do grupo.
+            
+            Cada coluna é um dataset. As datas ('date') e os instantes do índice ('time') são gravados 
+            em nanossegundos UTC (int64), com o fuso horário no atributo 'timezone'. Sem compressão 
+            (compression = None) e sem append, os datasets são contíguos e podem ser mapeados em memória 
+            (ver dataset.id.get_offset).
+            
+            A função possui sete argumentos.
+            
+            -------------------
+            location : object - Recebe objeto onde estão armazenados os parâmetros base da simulação.
+            output : object - Recebe o dataframe de saída da simulação (simulation_output).
+            file : str - Recebe o caminho do arquivo .h5. Um arquivo existente é mantido e o grupo do 
+            site é substituído.
+            group : str - Recebe o nome do grupo. Por padrão, o SITE_NAME.
+            float32 : bool - Grava as colunas em float32 (metade do tamanho) em vez de float64.
+            compression : str - Recebe o filtro de compressão do h5py ('gzip', 'lzf' ou None).
+            append : bool - Acrescenta as linhas ao grupo já existente (ver simulation_stream). Os 
+            datasets são criados redimensionáveis.
+    """
+    
+    import h5py
+    
+    group = str(location.SITE_NAME) if group is None else group
+    dtype = np.float32 if float32 else np.float64
+    
+    columns = {'time': output.index.asi8, 'date': pd.DatetimeIndex(output['date']).asi8}
+    columns.update({column: output[column].values.astype(dtype) for column in output.columns if column != 'date'})
+    
+    with h5py.File(file, mode='a') as h5:
+        
+        if group in h5 and not append:
+            del h5[group]
+        
+        if group not in h5:
+            site = h5.create_group(group)
+            site.attrs['version'] = version
+            for parameter in SITE_METADATA:
+                value = getattr(location, parameter, None)
+                site.attrs[parameter] = 'None' if value is None else value
+        
+        site = h5[group]
+        
+        for name, values in columns.items():
+            
+            if name in site:
+                dataset = site[name]
+                rows = dataset.shape[0]
+                dataset.resize((rows + len(values),))
+                dataset[rows:] = values
+                continue
+            
+            dataset = site.create_dataset(name, data=values, 
+                                          maxshape=(None,) if append else None,
+                                          chunks=True if (append or compression is not None) else None,
+                                          compression=compression, 
+                                          shuffle=compression is not None)
+            
+            if name in ['time', 'date']:
+                dataset.attrs['unit'] = 'ns'
+                dataset.attrs['timezone'] = 'Etc/GMT+' + str(location.FUSO)
+
+
+def read_hdf5(file: str, group: str, columns: list = None) -> object:
+
+    """
+            Com esta função é possível ler a saída da simulação de um site gravada por create_hdf5. 
+            Apenas as colunas pedidas são lidas do arquivo.
+            
+            -------------------
+            file : str - Recebe o caminho do arquivo .h5.
+            group : str - Recebe o nome do grupo (SITE_NAME).
+            columns : list - Recebe as colunas a serem lidas. Por padrão, todas.
+            
+            Retorna o dataframe de saída, com o índice e as datas no fuso horário do site, e o 
+            dicionário com os atributos do site.
+    """
+    
+    import h5py
+    
+    with h5py.File(file, mode='r') as h5:
+        site = h5[group]
+        timezone = site['time'].attrs['timezone']
+        columns = [name for name in site.keys() if name != 'time'] if columns is None else columns
+        
+        def times(name):
+            return pd.DatetimeIndex(site[name][()]).tz_localize('UTC').tz_convert(timezone)
+        
+        output = pd.DataFrame({name: times(name) if name == 'date' else site[name][()] for name in columns}, 
+                              index=times('time'))
+        metadata = dict(site.attrs)
+    
+    # Mantém a ordem das colunas da simulação
+    order = ['date'] + OUTPUT_COLUMNS
+    output = output[sorted(output.columns, key=lambda name: order.index(name) if name in order else len(order))]
+    
+    return output, metadata
+
+
+def merge_hdf5(files: list, file: str) -> None:
+
+    """
+            Com esta função é possível reunir os grupos de vários arquivos .h5 (ex.: um arquivo por 
+            site gravado por cada processo de um lote) num único arquivo. Os grupos já existentes no 
+            arquivo de destino são substituídos e os arquivos de origem são removidos.
+    """
+    
+    import h5py
+    
+    with h5py.File(file, mode='a') as destination:
+        for source_file in files:
+            with h5py.File(source_file, mode='r') as source:
+                for group in source.keys():
+                    if group in destination:
+                        del destination[group]
+                    source.copy(source[group], destination, name=group)
+            os.remove(source_file)
+
+
+def run_site(path: str, location: object, pvsyst_validation: bool, single_diode_method: str = 'lambertw',
+             output_format: str = 'csv', float32: bool = False, output_profile: str = 'full', 
+             inverter_efficiency_model: str = 'vnom', cache: object = None) -> object:
+
+    """
+                Com esta função é possível realizar a simulação de um site já carregado (DataLocations) e 
+                gravar o arquivo de saída da simulação. 
                 
-                A função possui somente três argumentos.
+                A função possui nove argumentos.
                 
                 -------------------
-                path : str - Recebe o endereço do data base file.
-                site_name : int or srt - Recebe um valor numérico, correspondente a linha do arquivo. 
-                Ou o nome do site_name. 
+                path : str - Recebe o endereço da pasta raíz onde está armazenado os arquivos do solar do projeto.
+                location : object - Recebe objeto onde estão armazenados os parâmetros base da simulação.
                 pvsyst_validation: bool - Recebe o valor booleano que ativa ou desativa a comparação 
                 dos dados do simulador com os dados obtidos pelo PVSyst. 
+                single_diode_method : str - Recebe o método de solução do modelo de um diodo (ver single_diode).
+                output_format : str - Recebe o formato do arquivo de saída: 'csv' (date, GlobHor e E_Grid, 
+                ver create_csv) ou 'hdf5' (todas as colunas, arquivo 'cver/simulation_CVER/<SITE_NAME>.h5', 
+                ver create_hdf5).
+                float32 : bool - Armazena a saída da simulação em float32 (e grava o arquivo .h5 em float32).
+                output_profile : str - Recebe o perfil de saída da simulação (ver OUTPUT_PROFILES). O perfil 
+                'minimal' é suficiente para os arquivos .csv e 'loss-chain' para a validação com o PVsyst.
+                inverter_efficiency_model : str - Recebe o modelo de eficiência do inversor (ver inverter_stage).
+                cache : object - Recebe o cache dos resultados das etapas (ver Simulation).
+                
+                Retorna o dataframe com as métricas de validação ou None, caso a validação não seja realizada.
     """
     
-    location = DataLocations(path = path, site_name = site_name)
     module = PVModulo(path = location.PAN_FILE)
     inverter = Inverter(path = location.OND_FILE)
-    datasimulation = Simulation(location = location, modulo = module, inversor = inverter)
-    create_csv(location = location, output = datasimulation.simulation_output, path = path)
+    datasimulation = Simulation(location = location, modulo = module, inversor = inverter, 
+                                single_diode_method = single_diode_method, output_profile = output_profile, 
+                                float32 = float32, inverter_efficiency_model = inverter_efficiency_model, 
+                                cache = cache)
+    
+    if output_format == 'hdf5':
+        create_hdf5(location = location, output = datasimulation.simulation_output, 
+                    file = path + 'cver/simulation_CVER/' + str(location.SITE_NAME) + '.h5', float32 = float32)
+    else:
+        create_csv(location = location, output = datasimulation.simulation_output, path = path)
 
     if (pvsyst_validation == True) & (location.PVSYST_FILE != None):
 
         metrics = MetricsComplete(location = location, output_simulation = datasimulation.simulation_output)
-        resultados_simulacao = metrics.metrics_output.append(pd.read_csv(path + 'cver/simulation_metrics.csv', sep = ';'))
-        resultados_simulacao.to_csv(path + 'cver/simulation_metrics.csv', sep = ';', index = False)
+        return metrics.metrics_output
+
+    return None
+
+
+def save_metrics(path: str, metrics_output: list) -> None:
+
+    """
+                Com esta função é possível acrescentar as métricas de validação ao arquivo 
+                'cver/simulation_metrics.csv'.
+                
+                -------------------
+                path : str - Recebe o endereço da pasta raíz onde está armazenado os arquivos do solar do projeto.
+                metrics_output : list - Recebe a lista de dataframes com as métricas de cada site.
+    """
+    
+    metrics_output = [metrics for metrics in metrics_output if metrics is not None]
+    
+    if len(metrics_output) == 0:
+        return None
+    
+    resultados_simulacao = pd.concat(metrics_output + [pd.read_csv(path + 'cver/simulation_metrics.csv', sep = ';')])
+    resultados_simulacao.to_csv(path + 'cver/simulation_metrics.csv', sep = ';', index = False)
+
+
+def simulation(path: str, site_name: str or int, pvsyst_validation: bool, locations: object = None):
+
+    """
+                Com esta função é possível realizar a simulação do cenário para uma determinada localidade.   
+                
+                A função possui quatro argumentos.
+                
+                -------------------
+                path : str - Recebe o endereço do data base file.
+                site_name : int or srt - Recebe um valor numérico, correspondente a linha do arquivo. 
+                Ou o nome do site_name. 
+                pvsyst_validation: bool - Recebe o valor booleano que ativa ou desativa a comparação 
+                dos dados do simulador com os dados obtidos pelo PVSyst. 
+                locations: object - Recebe o registro de sites (Locations) já carregado. Caso não seja 
+                informado, o data base file é lido novamente.
+    """
+    
+    if locations is None:
+        location = DataLocations(path = path, site_name = site_name)
+    else:
+        location = locations.get_location(site_name)
+    
+    save_metrics(path, [run_site(path, location, pvsyst_validation)])
 
     return  print('Arquivo', site_name, 'criado em', datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S'))
 
 
+def site_cost(location: object) -> float:
+
+    """
+                Com esta função é possível estimar o custo relativo da simulação de um site, utilizado 
+                para ordenar as simulações em lote (os sites mais custosos são iniciados primeiro).
+                
+                O custo é proporcional ao tamanho da série solar e cresce com a razão Pnom (DC/AC), 
+                que aumenta o número de horas com clipping. A razão é obtida da potência nominal do 
+                arranjo (MODULES_IN_SERIES x MODULES_IN_PARALLEL x potência nominal do .PAN) e da potência 
+                máxima dos inversores (INVERTERS x PMaxOUT do .OND, ou PMAX_OUT do site).
+                
+                -------------------
+                location : object - Recebe objeto onde estão armazenados os parâmetros base da simulação.
+    """
+    
+    try:
+        series_size = os.path.getsize(location.SOLAR_SERIES_FILE)
+    except OSError:
+        series_size = 0
+    
+    # Os arquivos .PAN/.OND já interpretados ficam no PARSE_CACHE e são reaproveitados na simulação
+    try:
+        p_dc = (location.MODULES_IN_SERIES*location.MODULES_IN_PARALLEL*
+                PVModulo(path = location.PAN_FILE).parameters['nominal_power'])
+        p_max_out = location.PMAX_OUT if location.PMAX_OUT else Inverter(path = location.OND_FILE).parameters['PMaxOUT']
+        pnom_ratio = float(p_dc/(p_max_out*1000*location.INVERTERS))
+    except Exception:
+        pnom_ratio = 1
+    
+    if pnom_ratio != pnom_ratio:
+        pnom_ratio = 1
+    
+    return series_size*(1 + max(pnom_ratio - 1, 0))
+
+
+def _batch_worker(path: str, location: object, pvsyst_validation: bool, single_diode_method: str = 'lambertw',
+                  output_format: str = 'csv', float32: bool = False, output_profile: str = 'full', 
+                  inverter_efficiency_model: str = 'vnom', instrument: bool = False, 
+                  profile_section: str = None) -> tuple:
+    
+    """
+                Executa a simulação de um site dentro de um processo do pool, capturando os erros para 
+                que a falha de um site não interrompa o lote. Com instrument = True, retorna também o 
+                relatório de instrumentação do site (ver instrumentation). Os sites do lote são distintos, 
+                de modo que os resultados das etapas não são mantidos em memória (ver transient_stage_cache).
+    """
+    
+    import traceback
+    
+    start = time.perf_counter()
+    
+    if instrument:
+        profile_file = (None if profile_section is None else 
+                        path + 'cver/simulation_CVER/' + str(location.SITE_NAME) + '_' + profile_section + '.prof')
+        recorder = instrumentation(profile_section = profile_section, profile_file = profile_file)
+    else:
+        recorder = contextlib.nullcontext()
+    
+    try:
+        with recorder as records:
+            metrics_output = run_site(path, location, pvsyst_validation, single_diode_method, output_format, float32,
+                                      output_profile, inverter_efficiency_model, transient_stage_cache())
+        return ('ok', metrics_output, None, time.perf_counter() - start, 
+                records.report() if instrument else None)
+    except Exception:
+        return 'erro', None, traceback.format_exc(), time.perf_counter() - start, None
+
+
+def simulation_batch(path: str, site_names: list = None, pvsyst_validation: bool = False, 
+                     processes: int = None, locations: object = None, single_diode_method: str = 'lambertw',
+                     output_format: str = 'csv', float32: bool = False, output_file: str = None, 
+                     output_profile: str = 'full', inverter_efficiency_model: str = 'vnom', instrument: bool = False, 
+                     profile_section: str = None) -> object:
+
+    """
+                Com esta função é possível realizar a simulação de vários sites em paralelo, distribuindo 
+                os sites entre os processos de um pool. Os sites são ordenados pelo custo estimado 
+                (ver site_cost), de modo que os mais custosos sejam iniciados primeiro. A falha de um 
+                site não interrompe o lote.
+                
+                A função possui treze argumentos.
+                
+                -------------------
+                path : str - Recebe o endereço da pasta raíz onde está armazenado os arquivos do solar do projeto.
+                site_names : list - Recebe a lista de site_names (ou linhas) a serem simulados. Caso não seja 
+                informada, todos os sites do data base file são simulados.
+                pvsyst_validation: bool - Recebe o valor booleano que ativa ou desativa a comparação 
+                dos dados do simulador com os dados obtidos pelo PVSyst. 
+                processes : int - Recebe o número de processos do pool. Caso não seja informado, é utilizado 
+                o número de CPUs da máquina. Com processes = 1 os sites são simulados no próprio processo.
+                locations: object - Recebe o registro de sites (Locations) já carregado.
+                single_diode_method : str - Recebe o método de solução do modelo de um diodo (ver single_diode). 
+                Para triagem de cenários, 'analytic' é várias vezes mais rápido, com erro em p_mp inferior a 0,01%.
+                output_format : str - Recebe o formato da saída: 'csv' (um arquivo por site, ver create_csv) ou 
+                'hdf5' (um único arquivo para o lote, com um grupo por site, ver create_hdf5).
+                float32 : bool - Armazena a saída de cada site em float32 (e grava o arquivo .h5 em float32).
+                output_file : str - Recebe o caminho do arquivo .h5 do lote. Por padrão, 
+                'cver/simulation_CVER/simulation.h5'.
+                output_profile : str - Recebe o perfil de saída de cada site (ver OUTPUT_PROFILES e run_site).
+                inverter_efficiency_model : str - Recebe o modelo de eficiência do inversor (ver inverter_stage).
+                instrument : bool - Registra o tempo e a memória de cada etapa de cada site (ver 
+                instrumentation), gravados em 'cver/simulation_CVER/instrumentation.json' por site e 
+                totalizados para o lote.
+                profile_section : str - Recebe o nome da etapa (ou seção) executada sob o cProfile, gravado 
+                em 'cver/simulation_CVER/<SITE_NAME>_<profile_section>.prof'. Requer instrument = True.
+                
+                Retorna um dataframe com o status ('ok' ou 'erro'), o tempo de execução [s] e o erro de cada site.
+    """
+    
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    
+    if locations is None:
+        locations = Locations(path = path)
+    
+    if site_names is None:
+        site_names = list(locations.SITE_NAME)
+    
+    status = {}
+    jobs = []
+    
+    for site_name in site_names:
+        try:
+            location = locations.get_location(site_name)
+            jobs.append((site_cost(location), site_name, location))
+        except Exception as error:
+            status[site_name] = ('erro', None, repr(error), 0.0, None)
+    
+    jobs.sort(key=lambda job: job[0], reverse=True)
+    
+    if processes == 1:
+        for _, site_name, location in jobs:
+            status[site_name] = _batch_worker(path, location, pvsyst_validation, single_diode_method, 
+                                              output_format, float32, output_profile, inverter_efficiency_model, 
+                                              instrument, profile_section)
+            print('Arquivo', site_name, status[site_name][0], 'em', datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S'))
+    else:
+        with ProcessPoolExecutor(max_workers = processes) as executor:
+            futures = {executor.submit(_batch_worker, path, location, pvsyst_validation, single_diode_method,
+                                       output_format, float32, output_profile, inverter_efficiency_model, 
+                                       instrument, profile_section): site_name
+                       for _, site_name, location in jobs}
+            
+            for future in as_completed(futures):
+                site_name = futures[future]
+                try:
+                    status[site_name] = future.result()
+                except Exception as error:
+                    # Falha do próprio processo (ex.: processo encerrado pelo sistema)
+                    status[site_name] = ('erro', None, repr(error), 0.0, None)
+                print('Arquivo', site_name, status[site_name][0], 'em', datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S'))
+    
+    save_metrics(path, [status[site_name][1] for site_name in site_names if site_name in status])
+    
+    if output_format == 'hdf5':
+        # Cada processo grava o arquivo do seu site, reunidos ao final num único arquivo do lote
+        files = [path + 'cver/simulation_CVER/' + str(location.SITE_NAME) + '.h5' for _, site_name, location in jobs 
+                 if status[site_name][0] == 'ok']
+        merge_hdf5(files, path + 'cver/simulation_CVER/simulation.h5' if output_file is None else output_file)
+    
+    if instrument:
+        import json
+        
+        reports = {str(site_name): status[site_name][4] for site_name in site_names if site_name in status}
+        with open(path + 'cver/simulation_CVER/instrumentation.json', mode = 'w') as file:
+            json.dump({'sites': reports, 'batch': instrumentation_summary(reports)}, file, indent = 2)
+    
+    return pd.DataFrame({'site_name': list(site_names),
+                         'status': [status[site_name][0] for site_name in site_names],
+                         'elapsed': [status[site_name][3] for site_name in site_names],
+                         'error': [status[site_name][2] for site_name in site_names]})
+
+
+# Colunas da cadeia de perdas retornadas pelo SimulationServer: irradiações [kWh/m²] e energias [MWh]
+LOSS_CHAIN_IRRADIANCE = ['GlobHor', 'GlobInc', 'GlobShd', 'GlobIAM', 'GlobSlg', 'GlobEff']
+LOSS_CHAIN_ENERGY = ['EArrNom', 'OhmLoss', 'MisLoss', 'EArrMPP', 'EOutInv', 'EArray', 'EACOhmL', 'EMVTrfL',
+                     'EMVOhmL', 'E_Grid']
+
+
+class SimulationServer:
+    
+    def __init__(self, path: str, database_file: str = None, single_diode_method: str = 'lambertw') -> None:
+        
+        """
+                Com esta classe é possível manter os sites, módulos, inversores e as etapas da simulação 
+                carregados em memória entre consultas, de modo que simular novamente um site com alguns 
+                parâmetros alterados recalcula apenas as etapas afetadas (ver run_stages). As consultas 
+                são recebidas como JSON pela entrada padrão (serve_stdin) ou por HTTP local (serve_http).
+                
+                A função possui três argumentos.
+                
+                -------------------
+                path : str - Recebe o endereço da pasta raíz onde está armazenado os arquivos do solar do projeto.
+                database_file : str - Recebe o endereço do data base file (ver Locations).
+                single_diode_method : str - Recebe o método padrão de solução do modelo de um diodo.
+        """
+        
+        self.locations = Locations(path = path, database_file = database_file)
+        self.single_diode_method = single_diode_method
+        self._modules = {}
+        self._inverters = {}
+    
+    def _equipment(self, location: object) -> tuple:
+        
+        if location.PAN_FILE not in self._modules:
+            self._modules[location.PAN_FILE] = PVModulo(path = location.PAN_FILE)
+        
+        if location.OND_FILE not in self._inverters:
+            self._inverters[location.OND_FILE] = Inverter(path = location.OND_FILE)
+        
+        return self._modules[location.PAN_FILE], self._inverters[location.OND_FILE]
+    
+    def query(self, request: dict) -> dict:
+        
+        """
+                Com esta função é possível simular um site com parâmetros alterados. 
+                
+                -------------------
+                request : dict - Recebe a consulta: 'site' (site_name ou linha do data base file), 
+                'overrides' (dicionário parâmetro -> valor, opcional), 'single_diode_method' (opcional) e 
+                'inverter_efficiency_model' (opcional, ver inverter_stage).
+                
+                Retorna um dicionário com a energia anual injetada na rede [MWh/ano] ('E_Grid', média 
+                sobre os anos da série simulada), a energia injetada em toda a série [MWh] ('E_Grid_total'), 
+                o número de anos da série, a cadeia de perdas, o relatório das etapas (ver run_stages) e o 
+                tempo de execução [s].
+        """
+        
+        import copy
+        
+        start = time.perf_counter()
+        location = copy.copy(self.locations.get_location(request['site']))
+        
+        for parameter, value in request.get('overrides', {}).items():
+            if not hasattr(location, parameter):
+                raise ValueError("Parâmetro '%s' inexistente no site %s" % (parameter, location.SITE_NAME))
+            setattr(location, parameter, value)
+        
+        location.GCR = location.L / location.D
+        
+        modulo, inversor = self._equipment(location)
+        datasimulation = Simulation(location = location, modulo = modulo, inversor = inversor, 
+                                    single_diode_method = request.get('single_diode_method', 
+                                                                      self.single_diode_method),
+                                    inverter_efficiency_model = request.get('inverter_efficiency_model', 'vnom'))
+        output = datasimulation.simulation_output
+        
+        loss_chain = {column: float(output[column].sum())/1e3 for column in LOSS_CHAIN_IRRADIANCE}
+        loss_chain.update({column: float(output[column].sum())/1e6 for column in LOSS_CHAIN_ENERGY})
+        
+        # Número de anos da série solar, para a energia anual
+        times = pd.DatetimeIndex(output['date']).asi8
+        step = (np.median(np.diff(times))/3.6e12) if len(times) > 1 else 1.0
+        years = len(output)*step/8760
+        
+        return {'site': location.SITE_NAME,
+                'hours': len(output),
+                'years': years,
+                'E_Grid': loss_chain['E_Grid']*step/years,
+                'E_Grid_total': loss_chain['E_Grid']*step,
+                'loss_chain': loss_chain,
+                'stage_report': datasimulation.stage_report,
+                'elapsed': time.perf_counter() - start}
+    
+    def handle(self, message: str) -> str:
+        
+        """
+                Com esta função é possível responder a uma consulta em JSON (ver query). Os erros são 
+                retornados no campo 'error', sem interromper o servidor.
+        """
+        
+        import json
+        
+        try:
+            response = self.query(json.loads(message))
+        except Exception as error:
+            response = {'error': repr(error)}
+        
+        return json.dumps(response)
+
+
+def serve_stdin(server: object, stdin: object = None, stdout: object = None) -> None:
+
+    """
+            Com esta função é possível atender consultas ao SimulationServer pela entrada padrão: uma 
+            consulta JSON por linha, respondida com uma linha JSON na saída padrão.
+    """
+    
+    import sys
+    
+    stdin = sys.stdin if stdin is None else stdin
+    stdout = sys.stdout if stdout is None else stdout
+    
+    for line in stdin:
+        if line.strip():
+            stdout.write(server.handle(line) + '\n')
+            stdout.flush()
+
+
+def serve_http(server: object, port: int = 8765) -> None:
+
+    """
+            Com esta função é possível atender consultas ao SimulationServer por HTTP, apenas na máquina 
+            local (127.0.0.1): cada POST recebe uma consulta JSON no corpo e responde com JSON.
+    """
+    
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    
+    class Handler(BaseHTTPRequestHandler):
+        
+        def do_POST(self):
+            
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            response = server.handle(body.decode('utf-8')).encode('utf-8')
+            
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(response)))
+            self.end_headers()
+            self.wfile.write(response)
+        
+        def log_message(self, format, *args):
+            
+            logging.debug(format, *args)
+    
+    with HTTPServer(('127.0.0.1', port), Handler) as http_server:
+        http_server.serve_forever()
+
+
+
 
 
         